@@ -3,6 +3,11 @@
 
 from ._version import VERSION as __version__
 from .client import KustoClient
+from ._connection_pool import ConnectionPoolMetrics
 from .client_request_properties import ClientRequestProperties
 from .kcsb import KustoConnectionStringBuilder
 from .data_format import DataFormat
+from .request_hooks import RequestEvent, RequestHook
+from ._telemetry import set_tracing_sample_rate
+from .query_profile import QueryProfile
+from .slow_query_log import SlowQueryLog, SlowQueryRecord
@@ -5,7 +5,6 @@ from urllib.parse import urljoin
 
 import requests
 
-from azure.core.tracing.decorator import distributed_trace
 from azure.core.tracing import SpanKind
 
 from .env_utils import get_env
@@ -55,7 +54,7 @@ class CloudSettings:
     )
 
     @classmethod
-    @distributed_trace(name_of_span="CloudSettings.get_cloud_info", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(name_of_span="CloudSettings.get_cloud_info", kind=SpanKind.CLIENT)
     def get_cloud_info_for_cluster(cls, kusto_uri: str, proxies: Optional[Dict[str, str]] = None) -> CloudInfo:
         kusto_uri = cls._normalize_uri(kusto_uri)
 
@@ -75,7 +74,7 @@ class CloudSettings:
                 result = MonitoredActivity.invoke(
                     lambda: requests.get(url, proxies=proxies, allow_redirects=False),
                     name_of_span="CloudSettings.http_get",
-                    tracing_attributes=Span.create_http_attributes(url=url, method="GET"),
+                    tracing_attributes=lambda: Span.create_http_attributes(url=url, method="GET"),
                 )
             except Exception as e:
                 raise KustoNetworkError(url) from e
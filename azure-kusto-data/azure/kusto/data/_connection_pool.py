@@ -0,0 +1,178 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import time
+import weakref
+from threading import Lock
+from typing import Optional
+
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+
+from .request_hooks import _set_connection_time
+
+# The maximal number of connections a client keeps open to its cluster, unless configured otherwise
+DEFAULT_MAX_CONNECTIONS = 100
+
+
+class ConnectionPoolMetrics:
+    """A snapshot of the connection pool of a client, as returned by KustoClient.get_pool_metrics()."""
+
+    max_size: int
+    "The maximal number of connections kept in the pool."
+
+    in_use: int
+    "The number of connections currently serving requests (including responses that are still being read)."
+
+    idle: int
+    "The number of open connections waiting in the pool for a request."
+
+    connections_acquired: int
+    "The number of times a request took a connection from the pool."
+
+    connections_created: int
+    "The number of connections that were created, as the pool had no idle connection to reuse."
+
+    waiting: int
+    "The number of requests currently waiting for a free connection, as max_size connections are in use."
+
+    requests_queued: int
+    "The number of requests that had to wait for a free connection."
+
+    total_wait_seconds: float
+    "The total time requests waited to get a connection from the pool."
+
+    max_wait_seconds: float
+    "The longest time a request waited to get a connection from the pool."
+
+    def __init__(self, max_size: int = 0):
+        self.max_size = max_size
+        self.in_use = 0
+        self.idle = 0
+        self.connections_acquired = 0
+        self.connections_created = 0
+        self.waiting = 0
+        self.requests_queued = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def average_wait_seconds(self) -> float:
+        return self.total_wait_seconds / self.connections_acquired if self.connections_acquired else 0.0
+
+    def __repr__(self):
+        return (
+            "ConnectionPoolMetrics(max_size={}, in_use={}, idle={}, waiting={}, connections_acquired={}, connections_created={}, "
+            "requests_queued={}, average_wait_seconds={:.4f})".format(
+                self.max_size,
+                self.in_use,
+                self.idle,
+                self.waiting,
+                self.connections_acquired,
+                self.connections_created,
+                self.requests_queued,
+                self.average_wait_seconds,
+            )
+        )
+
+
+class _ConnectionPoolMetricsRecorder:
+    """Collects the metrics of the connection pools of a session. Thread safe."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics = ConnectionPoolMetrics()
+        self._pools = weakref.WeakSet()
+
+    def add_pool(self, pool: HTTPConnectionPool):
+        with self._lock:
+            self._pools.add(pool)
+
+    def record_acquired(self, wait_seconds: float):
+        with self._lock:
+            metrics = self._metrics
+            metrics.in_use += 1
+            metrics.connections_acquired += 1
+            metrics.total_wait_seconds += wait_seconds
+            metrics.max_wait_seconds = max(metrics.max_wait_seconds, wait_seconds)
+
+    def record_released(self):
+        with self._lock:
+            self._metrics.in_use -= 1
+
+    def record_created(self):
+        with self._lock:
+            self._metrics.connections_created += 1
+
+    def record_queued(self):
+        with self._lock:
+            self._metrics.waiting += 1
+            self._metrics.requests_queued += 1
+
+    def record_dequeued(self):
+        with self._lock:
+            self._metrics.waiting -= 1
+
+    def snapshot(self, max_size: int, in_use: Optional[int] = None, idle: Optional[int] = None, waiting: Optional[int] = None) -> ConnectionPoolMetrics:
+        """
+        :param max_size: the pool's maximal size.
+        :param in_use: overrides the number of connections in use, for pools that count them on their own.
+        :param idle: overrides the number of idle connections, for pools that count them on their own.
+        :param waiting: overrides the number of waiting requests, for pools that count them on their own.
+        """
+        with self._lock:
+            snapshot = ConnectionPoolMetrics(max_size)
+            snapshot.__dict__.update(self._metrics.__dict__)
+            snapshot.max_size = max_size
+            pools = list(self._pools)
+        snapshot.in_use = snapshot.in_use if in_use is None else in_use
+        snapshot.waiting = snapshot.waiting if waiting is None else waiting
+        snapshot.idle = sum(_count_idle_connections(pool) for pool in pools) if idle is None else idle
+        return snapshot
+
+
+def _count_idle_connections(pool: HTTPConnectionPool) -> int:
+    # The pool's queue holds its idle connections, and placeholders (None) for connections it may still create
+    queue = pool.pool
+    if queue is None:
+        return 0
+    with queue.mutex:
+        return sum(1 for connection in queue.queue if connection is not None and getattr(connection, "sock", None) is not None)
+
+
+class _InstrumentedPoolMixin:
+    """Records the metrics of a urllib3 connection pool. Every connection taken from the pool with _get_conn is returned with _put_conn."""
+
+    def __init__(self, *args, pool_metrics: _ConnectionPoolMetricsRecorder, **kwargs):
+        self._pool_metrics = pool_metrics
+        super().__init__(*args, **kwargs)
+        pool_metrics.add_pool(self)
+
+    def _new_conn(self):
+        self._pool_metrics.record_created()
+        return super()._new_conn()
+
+    def _get_conn(self, timeout=None):
+        # Only blocking pools make requests wait - others open connections over their size, which are closed once they are done
+        queued = self.block and self.pool is not None and self.pool.empty()
+        if queued:
+            self._pool_metrics.record_queued()
+        start_time = time.perf_counter()
+        try:
+            connection = super()._get_conn(timeout)
+        finally:
+            if queued:
+                self._pool_metrics.record_dequeued()
+        self._pool_metrics.record_acquired(time.perf_counter() - start_time)
+        _set_connection_time()
+        return connection
+
+    def _put_conn(self, conn):
+        self._pool_metrics.record_released()
+        super()._put_conn(conn)
+
+
+class _InstrumentedHTTPConnectionPool(_InstrumentedPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _InstrumentedHTTPSConnectionPool(_InstrumentedPoolMixin, HTTPSConnectionPool):
+    pass
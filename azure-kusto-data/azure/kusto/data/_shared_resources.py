@@ -0,0 +1,90 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from urllib.parse import urlparse
+
+from .kcsb import KustoConnectionStringBuilder
+
+_INGEST_PREFIX = "ingest-"
+
+
+class _SharedResource:
+    def __init__(self, value: Any):
+        self.value = value
+        self.reference_count = 0
+
+
+class _SharedResourceRegistry:
+    """
+    A process-wide registry of resources shared by clients of the same cluster - HTTP sessions (and their connection pools) and token providers.
+    Resources are reference counted: the first client to acquire a resource creates it, and the last one to release it closes it.
+    A cluster's engine and data management endpoints ("ingest-" prefixed) are treated as one cluster, as they share a cloud and an identity.
+    """
+
+    _lock = Lock()
+    _resources: Dict[Hashable, _SharedResource] = {}
+
+    @classmethod
+    def acquire(cls, key: Hashable, factory: Callable[[], Any]) -> Any:
+        """Returns the resource of the key, and creates it with factory if there is none."""
+        with cls._lock:
+            resource = cls._resources.get(key)
+            if resource is None:
+                resource = cls._resources[key] = _SharedResource(factory())
+            resource.reference_count += 1
+            return resource.value
+
+    @classmethod
+    def release(cls, key: Hashable) -> Optional[Any]:
+        """
+        Releases a reference to the resource of the key.
+        :return: the resource if this was its last reference, for the caller to close it, otherwise None.
+        """
+        with cls._lock:
+            resource = cls._resources.get(key)
+            if resource is None:
+                return None
+            resource.reference_count -= 1
+            if resource.reference_count > 0:
+                return None
+            del cls._resources[key]
+            return resource.value
+
+    @classmethod
+    def reference_count(cls, key: Hashable) -> int:
+        resource = cls._resources.get(key)
+        return resource.reference_count if resource else 0
+
+    @staticmethod
+    def cluster_key(data_source: str) -> str:
+        """The cluster of a data source, the same for its engine and data management endpoints."""
+        url = urlparse(data_source)
+        host = (url.hostname or "").lower()
+        if host.startswith(_INGEST_PREFIX):
+            host = host[len(_INGEST_PREFIX) :]
+        return "{}://{}{}".format(url.scheme.lower(), host, ":{}".format(url.port) if url.port else "")
+
+    @staticmethod
+    def identity_key(kcsb: KustoConnectionStringBuilder) -> Tuple:
+        """The authentication identity of a connection string - every setting other than the cluster and the database, and the auth objects it was given."""
+        settings = tuple(
+            sorted(
+                (keyword.value, repr(value))
+                for keyword, value in kcsb._internal_dict.items()
+                if keyword not in (KustoConnectionStringBuilder.ValidKeywords.data_source, KustoConnectionStringBuilder.ValidKeywords.initial_catalog)
+            )
+        )
+        auth_objects = tuple(
+            id(auth_object)
+            for auth_object in (kcsb.token_provider, kcsb.async_token_provider, kcsb.credential, kcsb.credential_from_login_endpoint, kcsb.device_callback)
+        )
+        return settings, auth_objects, kcsb.is_token_credential_auth, kcsb.is_device_login_auth
+
+    @classmethod
+    def session_key(cls, kcsb: KustoConnectionStringBuilder) -> Tuple:
+        return "session", cls.cluster_key(kcsb.data_source)
+
+    @classmethod
+    def aad_helper_key(cls, kcsb: KustoConnectionStringBuilder, is_async: bool) -> Tuple:
+        return "aad_helper", cls.cluster_key(kcsb.data_source), cls.identity_key(kcsb), is_async
@@ -1,4 +1,8 @@
-from typing import Callable, Optional, TypeVar
+import contextvars
+import functools
+import random
+import time
+from typing import Callable, Optional, TypeVar, Union
 
 from azure.core.settings import settings
 from azure.core.tracing.decorator import distributed_trace
@@ -7,6 +11,55 @@ from azure.core.tracing import SpanKind
 
 from .client_request_properties import ClientRequestProperties
 
+# How long the detection of a tracing implementation is cached - tracing that is configured later is picked up within this time
+_TRACING_DETECTION_INTERVAL_SECONDS = 1.0
+
+# Whether the operation running in the current context is traced - decided once, by its outermost traced call, so its spans are sampled together
+_operation_sampled: contextvars.ContextVar[Optional[bool]] = contextvars.ContextVar("kusto_operation_sampled", default=None)
+
+
+class _TracingState:
+    """
+    Detects whether azure-core has a tracer to report spans to, so that without one no spans or attributes are created at all.
+    The detection is cached, as asking azure-core's settings costs more than the rest of the tracing layer.
+    """
+
+    sample_rate = 1.0
+    _enabled = False
+    _next_detection = 0.0
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        now = time.monotonic()
+        if now >= cls._next_detection:
+            cls._enabled = cls._detect()
+            cls._next_detection = now + _TRACING_DETECTION_INTERVAL_SECONDS
+        return cls._enabled
+
+    @staticmethod
+    def _detect() -> bool:
+        # Older versions of azure-core only trace with a tracing implementation (plugin)
+        tracing_enabled = getattr(settings, "tracing_enabled", None)
+        if tracing_enabled is not None and tracing_enabled():
+            return True
+        return settings.tracing_implementation() is not None
+
+    @classmethod
+    def reset(cls):
+        """Detects the tracing implementation again on the next call, rather than once the cached detection expires."""
+        cls._next_detection = 0.0
+
+
+def set_tracing_sample_rate(rate: float) -> None:
+    """
+    Traces only a fraction of the operations of the Kusto clients (queries, commands and ingestions), to limit the overhead of tracing under a high load.
+    Each operation is sampled as a whole - either all of its spans (including its HTTP requests and token fetches) are reported, or none of them.
+    :param rate: the fraction of operations to trace, between 0 (none) and 1 (all, the default).
+    """
+    if not 0.0 <= rate <= 1.0:
+        raise ValueError("The tracing sample rate must be between 0 and 1, got {}".format(rate))
+    _TracingState.sample_rate = rate
+
 
 class Span:
     """
@@ -32,6 +85,8 @@ class Span:
         Add ADX attributes to the current span
         :key dict tracing_attributes: key, val ADX attributes to include in span of trace
         """
+        if not MonitoredActivity.is_tracing():
+            return
         tracing_attributes: dict = kwargs.pop("tracing_attributes", {})
         span_impl_type = settings.tracing_implementation()
         if span_impl_type is None:
@@ -43,16 +98,22 @@ class Span:
 
     @classmethod
     def set_query_attributes(cls, cluster: str, database: str, properties: Optional[ClientRequestProperties] = None) -> None:
+        if not MonitoredActivity.is_tracing():
+            return
         query_attributes: dict = cls.create_query_attributes(cluster, database, properties)
         cls.add_attributes(tracing_attributes=query_attributes)
 
     @classmethod
     def set_streaming_ingest_attributes(cls, cluster: str, database: str, table: str, properties: Optional[ClientRequestProperties] = None) -> None:
+        if not MonitoredActivity.is_tracing():
+            return
         ingest_attributes: dict = cls.create_streaming_ingest_attributes(cluster, database, table, properties)
         cls.add_attributes(tracing_attributes=ingest_attributes)
 
     @classmethod
     def set_cloud_info_attributes(cls, url: str) -> None:
+        if not MonitoredActivity.is_tracing():
+            return
         cloud_info_attributes: dict = cls.create_cloud_info_attributes(url)
         cls.add_attributes(tracing_attributes=cloud_info_attributes)
 
@@ -99,29 +160,116 @@ class Span:
 
 class MonitoredActivity:
     """
-    Invoker class for telemetry
+    Invoker class for telemetry.
+    Without a tracer configured in azure-core, or for operations that were not sampled, the invokers are called directly - no spans are created.
     """
 
     T = TypeVar("T")
 
     @staticmethod
-    def invoke(invoker: Callable[[], T], name_of_span: str = None, tracing_attributes=None, kind: str = SpanKind.INTERNAL) -> T:
+    def is_tracing() -> bool:
+        """Whether the current operation is traced - a tracer is configured, and the operation was sampled (or is yet to be)."""
+        return _TracingState.is_enabled() and _operation_sampled.get() is not False
+
+    @staticmethod
+    def _sample() -> Optional[contextvars.Token]:
+        """Decides whether an operation that starts in the current context is traced. Returns the token to reset the decision with, if one was made."""
+        if _operation_sampled.get() is not None:
+            return None
+        rate = _TracingState.sample_rate
+        return _operation_sampled.set(rate >= 1.0 or random.random() < rate)
+
+    @staticmethod
+    def invoke(
+        invoker: Callable[[], T], name_of_span: str = None, tracing_attributes: Union[dict, Callable[[], dict], None] = None, kind: str = SpanKind.INTERNAL
+    ) -> T:
         """
         Runs the span on given function
+        :param tracing_attributes: the attributes of the span, or a function that creates them - called only if the span is traced.
         """
-        if tracing_attributes is None:
-            tracing_attributes = {}
-        span_shell: Callable = distributed_trace(name_of_span=name_of_span, tracing_attributes=tracing_attributes, kind=kind)
-        span = span_shell(invoker)
-        return span()
+        if not _TracingState.is_enabled():
+            return invoker()
+        token = MonitoredActivity._sample()
+        try:
+            if _operation_sampled.get() is False:
+                return invoker()
+            span_shell: Callable = distributed_trace(name_of_span=name_of_span, tracing_attributes=_resolve_attributes(tracing_attributes), kind=kind)
+            span = span_shell(invoker)
+            return span()
+        finally:
+            if token is not None:
+                _operation_sampled.reset(token)
 
     @staticmethod
-    async def invoke_async(invoker: Callable[[], T], name_of_span: str = None, tracing_attributes=None, kind: str = SpanKind.INTERNAL) -> T:
+    async def invoke_async(
+        invoker: Callable[[], T], name_of_span: str = None, tracing_attributes: Union[dict, Callable[[], dict], None] = None, kind: str = SpanKind.INTERNAL
+    ) -> T:
         """
         Runs a span on given function
+        :param tracing_attributes: the attributes of the span, or a function that creates them - called only if the span is traced.
+        """
+        if not _TracingState.is_enabled():
+            return await invoker()
+        token = MonitoredActivity._sample()
+        try:
+            if _operation_sampled.get() is False:
+                return await invoker()
+            span_shell: Callable = distributed_trace_async(name_of_span=name_of_span, tracing_attributes=_resolve_attributes(tracing_attributes), kind=kind)
+            span = span_shell(invoker)
+            return await span()
+        finally:
+            if token is not None:
+                _operation_sampled.reset(token)
+
+    @staticmethod
+    def trace(name_of_span: str = None, kind: str = SpanKind.INTERNAL) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """
+        Decorates a function with a span, like azure-core's distributed_trace, but calls it directly when it is not traced.
+        The traced function is created once, when the function is decorated.
         """
-        if tracing_attributes is None:
-            tracing_attributes = {}
-        span_shell: Callable = distributed_trace_async(name_of_span=name_of_span, tracing_attributes=tracing_attributes, kind=kind)
-        span = span_shell(invoker)
-        return await span()
+
+        def decorator(func: Callable) -> Callable:
+            traced = distributed_trace(name_of_span=name_of_span, kind=kind)(func)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not _TracingState.is_enabled():
+                    return func(*args, **kwargs)
+                token = MonitoredActivity._sample()
+                try:
+                    return (func if _operation_sampled.get() is False else traced)(*args, **kwargs)
+                finally:
+                    if token is not None:
+                        _operation_sampled.reset(token)
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def trace_async(name_of_span: str = None, kind: str = SpanKind.INTERNAL) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        """The same as trace, for coroutine functions."""
+
+        def decorator(func: Callable) -> Callable:
+            traced = distributed_trace_async(name_of_span=name_of_span, kind=kind)(func)
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not _TracingState.is_enabled():
+                    return await func(*args, **kwargs)
+                token = MonitoredActivity._sample()
+                try:
+                    return await (func if _operation_sampled.get() is False else traced)(*args, **kwargs)
+                finally:
+                    if token is not None:
+                        _operation_sampled.reset(token)
+
+            return wrapper
+
+        return decorator
+
+
+def _resolve_attributes(tracing_attributes: Union[dict, Callable[[], dict], None]) -> dict:
+    if tracing_attributes is None:
+        return {}
+    return tracing_attributes() if callable(tracing_attributes) else tracing_attributes
@@ -10,11 +10,10 @@ from typing import Callable, Coroutine, List, Optional, Any
 
 from azure.core.exceptions import ClientAuthenticationError
 from azure.core.tracing import SpanKind
-from azure.core.tracing.decorator import distributed_trace
-from azure.core.tracing.decorator_async import distributed_trace_async
 from azure.identity import AzureCliCredential, ManagedIdentityCredential, DeviceCodeCredential
 from msal import ConfidentialClientApplication, PublicClientApplication
 
+from . import metrics
 from ._cloud_settings import CloudInfo, CloudSettings
 from ._telemetry import MonitoredActivity
 from .exceptions import KustoAioSyntaxError, KustoAsyncUsageError, KustoClientError
@@ -146,20 +145,20 @@ class TokenProviderBase(abc.ABC):
 
     def get_token(self):
         """Get a token silently from cache or authenticate if cached token is not found"""
+        return MonitoredActivity.invoke(self._get_token, name_of_span=f"{self.name()}.get_token", tracing_attributes=self.context, kind=SpanKind.CLIENT)
 
-        @distributed_trace(name_of_span=f"{self.name()}.get_token", tracing_attributes=self.context(), kind=SpanKind.CLIENT)
-        def _get_token():
-            if self.is_async:
-                raise KustoAsyncUsageError("get_token", self.is_async)
-            self._init_once()
-
-            token = self._get_token_from_cache_impl()
-            if token is None:
-                with self._lock:
-                    token = MonitoredActivity.invoke(self._get_token_impl, name_of_span=f"{self.name()}.get_token_impl", tracing_attributes=self.context())
-            return self._valid_token_or_throw(token)
+    def _get_token(self):
+        if self.is_async:
+            raise KustoAsyncUsageError("get_token", self.is_async)
+        self._init_once()
 
-        return _get_token()
+        token = self._get_token_from_cache_impl()
+        if token is None:
+            with self._lock:
+                start_time = time.perf_counter()
+                token = MonitoredActivity.invoke(self._get_token_impl, name_of_span=f"{self.name()}.get_token_impl", tracing_attributes=self.context)
+                metrics._record_token_duration(self.name(), time.perf_counter() - start_time)
+        return self._valid_token_or_throw(token)
 
     def context(self) -> dict:
         if self.is_async:
@@ -176,27 +175,31 @@ class TokenProviderBase(abc.ABC):
 
     async def get_token_async(self):
         """Get a token asynchronously silently from cache or authenticate if cached token is not found"""
+        if not MonitoredActivity.is_tracing():
+            return await self._get_token_async(None)
 
         context = await self.context_async()
+        return await MonitoredActivity.invoke_async(
+            lambda: self._get_token_async(context), name_of_span=f"{self.name()}.get_token_async", tracing_attributes=context, kind=SpanKind.CLIENT
+        )
 
-        @distributed_trace_async(name_of_span=f"{self.name()}.get_token_async", tracing_attributes=context, kind=SpanKind.CLIENT)
-        async def _get_token_async():
-            if not self.is_async:
-                raise KustoAsyncUsageError("get_token_async", self.is_async)
-
-            await self._init_once_async()
+    async def _get_token_async(self, context: Optional[dict]):
+        if not self.is_async:
+            raise KustoAsyncUsageError("get_token_async", self.is_async)
 
-            token = self._get_token_from_cache_impl()
+        await self._init_once_async()
 
-            if token is None:
-                async with self._async_lock:
-                    token = await MonitoredActivity.invoke_async(
-                        self._get_token_impl_async, name_of_span=f"{self.name()}.get_token_impl_async", tracing_attributes=context
-                    )
+        token = self._get_token_from_cache_impl()
 
-            return self._valid_token_or_throw(token)
+        if token is None:
+            async with self._async_lock:
+                start_time = time.perf_counter()
+                token = await MonitoredActivity.invoke_async(
+                    self._get_token_impl_async, name_of_span=f"{self.name()}.get_token_impl_async", tracing_attributes=context
+                )
+                metrics._record_token_duration(self.name(), time.perf_counter() - start_time)
 
-        return await _get_token_async()
+        return self._valid_token_or_throw(token)
 
     def __enter__(self):
         return self
@@ -0,0 +1,72 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import logging
+import time
+from typing import List, Tuple
+
+from .._connection_pool import _ConnectionPoolMetricsRecorder
+from ..request_hooks import RequestEvent
+from ..exceptions import KustoAioSyntaxError
+
+try:
+    from aiohttp import TCPConnector, TraceConfig
+except ImportError:
+    raise KustoAioSyntaxError()
+
+_logger = logging.getLogger(__name__)
+
+
+class _KeepAliveTCPConnector(TCPConnector):
+    """A TCPConnector that sets socket options (TCP keep-alive, as the sync client does) on every connection it opens."""
+
+    def __init__(self, socket_options: List[Tuple[int, int, int]], **kwargs):
+        super().__init__(**kwargs)
+        self._socket_options = socket_options
+        self._logged_option_failure = False
+
+    async def _wrap_create_connection(self, *args, **kwargs):
+        transport, protocol = await super()._wrap_create_connection(*args, **kwargs)
+        sock = transport.get_extra_info("socket")
+        if sock is not None:
+            for level, option, value in self._socket_options:
+                try:
+                    sock.setsockopt(level, option, value)
+                except OSError as e:
+                    # Every connection would fail the same way, so the failure is only logged once per connector
+                    if not self._logged_option_failure:
+                        self._logged_option_failure = True
+                        _logger.warning("Failed to set socket option %s (level %s) to %s: %s", option, level, value, e)
+        return transport, protocol
+
+
+def _create_pool_trace_config(pool_metrics: _ConnectionPoolMetricsRecorder) -> TraceConfig:
+    """
+    Records the connections requests take from the pool, and the requests queued waiting for one, and times the connections of requests with hooks.
+    The number of requests currently waiting is taken from the connector, as cancelled requests leave the queue without a trace.
+    """
+
+    async def on_connection_queued_start(session, context, params):
+        context.pool_wait_start = time.perf_counter()
+        pool_metrics.record_queued()
+
+    async def on_connection_queued_end(session, context, params):
+        context.pool_wait = time.perf_counter() - context.pool_wait_start
+
+    async def on_connection_acquired(session, context, params):
+        pool_metrics.record_acquired(getattr(context, "pool_wait", 0.0))
+        context.pool_wait = 0.0
+        # Requests with hooks pass their event as the trace context
+        event = context.trace_request_ctx
+        if isinstance(event, RequestEvent) and event.connection_time is None:
+            event.connection_time = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        pool_metrics.record_created()
+        await on_connection_acquired(session, context, params)
+
+    trace_config = TraceConfig()
+    trace_config.on_connection_queued_start.append(on_connection_queued_start)
+    trace_config.on_connection_queued_end.append(on_connection_queued_end)
+    trace_config.on_connection_reuseconn.append(on_connection_acquired)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return trace_config
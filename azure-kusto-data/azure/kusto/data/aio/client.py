@@ -1,11 +1,16 @@
+import asyncio
 import io
+import time
 from datetime import timedelta
-from typing import Optional, Union
+from urllib.parse import urljoin
+from typing import Optional, Tuple, Union
 
 from azure.core.tracing import SpanKind
-from azure.core.tracing.decorator_async import distributed_trace_async
 
+from ._connector import _KeepAliveTCPConnector, _create_pool_trace_config
 from .response import KustoStreamingResponseDataSet
+from .._cloud_settings import METADATA_ENDPOINT
+from .._connection_pool import ConnectionPoolMetrics, _ConnectionPoolMetricsRecorder
 from .._decorators import aio_documented_by, documented_by
 from .._telemetry import MonitoredActivity, Span
 from ..aio.streaming_response import JsonTokenReader, StreamingDataSetEnumerator
@@ -15,6 +20,7 @@ from ..client_request_properties import ClientRequestProperties
 from ..data_format import DataFormat
 from ..exceptions import KustoAioSyntaxError, KustoClosedError, KustoNetworkError
 from ..kcsb import KustoConnectionStringBuilder
+from ..request_hooks import RequestEvent, _AsyncHookedResponseStream
 from ..response import KustoResponseDataSet
 
 try:
@@ -25,11 +31,41 @@ except ImportError:
 
 @documented_by(KustoClientSync)
 class KustoClient(_KustoClientBase):
-    @documented_by(KustoClientSync.__init__)
-    def __init__(self, kcsb: Union[KustoConnectionStringBuilder, str]):
-        super().__init__(kcsb, True)
+    def __init__(
+        self,
+        kcsb: Union[KustoConnectionStringBuilder, str],
+        share_resources: bool = False,
+        max_connections: Optional[int] = None,
+        max_connections_per_host: int = 0,
+        keepalive_timeout: float = 15.0,
+        use_dns_cache: bool = True,
+        dns_cache_ttl: Optional[int] = 10,
+    ):
+        """
+        Kusto Client constructor.
+        :param kcsb: The connection string to initialize KustoClient.
+        :type kcsb: azure.kusto.data.KustoConnectionStringBuilder or str
+        :param bool share_resources: Share the token provider with the other clients of the same cluster and identity in the process
+            that share resources. See azure.kusto.data.KustoClient. The connection pool is bound to the event loop, and isn't shared.
+        :param Optional[int] max_connections: The maximal number of connections kept open, beyond which requests wait for a free connection.
+            Overrides "Max Connections" in the connection string, and defaults to 100.
+        :param int max_connections_per_host: The maximal number of connections to a single host, or 0 for no limit.
+        :param float keepalive_timeout: Seconds to keep idle connections open.
+        :param bool use_dns_cache: Cache resolved host names.
+        :param Optional[int] dns_cache_ttl: Seconds to cache resolved host names, or None to cache them forever.
+        """
+        super().__init__(kcsb, True, share_resources, max_connections)
 
-        self._session = ClientSession()
+        connector = _KeepAliveTCPConnector(
+            KustoClientSync.compose_socket_options(),
+            limit=self._max_pool_size,
+            limit_per_host=max_connections_per_host,
+            keepalive_timeout=keepalive_timeout,
+            use_dns_cache=use_dns_cache,
+            ttl_dns_cache=dns_cache_ttl,
+        )
+        self._pool_metrics = _ConnectionPoolMetricsRecorder()
+        self._session = ClientSession(connector=connector, trace_configs=[_create_pool_trace_config(self._pool_metrics)])
 
     async def __aenter__(self) -> "KustoClient":
         return self
@@ -37,13 +73,43 @@ class KustoClient(_KustoClientBase):
     async def close(self):
         if not self._is_closed:
             await self._session.close()
-            if self._aad_helper:
-                await self._aad_helper.close_async()
+            aad_helper = self._release_aad_helper()
+            if aad_helper:
+                await aad_helper.close_async()
         super().close()
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         await self.close()
 
+    @aio_documented_by(KustoClientSync.warm_up)
+    async def warm_up(self, connections: int = 1):
+        if self._is_closed:
+            raise KustoClosedError()
+        if connections < 0:
+            raise ValueError("connections must not be negative")
+        self.validate_endpoint()
+        if self._aad_helper:
+            await self._aad_helper.acquire_authorization_header_async()
+
+        # Concurrent requests to the (anonymous and cheap) cloud metadata endpoint open the connections, which stay in the pool once they are read
+        await asyncio.gather(*(self._open_connection() for _ in range(min(connections, self._max_pool_size))))
+
+    async def _open_connection(self):
+        endpoint = urljoin(self._kusto_cluster, METADATA_ENDPOINT)
+        try:
+            async with self._session.get(endpoint, proxy=self._proxy_url, allow_redirects=False) as response:
+                await response.read()
+        except Exception as e:
+            raise KustoNetworkError(endpoint) from e
+
+    @documented_by(KustoClientSync.get_pool_metrics)
+    def get_pool_metrics(self) -> ConnectionPoolMetrics:
+        connector = self._session.connector
+        in_use = len(getattr(connector, "_acquired", ()))
+        idle = sum(len(connections) for connections in getattr(connector, "_conns", {}).values())
+        waiting = sum(len(waiters) for waiters in getattr(connector, "_waiters", {}).values())
+        return self._pool_metrics.snapshot(self._max_pool_size, in_use=in_use, idle=idle, waiting=waiting)
+
     @aio_documented_by(KustoClientSync.execute)
     async def execute(self, database: Optional[str], query: str, properties: ClientRequestProperties = None) -> KustoResponseDataSet:
         query = query.strip()
@@ -51,7 +117,7 @@ class KustoClient(_KustoClientBase):
             return await self.execute_mgmt(database, query, properties)
         return await self.execute_query(database, query, properties)
 
-    @distributed_trace_async(name_of_span="AioKustoClient.query_cmd", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace_async(name_of_span="AioKustoClient.query_cmd", kind=SpanKind.CLIENT)
     @aio_documented_by(KustoClientSync.execute_query)
     async def execute_query(self, database: str, query: str, properties: ClientRequestProperties = None) -> KustoResponseDataSet:
         database = self._get_database_or_default(database)
@@ -68,7 +134,7 @@ class KustoClient(_KustoClientBase):
         )
         return await self._execute(self._query_endpoint, request, properties)
 
-    @distributed_trace_async(name_of_span="AioKustoClient.control_cmd", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace_async(name_of_span="AioKustoClient.control_cmd", kind=SpanKind.CLIENT)
     @aio_documented_by(KustoClientSync.execute_mgmt)
     async def execute_mgmt(self, database: str, query: str, properties: ClientRequestProperties = None) -> KustoResponseDataSet:
         database = self._get_database_or_default(database)
@@ -85,7 +151,7 @@ class KustoClient(_KustoClientBase):
         )
         return await self._execute(self._mgmt_endpoint, request, properties)
 
-    @distributed_trace_async(name_of_span="AioKustoClient.streaming_ingest", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace_async(name_of_span="AioKustoClient.streaming_ingest", kind=SpanKind.CLIENT)
     @aio_documented_by(KustoClientSync.execute_streaming_ingest)
     async def execute_streaming_ingest(
         self,
@@ -139,13 +205,21 @@ class KustoClient(_KustoClientBase):
         timeout: timedelta = _KustoClientBase._query_default_timeout,
         properties: Optional[ClientRequestProperties] = None,
     ) -> StreamingDataSetEnumerator:
+        return (await self._start_streaming_query(database, query, timeout, properties))[0]
+
+    @aio_documented_by(KustoClientSync._start_streaming_query)
+    async def _start_streaming_query(
+        self, database: Optional[str], query: str, timeout: timedelta, properties: Optional[ClientRequestProperties]
+    ) -> Tuple[StreamingDataSetEnumerator, Optional[RequestEvent]]:
         request = ExecuteRequestParams._from_query(
             query, database, properties, self._request_headers, timeout, self._mgmt_default_timeout, self._client_server_delta, self.client_details
         )
-        response = await self._execute(self._query_endpoint, request, properties, stream_response=True)
-        return StreamingDataSetEnumerator(JsonTokenReader(response.content))
+        event = self._create_request_event(self._query_endpoint, request, is_streaming=True)
+        response = await self._execute(self._query_endpoint, request, properties, stream_response=True, request_event=event)
+        stream = response.content if event is None else _AsyncHookedResponseStream(response.content, event)
+        return StreamingDataSetEnumerator(JsonTokenReader(stream)), event
 
-    @distributed_trace_async(name_of_span="AioKustoClient.streaming_query", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace_async(name_of_span="AioKustoClient.streaming_query", kind=SpanKind.CLIENT)
     @aio_documented_by(KustoClientSync.execute_streaming_query)
     async def execute_streaming_query(
         self,
@@ -157,8 +231,12 @@ class KustoClient(_KustoClientBase):
         database = self._get_database_or_default(database)
         Span.set_query_attributes(self._kusto_cluster, database, properties)
 
-        response = await self._execute_streaming_query_parsed(database, query, timeout, properties)
-        return KustoStreamingResponseDataSet(response)
+        start_time = time.perf_counter()
+        frames, event = await self._start_streaming_query(database, query, timeout, properties)
+        response = KustoStreamingResponseDataSet(frames)
+        response._client_start_time = start_time
+        response._request_event = event
+        return response
 
     @aio_documented_by(KustoClientSync._execute)
     async def _execute(
@@ -167,10 +245,13 @@ class KustoClient(_KustoClientBase):
         request: ExecuteRequestParams,
         properties: Optional[ClientRequestProperties] = None,
         stream_response: bool = False,
+        request_event: Optional[RequestEvent] = None,
     ) -> Union[KustoResponseDataSet, ClientResponse]:
         """Executes given query against this client"""
         if self._is_closed:
             raise KustoClosedError()
+        start_time = time.perf_counter()
+        event = request_event if request_event is not None or stream_response else self._create_request_event(endpoint, request)
         self.validate_endpoint()
 
         request_headers = request.request_headers
@@ -178,6 +259,10 @@ class KustoClient(_KustoClientBase):
         if self._aad_helper:
             request_headers["Authorization"] = await self._aad_helper.acquire_authorization_header_async()
 
+        if event is not None:
+            event.send_time = time.perf_counter()
+            event._hook.before_request(event)
+
         invoker = lambda: self._session.post(
             endpoint,
             headers=request_headers,
@@ -186,15 +271,22 @@ class KustoClient(_KustoClientBase):
             timeout=timeout.seconds,
             proxy=self._proxy_url,
             allow_redirects=False,
+            # The pool's trace config times the connection of the request
+            trace_request_ctx=event,
         )
 
         try:
             response = await MonitoredActivity.invoke_async(
-                invoker, name_of_span="AioKustoClient.http_post", tracing_attributes=Span.create_http_attributes("POST", endpoint, request_headers)
+                invoker, name_of_span="AioKustoClient.http_post", tracing_attributes=lambda: Span.create_http_attributes("POST", endpoint, request_headers)
             )
         except Exception as e:
             raise KustoNetworkError(endpoint, None if properties is None else properties.client_request_id) from e
 
+        if event is not None:
+            event.status_code = response.status
+            event.headers_time = time.perf_counter()
+            event._hook.after_headers(event)
+
         if stream_response:
             try:
                 response.raise_for_status()
@@ -213,6 +305,11 @@ class KustoClient(_KustoClientBase):
                 raise self._handle_http_error(e, endpoint, request.payload, response, response.status, response_json, response_text)
 
         async with response:
+            if event is not None:
+                event.response_bytes = len(await response.read())
+                event.body_time = time.perf_counter()
+                event._hook.after_body(event)
+
             response_json = None
             try:
                 if 300 <= response.status < 400:
@@ -225,4 +322,8 @@ class KustoClient(_KustoClientBase):
                 except Exception:
                     response_text = None
                 raise self._handle_http_error(e, endpoint, request.payload, response, response.status, response_json, response_text)
-            return MonitoredActivity.invoke(lambda: self._kusto_parse_by_endpoint(endpoint, response_json), name_of_span="AioKustoClient.processing_response")
+            parsed = MonitoredActivity.invoke(lambda: self._kusto_parse_by_endpoint(endpoint, response_json), name_of_span="AioKustoClient.processing_response")
+            parsed._set_client_timings(start_time, event)
+            if event is not None:
+                self._set_parsed(event, parsed)
+            return parsed
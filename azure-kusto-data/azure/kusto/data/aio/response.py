@@ -1,9 +1,10 @@
-from typing import List, AsyncIterator, Union
+from typing import List, AsyncIterator, Optional, Union
 
 from azure.kusto.data._models import WellKnownDataSet, KustoResultTable, BaseKustoResultTable
 from azure.kusto.data.aio._models import KustoStreamingResultTable
 from azure.kusto.data.aio.streaming_response import StreamingDataSetEnumerator
 from azure.kusto.data.exceptions import KustoStreamingQueryError
+from azure.kusto.data.query_profile import QueryProfile
 from azure.kusto.data.response import BaseKustoResponseDataSet
 from azure.kusto.data.streaming_response import FrameType
 
@@ -39,7 +40,7 @@ class KustoStreamingResponseDataSet(BaseKustoResponseDataSet):
             try:
                 table = await self.streamed_data.__anext__()
             except StopAsyncIteration:
-                self.finished = True
+                self._set_finished()
                 return
             if table["FrameType"] == FrameType.DataTable:
                 break
@@ -66,6 +67,12 @@ class KustoStreamingResponseDataSet(BaseKustoResponseDataSet):
             raise KustoStreamingQueryError("Unable to get errors count before reading all of the tables.")
         return super().get_exceptions()
 
+    @property
+    def query_profile(self) -> Optional[QueryProfile]:
+        if not self.finished:
+            raise KustoStreamingQueryError("Unable to get the query profile before reading all of the tables.")
+        return super().query_profile
+
     def __getitem__(self, key: Union[int, str]) -> KustoResultTable:
         if isinstance(key, int):
             return self.tables[key]
@@ -1,18 +1,28 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
+import functools
 import socket
 import sys
+import time
 from datetime import timedelta
 from typing import AnyStr, IO, List, Optional, TYPE_CHECKING, Tuple, Union
 
 import requests
 import requests.adapters
+import urllib3.exceptions
 from requests import Response
+from urllib3 import HTTPSConnectionPool, ProxyManager
 from urllib3.connection import HTTPConnection
 
-from azure.core.tracing.decorator import distributed_trace
 from azure.core.tracing import SpanKind
 
+from azure.kusto.data._connection_pool import (
+    ConnectionPoolMetrics,
+    _ConnectionPoolMetricsRecorder,
+    _InstrumentedHTTPConnectionPool,
+    _InstrumentedHTTPSConnectionPool,
+)
+from azure.kusto.data._shared_resources import _SharedResourceRegistry
 from azure.kusto.data._telemetry import Span, MonitoredActivity
 
 from .client_base import ExecuteRequestParams, _KustoClientBase
@@ -21,6 +31,7 @@ from .data_format import DataFormat
 from .exceptions import KustoClosedError, KustoNetworkError
 
 from .kcsb import KustoConnectionStringBuilder
+from .request_hooks import RequestEvent, _HookedResponseStream, _current_request
 from .response import KustoResponseDataSet, KustoStreamingResponseDataSet
 from .streaming_response import JsonTokenReader, StreamingDataSetEnumerator
 
@@ -31,6 +42,7 @@ if TYPE_CHECKING:
 class HTTPAdapterWithSocketOptions(requests.adapters.HTTPAdapter):
     def __init__(self, *args, **kwargs):
         self.socket_options = kwargs.pop("socket_options", None)
+        self.pool_metrics = kwargs.pop("pool_metrics", None) or _ConnectionPoolMetricsRecorder()
         super(HTTPAdapterWithSocketOptions, self).__init__(*args, **kwargs)
 
     def __getstate__(self):
@@ -42,6 +54,23 @@ class HTTPAdapterWithSocketOptions(requests.adapters.HTTPAdapter):
         if self.socket_options is not None:
             kwargs["socket_options"] = self.socket_options
         super(HTTPAdapterWithSocketOptions, self).init_poolmanager(*args, **kwargs)
+        self._instrument(self.poolmanager)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super(HTTPAdapterWithSocketOptions, self).proxy_manager_for(proxy, **proxy_kwargs)
+        # SOCKS proxy managers have pools of their own kind
+        if type(manager) is ProxyManager:
+            self._instrument(manager)
+        return manager
+
+    def _instrument(self, manager):
+        # Unpickled adapters are initialized without calling __init__
+        if getattr(self, "pool_metrics", None) is None:
+            self.pool_metrics = _ConnectionPoolMetricsRecorder()
+        manager.pool_classes_by_scheme = {
+            "http": functools.partial(_InstrumentedHTTPConnectionPool, pool_metrics=self.pool_metrics),
+            "https": functools.partial(_InstrumentedHTTPSConnectionPool, pool_metrics=self.pool_metrics),
+        }
 
 
 class KustoClient(_KustoClientBase):
@@ -60,31 +89,63 @@ class KustoClient(_KustoClientBase):
     _streaming_ingest_default_timeout = timedelta(minutes=10)
     _client_server_delta = timedelta(seconds=30)
 
-    # The maximum amount of connections to be able to operate in parallel
-    _max_pool_size = 100
-
-    def __init__(self, kcsb: Union[KustoConnectionStringBuilder, str]):
+    def __init__(
+        self,
+        kcsb: Union[KustoConnectionStringBuilder, str],
+        share_resources: bool = False,
+        max_connections: Optional[int] = None,
+        pool_block: bool = False,
+    ):
         """
         Kusto Client constructor.
         :param kcsb: The connection string to initialize KustoClient.
         :type kcsb: azure.kusto.data.KustoConnectionStringBuilder or str
+        :param bool share_resources: Share the HTTP connection pool and the token provider with the other clients of the same cluster in the process
+            that share resources, including the ingest clients. The token provider is shared only between clients with the same authentication identity.
+            Shared resources are closed once all of their clients are closed. set_proxy applies to the client alone, while set_http_retries
+            and set_proxy's effect on token acquisition apply to all the clients sharing the resources.
+        :param Optional[int] max_connections: The maximal number of connections kept open to the cluster.
+            Overrides "Max Connections" in the connection string, and defaults to 100. Clients sharing resources use the pool of the first one.
+        :param bool pool_block: Make requests wait for a free connection when max_connections are in use,
+            rather than opening connections that are closed once they are done.
         """
-        super().__init__(kcsb, False)
+        super().__init__(kcsb, False, share_resources, max_connections)
+        self._pool_block = pool_block
+
+        self._proxies = None
+        self._session_key = None
+        if share_resources:
+            # The async client can't share the sync client's session, so only sessions of sync clients are shared
+            self._session_key = _SharedResourceRegistry.session_key(self._kcsb)
+            self._session = _SharedResourceRegistry.acquire(self._session_key, self._create_session)
+        else:
+            self._session = self._create_session()
 
+    def _create_session(self) -> requests.Session:
         # Create a session object for connection pooling
-        self._session = requests.Session()
+        session = requests.Session()
 
-        adapter = HTTPAdapterWithSocketOptions(
-            socket_options=(HTTPConnection.default_socket_options or []) + self.compose_socket_options(), pool_maxsize=self._max_pool_size
+        adapter = self._create_adapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _create_adapter(self, **kwargs) -> HTTPAdapterWithSocketOptions:
+        return HTTPAdapterWithSocketOptions(
+            socket_options=(HTTPConnection.default_socket_options or []) + self.compose_socket_options(),
+            pool_maxsize=self._max_pool_size,
+            pool_block=self._pool_block,
+            **kwargs,
         )
-        self._session.mount("http://", adapter)
-        self._session.mount("https://", adapter)
 
     def close(self):
         if not self._is_closed:
-            self._session.close()
-            if self._aad_helper:
-                self._aad_helper.close()
+            session = self._session if self._session_key is None else _SharedResourceRegistry.release(self._session_key)
+            if session is not None:
+                session.close()
+            aad_helper = self._release_aad_helper()
+            if aad_helper:
+                aad_helper.close()
         super().close()
 
     def __enter__(self):
@@ -95,17 +156,15 @@ class KustoClient(_KustoClientBase):
 
     def set_proxy(self, proxy_url: str):
         super().set_proxy(proxy_url)
-        self._session.proxies = {"http": proxy_url, "https": proxy_url}
+        self._proxies = {"http": proxy_url, "https": proxy_url}
+        if self._session_key is None:
+            self._session.proxies = self._proxies
 
     def set_http_retries(self, max_retries: int):
         """
         Set the number of HTTP retries to attempt
         """
-        adapter = HTTPAdapterWithSocketOptions(
-            socket_options=(HTTPConnection.default_socket_options or []) + self.compose_socket_options(),
-            pool_maxsize=self._max_pool_size,
-            max_retries=max_retries,
-        )
+        adapter = self._create_adapter(max_retries=max_retries, pool_metrics=self._get_adapter().pool_metrics)
         self._session.mount("http://", adapter)
         self._session.mount("https://", adapter)
 
@@ -148,6 +207,62 @@ class KustoClient(_KustoClientBase):
         else:
             return []
 
+    def warm_up(self, connections: int = 1):
+        """
+        Prepares the client for its first requests, so they don't pay for the setup: acquires a token (resolving the cluster's cloud info),
+        and opens connections to the cluster (TCP and TLS), which are kept in the pool for the following requests.
+        :param int connections: The number of connections to open, including idle ones that are already open. At most the pool's size.
+        """
+        if self._is_closed:
+            raise KustoClosedError()
+        if connections < 0:
+            raise ValueError("connections must not be negative")
+        self.validate_endpoint()
+        if self._aad_helper:
+            self._aad_helper.acquire_authorization_header()
+
+        pool = self._get_connection_pool()
+        opened = []
+        try:
+            for _ in range(min(connections, self._get_adapter()._pool_maxsize)):
+                connection = pool._get_conn()
+                opened.append(connection)
+                if connection.sock is None:
+                    if pool.proxy is not None and isinstance(pool, HTTPSConnectionPool):
+                        # Connections to the cluster are tunneled through the proxy
+                        pool._prepare_proxy(connection)
+                    else:
+                        connection.connect()
+        except (OSError, urllib3.exceptions.HTTPError) as e:
+            raise KustoNetworkError(self._kusto_cluster) from e
+        finally:
+            for connection in opened:
+                pool._put_conn(connection)
+
+    def get_pool_metrics(self) -> ConnectionPoolMetrics:
+        """
+        Returns the metrics of the client's connection pool - the connections in use and idle, and the time requests waited for a connection.
+        Clients sharing resources share their pool and its metrics.
+        """
+        adapter = self._get_adapter()
+        return adapter.pool_metrics.snapshot(adapter._pool_maxsize)
+
+    def _get_adapter(self) -> HTTPAdapterWithSocketOptions:
+        return self._session.get_adapter(self._kusto_cluster)
+
+    def _get_connection_pool(self) -> urllib3.HTTPConnectionPool:
+        """Returns the pool the session sends the cluster's requests through, with the session's proxy and TLS settings."""
+        adapter = self._get_adapter()
+        settings = self._session.merge_environment_settings(self._kusto_cluster, self._proxies or {}, False, None, None)
+        if hasattr(adapter, "get_connection_with_tls_context"):
+            request = requests.Request("GET", self._kusto_cluster).prepare()
+            return adapter.get_connection_with_tls_context(request, settings["verify"], settings["proxies"], settings["cert"])
+
+        # Older versions of requests
+        pool = adapter.get_connection(self._kusto_cluster, settings["proxies"])
+        adapter.cert_verify(pool, self._kusto_cluster, settings["verify"], settings["cert"])
+        return pool
+
     def execute(self, database: Optional[str], query: str, properties: Optional[ClientRequestProperties] = None) -> KustoResponseDataSet:
         """
         Executes a query or management command.
@@ -162,7 +277,7 @@ class KustoClient(_KustoClientBase):
             return self.execute_mgmt(database, query, properties)
         return self.execute_query(database, query, properties)
 
-    @distributed_trace(name_of_span="KustoClient.query_cmd", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(name_of_span="KustoClient.query_cmd", kind=SpanKind.CLIENT)
     def execute_query(self, database: Optional[str], query: str, properties: Optional[ClientRequestProperties] = None) -> KustoResponseDataSet:
         """
         Execute a KQL query.
@@ -187,7 +302,7 @@ class KustoClient(_KustoClientBase):
         )
         return self._execute(self._query_endpoint, request, properties)
 
-    @distributed_trace(name_of_span="KustoClient.control_cmd", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(name_of_span="KustoClient.control_cmd", kind=SpanKind.CLIENT)
     def execute_mgmt(self, database: Optional[str], query: str, properties: Optional[ClientRequestProperties] = None) -> KustoResponseDataSet:
         """
         Execute a KQL control command.
@@ -212,7 +327,7 @@ class KustoClient(_KustoClientBase):
         )
         return self._execute(self._mgmt_endpoint, request, properties)
 
-    @distributed_trace(name_of_span="KustoClient.streaming_ingest", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(name_of_span="KustoClient.streaming_ingest", kind=SpanKind.CLIENT)
     def execute_streaming_ingest(
         self,
         database: Optional[str],
@@ -276,14 +391,22 @@ class KustoClient(_KustoClientBase):
         timeout: timedelta = _KustoClientBase._query_default_timeout,
         properties: Optional[ClientRequestProperties] = None,
     ) -> StreamingDataSetEnumerator:
+        return self._start_streaming_query(database, query, timeout, properties)[0]
+
+    def _start_streaming_query(
+        self, database: Optional[str], query: str, timeout: timedelta, properties: Optional[ClientRequestProperties]
+    ) -> Tuple[StreamingDataSetEnumerator, Optional[RequestEvent]]:
+        """Sends a query with a streamed response, returning its frames and the event of its request (if it has one)."""
         request = ExecuteRequestParams._from_query(
             query, database, properties, self._request_headers, timeout, self._mgmt_default_timeout, self._client_server_delta, self.client_details
         )
-        response = self._execute(self._query_endpoint, request, properties, stream_response=True)
+        event = self._create_request_event(self._query_endpoint, request, is_streaming=True)
+        response = self._execute(self._query_endpoint, request, properties, stream_response=True, request_event=event)
         response.raw.decode_content = True
-        return StreamingDataSetEnumerator(JsonTokenReader(response.raw))
+        stream = response.raw if event is None else _HookedResponseStream(response.raw, event)
+        return StreamingDataSetEnumerator(JsonTokenReader(stream)), event
 
-    @distributed_trace(name_of_span="KustoClient.streaming_query", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(name_of_span="KustoClient.streaming_query", kind=SpanKind.CLIENT)
     def execute_streaming_query(
         self,
         database: Optional[str],
@@ -303,7 +426,12 @@ class KustoClient(_KustoClientBase):
         """
         Span.set_query_attributes(self._kusto_cluster, database, properties)
 
-        return KustoStreamingResponseDataSet(self._execute_streaming_query_parsed(database, query, timeout, properties))
+        start_time = time.perf_counter()
+        frames, event = self._start_streaming_query(database, query, timeout, properties)
+        response = KustoStreamingResponseDataSet(frames)
+        response._client_start_time = start_time
+        response._request_event = event
+        return response
 
     def _execute(
         self,
@@ -311,16 +439,24 @@ class KustoClient(_KustoClientBase):
         request: ExecuteRequestParams,
         properties: Optional[ClientRequestProperties] = None,
         stream_response: bool = False,
+        request_event: Optional[RequestEvent] = None,
     ) -> Union[KustoResponseDataSet, Response]:
         """Executes given query against this client"""
         if self._is_closed:
             raise KustoClosedError()
+        start_time = time.perf_counter()
+        event = request_event if request_event is not None or stream_response else self._create_request_event(endpoint, request)
         self.validate_endpoint()
 
         request_headers = request.request_headers
         if self._aad_helper:
             request_headers["Authorization"] = self._aad_helper.acquire_authorization_header()
 
+        if event is not None:
+            event.send_time = time.perf_counter()
+            event._hook.before_request(event)
+            _current_request.event = event
+
         # trace http post call for response
         invoker = lambda: self._session.post(
             endpoint,
@@ -328,16 +464,30 @@ class KustoClient(_KustoClientBase):
             json=request.json_payload,
             data=request.payload,
             timeout=request.timeout.seconds,
-            stream=stream_response,
+            # With hooks, the body is read separately, to time receiving the headers
+            stream=stream_response or event is not None,
             allow_redirects=False,
+            proxies=self._proxies,
         )
 
         try:
             response = MonitoredActivity.invoke(
-                invoker, name_of_span="KustoClient.http_post", tracing_attributes=Span.create_http_attributes("POST", endpoint, request_headers)
+                invoker, name_of_span="KustoClient.http_post", tracing_attributes=lambda: Span.create_http_attributes("POST", endpoint, request_headers)
             )
         except Exception as e:
             raise KustoNetworkError(endpoint, None if properties is None else properties.client_request_id) from e
+        finally:
+            if event is not None:
+                _current_request.event = None
+
+        if event is not None:
+            event.status_code = response.status_code
+            event.headers_time = time.perf_counter()
+            event._hook.after_headers(event)
+            if not stream_response:
+                event.response_bytes = len(response.content)
+                event.body_time = time.perf_counter()
+                event._hook.after_body(event)
 
         if stream_response:
             try:
@@ -357,4 +507,8 @@ class KustoClient(_KustoClientBase):
         except Exception as e:
             raise self._handle_http_error(e, endpoint, request.payload, response, response.status_code, response_json, response.text)
         # trace response processing
-        return MonitoredActivity.invoke(lambda: self._kusto_parse_by_endpoint(endpoint, response_json), name_of_span="KustoClient.processing_response")
+        parsed = MonitoredActivity.invoke(lambda: self._kusto_parse_by_endpoint(endpoint, response_json), name_of_span="KustoClient.processing_response")
+        parsed._set_client_timings(start_time, event)
+        if event is not None:
+            self._set_parsed(event, parsed)
+        return parsed
@@ -1,6 +1,7 @@
 import abc
 import io
 import json
+import time
 import uuid
 from copy import copy
 from datetime import timedelta
@@ -10,19 +11,28 @@ from urllib.parse import urljoin
 from requests import Response
 
 from azure.kusto.data._cloud_settings import CloudSettings
+from azure.kusto.data._connection_pool import DEFAULT_MAX_CONNECTIONS
+from azure.kusto.data._shared_resources import _SharedResourceRegistry
 from azure.kusto.data._token_providers import CloudInfoTokenProvider
 from .client_details import ClientDetails
 from .client_request_properties import ClientRequestProperties
 from .exceptions import KustoServiceError, KustoThrottlingError, KustoApiError
 from .kcsb import KustoConnectionStringBuilder
 from .kusto_trusted_endpoints import well_known_kusto_endpoints
+from . import metrics
+from .request_hooks import RequestEvent, RequestHook, _CompositeRequestHook
 from .response import KustoResponseDataSet, KustoResponseDataSetV2, KustoResponseDataSetV1
 from .security import _AadHelper
+from .slow_query_log import SlowQueryLog
 
 if TYPE_CHECKING:
     import aiohttp
 
 
+# The hooks of requests that are only timed for the slow query log
+_NO_HOOKS = _CompositeRequestHook(())
+
+
 class _KustoClientBase(abc.ABC):
     API_VERSION = "2019-02-13"
 
@@ -31,19 +41,40 @@ class _KustoClientBase(abc.ABC):
     _streaming_ingest_default_timeout: ClassVar[timedelta] = timedelta(minutes=10)
     _client_server_delta: ClassVar[timedelta] = timedelta(seconds=30)
 
+    # The maximum amount of connections to be able to operate in parallel
+    _max_pool_size: int = DEFAULT_MAX_CONNECTIONS
+
     _aad_helper: _AadHelper
     client_details: ClientDetails
     _endpoint_validated = False
+    # None while there are no request hooks, so requests only check it once
+    _request_hook: Optional[_CompositeRequestHook] = None
+    _slow_query_log: Optional[SlowQueryLog] = None
 
-    def __init__(self, kcsb: Union[KustoConnectionStringBuilder, str], is_async):
+    def __init__(self, kcsb: Union[KustoConnectionStringBuilder, str], is_async, share_resources: bool = False, max_connections: Optional[int] = None):
         self._kcsb = kcsb
         self._proxy_url: Optional[str] = None
         if not isinstance(kcsb, KustoConnectionStringBuilder):
             self._kcsb = KustoConnectionStringBuilder(kcsb)
         self._kusto_cluster = self._kcsb.data_source
+        self._share_resources = share_resources
+
+        if max_connections is None:
+            max_connections = self._kcsb.max_connections
+        if max_connections is not None:
+            if max_connections < 1:
+                raise ValueError("max_connections must be positive")
+            self._max_pool_size = max_connections
 
         # notice that in this context, federated actually just stands for aad auth, not aad federated auth (legacy code)
-        self._aad_helper = _AadHelper(self._kcsb, is_async) if self._kcsb.aad_federated_security else None
+        self._aad_helper_key = None
+        if not self._kcsb.aad_federated_security:
+            self._aad_helper = None
+        elif share_resources:
+            self._aad_helper_key = _SharedResourceRegistry.aad_helper_key(self._kcsb, is_async)
+            self._aad_helper = _SharedResourceRegistry.acquire(self._aad_helper_key, lambda: _AadHelper(self._kcsb, is_async))
+        else:
+            self._aad_helper = _AadHelper(self._kcsb, is_async)
 
         if not self._kusto_cluster.endswith("/"):
             self._kusto_cluster += "/"
@@ -69,6 +100,58 @@ class _KustoClientBase(abc.ABC):
     def close(self):
         self._is_closed = True
 
+    def _release_aad_helper(self) -> Optional[_AadHelper]:
+        """Returns the client's _AadHelper if it should be closed along with the client - if it is not shared, or this was its last client."""
+        if self._aad_helper_key is None:
+            return self._aad_helper
+        return _SharedResourceRegistry.release(self._aad_helper_key)
+
+    def add_request_hook(self, hook: RequestHook):
+        """
+        Registers a hook that is called as every request of the client goes through its phases - sending, receiving the headers,
+        reading the body and parsing it - with the timings, sizes and the client request id of the request.
+        """
+        hooks = self._request_hook.hooks if self._request_hook is not None else ()
+        self._request_hook = _CompositeRequestHook(hooks + (hook,))
+
+    def remove_request_hook(self, hook: RequestHook):
+        hooks = tuple(h for h in self._request_hook.hooks if h is not hook) if self._request_hook is not None else ()
+        self._request_hook = _CompositeRequestHook(hooks) if hooks else None
+
+    def _create_request_event(self, endpoint: str, request: "ExecuteRequestParams", is_streaming: bool = False) -> Optional[RequestEvent]:
+        hook = self._request_hook
+        metrics_hook = metrics._get_request_hook()
+        if metrics_hook is not None:
+            hook = _CompositeRequestHook((hook.hooks if hook is not None else ()) + (metrics_hook,))
+        slow_query_log = self._slow_query_log
+        if hook is None:
+            if slow_query_log is None:
+                return None
+            hook = _NO_HOOKS
+        database = request.json_payload.get("db") if request.json_payload else None
+        event = RequestEvent(endpoint, request.request_headers.get("x-ms-client-request-id"), is_streaming, database)
+        # The hooks are fixed for the request, even if they change while it runs
+        event._hook = hook
+        if slow_query_log is not None:
+            event._slow_query_log = slow_query_log
+            event._query = request.json_payload.get("csl") if request.json_payload else None
+        return event
+
+    @staticmethod
+    def _set_parsed(event: RequestEvent, response: KustoResponseDataSet):
+        event.row_count = sum(table.rows_count for table in response.primary_results)
+        event.parse_time = time.perf_counter()
+        event._hook.after_parse(event)
+        if event._slow_query_log is not None:
+            event._slow_query_log._observe(event, response)
+
+    def set_slow_query_log(self, slow_query_log: Optional[SlowQueryLog]):
+        """
+        Records the queries, management commands, streaming queries and streaming ingestions of the client that exceed the thresholds of a log,
+        with their timings and server side statistics. Pass None to stop recording.
+        """
+        self._slow_query_log = slow_query_log
+
     def set_proxy(self, proxy_url: str):
         self._proxy_url = proxy_url
         if self._aad_helper:
@@ -44,6 +44,7 @@ class KustoConnectionStringBuilder:
         interactive_login = "Interactive Login"
         login_hint = "Login Hint"
         domain_hint = "Domain Hint"
+        max_connections = "Max Connections"
 
         @classmethod
         def parse(cls, key: str) -> "KustoConnectionStringBuilder.ValidKeywords":
@@ -87,6 +88,8 @@ class KustoConnectionStringBuilder:
                 return cls.login_hint
             if key in ["domain hint"]:
                 return cls.domain_hint
+            if key in ["max connections", "maxconnections"]:
+                return cls.max_connections
             raise KeyError(key)
 
         def is_secret(self) -> bool:
@@ -110,6 +113,7 @@ class KustoConnectionStringBuilder:
                 self.login_hint,
                 self.domain_hint,
                 self.initial_catalog,
+                self.max_connections,
             ]
 
         def is_dict_type(self) -> bool:
@@ -626,6 +630,16 @@ class KustoConnectionStringBuilder:
     def domain_hint(self) -> Optional[str]:
         return self._internal_dict.get(self.ValidKeywords.domain_hint)
 
+    @property
+    def max_connections(self) -> Optional[int]:
+        """The maximal number of connections a client keeps open to the cluster"""
+        value = self._internal_dict.get(self.ValidKeywords.max_connections)
+        return None if value is None else int(value)
+
+    @max_connections.setter
+    def max_connections(self, value: int):
+        self[self.ValidKeywords.max_connections] = str(value)
+
     @property
     def application_for_tracing(self) -> Optional[str]:
         return self._application_for_tracing
@@ -0,0 +1,300 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+"""
+Client side metrics of the Kusto clients (both azure-kusto-data and azure-kusto-ingest), reported to an OpenTelemetry compatible meter.
+Metrics are off by default, and cost nothing until enable_metrics is called.
+"""
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Union
+from urllib.parse import unquote, urlparse
+
+from .request_hooks import RequestEvent, RequestHook
+
+METER_NAME = "azure.kusto"
+
+# Attributes of the recorded metrics
+DATABASE = "kusto.database"
+TABLE = "kusto.table"
+OPERATION = "kusto.operation"
+STATUS_CODE = "http.response.status_code"
+TOKEN_PROVIDER = "kusto.token_provider"
+STORAGE_ACCOUNT = "kusto.storage_account"
+INGESTION_METHOD = "kusto.ingestion_method"
+
+# Values of the OPERATION attribute
+QUERY = "query"
+MGMT = "mgmt"
+STREAMING_QUERY = "streaming_query"
+STREAMING_INGEST = "streaming_ingest"
+UPLOAD = "upload"
+ENQUEUE = "enqueue"
+
+# Values of the INGESTION_METHOD attribute
+STREAMING = "streaming"
+QUEUED = "queued"
+
+_STREAMING_INGEST_PATH = "/v1/rest/ingest/"
+_MGMT_PATH = "/v1/rest/mgmt"
+
+Attributes = Mapping[str, Union[str, int, float, bool]]
+
+
+class _KustoInstruments:
+    """The instruments of the clients, created once on the configured meter."""
+
+    def __init__(self, meter: Any):
+        self.request_duration = meter.create_histogram(
+            "kusto.client.request.duration", unit="s", description="The duration of requests to the service, until their response was read and parsed."
+        )
+        self.response_size = meter.create_counter("kusto.client.response.size", unit="By", description="The bytes received in response bodies.")
+        self.response_rows = meter.create_counter(
+            "kusto.client.response.rows", unit="{row}", description="The rows received in the primary results of queries."
+        )
+        self.throttled_requests = meter.create_counter(
+            "kusto.client.throttled_requests", unit="{request}", description="The requests the service throttled (responded with 429)."
+        )
+        self.retries = meter.create_counter("kusto.client.retries", unit="{retry}", description="The failed attempts that were retried.")
+        self.token_duration = meter.create_histogram(
+            "kusto.client.token.duration", unit="s", description="The duration of acquiring a token that was not cached by the token provider."
+        )
+        self.ingest_size = meter.create_counter(
+            "kusto.ingest.size", unit="By", description="The bytes sent for ingestion - streamed to the service, or uploaded to storage."
+        )
+        self.compression_ratio = meter.create_histogram(
+            "kusto.ingest.compression_ratio",
+            unit="1",
+            description="The ratio between the raw and the compressed size of data compressed for ingestion - files, streams, DataFrames and records.",
+        )
+        self.upload_throughput = meter.create_histogram(
+            "kusto.ingest.upload.throughput", unit="By/s", description="The throughput of uploads to storage accounts, for ingestions of a known size."
+        )
+        self.managed_streaming_ingestions = meter.create_counter(
+            "kusto.ingest.managed_streaming.ingestions",
+            unit="{ingestion}",
+            description="The ingestions of ManagedStreamingIngestClient, by whether they were streamed or fell back to queued ingestion.",
+        )
+
+
+_instruments: Optional[_KustoInstruments] = None
+_request_hook: Optional["_MetricsRequestHook"] = None
+
+
+def enable_metrics(meter: Any = None) -> None:
+    """
+    Reports the metrics of all the Kusto clients of the process to a meter.
+    :param meter: an OpenTelemetry Meter (or anything with the same create_counter and create_histogram methods, like InMemoryMeter).
+        If not given, the meter named "azure.kusto" of the global OpenTelemetry MeterProvider is used, which requires opentelemetry-api.
+    """
+    global _instruments, _request_hook
+    if meter is None:
+        try:
+            from opentelemetry import metrics
+        except ImportError as e:
+            raise ImportError("opentelemetry-api is not installed, run 'pip install azure-kusto-data[metrics]' or pass a meter to enable_metrics") from e
+        meter = metrics.get_meter(METER_NAME)
+    _instruments = _KustoInstruments(meter)
+    _request_hook = _MetricsRequestHook(_instruments)
+
+
+def disable_metrics() -> None:
+    """Stops reporting metrics. Instruments that were created on the meter are left as they are."""
+    global _instruments, _request_hook
+    _instruments = None
+    _request_hook = None
+
+
+def _get_instruments() -> Optional[_KustoInstruments]:
+    """The instruments to record to, or None when metrics are disabled - callers skip measuring altogether."""
+    return _instruments
+
+
+def _operation_of(event: RequestEvent) -> str:
+    path = urlparse(event.endpoint).path
+    if path.startswith(_STREAMING_INGEST_PATH):
+        return STREAMING_INGEST
+    if path.startswith(_MGMT_PATH):
+        return MGMT
+    return STREAMING_QUERY if event.is_streaming else QUERY
+
+
+def _database_of(event: RequestEvent) -> str:
+    if event.database is not None:
+        return event.database
+    # Streaming ingestion endpoints are of the form /v1/rest/ingest/{database}/{table}
+    path = urlparse(event.endpoint).path
+    if path.startswith(_STREAMING_INGEST_PATH):
+        return unquote(path[len(_STREAMING_INGEST_PATH) :].split("/", 1)[0])
+    return ""
+
+
+class _MetricsRequestHook(RequestHook):
+    """Records the metrics of requests, added to the request hooks of every client while metrics are enabled."""
+
+    def __init__(self, instruments: _KustoInstruments):
+        self._instruments = instruments
+
+    @staticmethod
+    def _attributes(event: RequestEvent) -> Dict[str, Union[str, int]]:
+        attributes = {DATABASE: _database_of(event), OPERATION: _operation_of(event)}
+        if event.status_code is not None:
+            attributes[STATUS_CODE] = event.status_code
+        return attributes
+
+    def after_headers(self, event: RequestEvent):
+        if event.status_code == 429:
+            self._instruments.throttled_requests.add(1, self._attributes(event))
+
+    def after_body(self, event: RequestEvent):
+        attributes = self._attributes(event)
+        if event.response_bytes:
+            self._instruments.response_size.add(event.response_bytes, attributes)
+        # Successful responses that are read as a whole are parsed next, and their duration includes parsing
+        if event.is_streaming or event.status_code is None or event.status_code >= 300:
+            self._instruments.request_duration.record(event.body_time - event.start_time, attributes)
+
+    def after_parse(self, event: RequestEvent):
+        attributes = self._attributes(event)
+        self._instruments.request_duration.record(event.parse_time - event.start_time, attributes)
+        if event.row_count:
+            self._instruments.response_rows.add(event.row_count, attributes)
+
+
+def _get_request_hook() -> Optional[_MetricsRequestHook]:
+    return _request_hook
+
+
+def _record_retry(operation: str, **attributes):
+    instruments = _instruments
+    if instruments is not None:
+        instruments.retries.add(1, {OPERATION: operation, **attributes})
+
+
+def _record_token_duration(provider_name: str, seconds: float):
+    instruments = _instruments
+    if instruments is not None:
+        instruments.token_duration.record(seconds, {TOKEN_PROVIDER: provider_name})
+
+
+def _record_ingest_size(size: Optional[int], method: str, database: str, table: str):
+    instruments = _instruments
+    if instruments is not None and size:
+        instruments.ingest_size.add(size, {DATABASE: database, TABLE: table, INGESTION_METHOD: method})
+
+
+def _record_compression(raw_size: int, compressed_size: int):
+    instruments = _instruments
+    if instruments is not None and raw_size and compressed_size:
+        instruments.compression_ratio.record(raw_size / compressed_size)
+
+
+def _record_upload(storage_account: str, size: Optional[int], seconds: float):
+    instruments = _instruments
+    if instruments is not None and size and seconds > 0:
+        instruments.upload_throughput.record(size / seconds, {STORAGE_ACCOUNT: storage_account})
+
+
+def _record_managed_streaming_ingestion(method: str, database: str, table: str):
+    instruments = _instruments
+    if instruments is not None:
+        instruments.managed_streaming_ingestions.add(1, {DATABASE: database, TABLE: table, INGESTION_METHOD: method})
+
+
+class MetricPoint:
+    """A single measurement recorded by an instrument of InMemoryMeter."""
+
+    value: Union[int, float]
+    "The measured value - the amount added to a counter, or the value recorded by a histogram."
+
+    attributes: Dict[str, Any]
+    "The attributes of the measurement."
+
+    time: float
+    "When the measurement was made, as a value of time.time()."
+
+    def __init__(self, value: Union[int, float], attributes: Optional[Attributes]):
+        self.value = value
+        self.attributes = dict(attributes) if attributes else {}
+        self.time = time.time()
+
+    def __repr__(self):
+        return "MetricPoint(value={}, attributes={})".format(self.value, self.attributes)
+
+
+class InMemoryInstrument:
+    """A counter or a histogram of InMemoryMeter, keeping every measurement."""
+
+    def __init__(self, name: str, kind: str, unit: str = "", description: str = ""):
+        self.name = name
+        self.kind = kind
+        self.unit = unit
+        self.description = description
+        self.points: List[MetricPoint] = []
+        self._lock = threading.Lock()
+
+    def add(self, amount: Union[int, float], attributes: Optional[Attributes] = None, *args, **kwargs):
+        self._record(amount, attributes)
+
+    def record(self, amount: Union[int, float], attributes: Optional[Attributes] = None, *args, **kwargs):
+        self._record(amount, attributes)
+
+    def _record(self, amount: Union[int, float], attributes: Optional[Attributes]):
+        point = MetricPoint(amount, attributes)
+        with self._lock:
+            self.points.append(point)
+
+
+class InMemoryMeter:
+    """
+    A meter that keeps the measurements of the clients in memory, for tests and for inspecting the metrics without an OpenTelemetry SDK.
+    Usage: meter = InMemoryMeter(); enable_metrics(meter); ...; meter.sum("kusto.client.response.rows", **{DATABASE: "db"})
+    """
+
+    def __init__(self):
+        self._instruments: Dict[str, InMemoryInstrument] = {}
+        self._lock = threading.Lock()
+
+    def _create(self, name: str, kind: str, unit: str, description: str) -> InMemoryInstrument:
+        with self._lock:
+            instrument = self._instruments.get(name)
+            if instrument is None:
+                instrument = self._instruments[name] = InMemoryInstrument(name, kind, unit, description)
+            return instrument
+
+    def create_counter(self, name: str, unit: str = "", description: str = "") -> InMemoryInstrument:
+        return self._create(name, "counter", unit, description)
+
+    def create_up_down_counter(self, name: str, unit: str = "", description: str = "") -> InMemoryInstrument:
+        return self._create(name, "up_down_counter", unit, description)
+
+    def create_histogram(self, name: str, unit: str = "", description: str = "", **kwargs) -> InMemoryInstrument:
+        return self._create(name, "histogram", unit, description)
+
+    def get_points(self, name: str, **attributes) -> List[MetricPoint]:
+        """
+        Returns the measurements of an instrument.
+        :param name: the name of the instrument.
+        :param attributes: only returns the measurements with these attribute values.
+        """
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            return []
+        with instrument._lock:
+            points = list(instrument.points)
+        return [point for point in points if all(point.attributes.get(key) == value for key, value in attributes.items())]
+
+    def sum(self, name: str, **attributes) -> Union[int, float]:
+        """The sum of the measurements of an instrument - the value of a counter, or the total of a histogram."""
+        return sum(point.value for point in self.get_points(name, **attributes))
+
+    def count(self, name: str, **attributes) -> int:
+        """The number of measurements of an instrument."""
+        return len(self.get_points(name, **attributes))
+
+    def clear(self):
+        """Drops the measurements recorded so far."""
+        with self._lock:
+            instruments = list(self._instruments.values())
+        for instrument in instruments:
+            with instrument._lock:
+                instrument.points.clear()
@@ -0,0 +1,172 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import json
+from typing import Any, Dict, Optional
+
+from . import _converters
+from .request_hooks import RequestEvent
+
+# The event type of the QueryCompletionInformation row holding the resource consumption of the query
+_RESOURCE_CONSUMPTION_EVENT = "QueryResourceConsumption"
+
+
+class QueryProfile:
+    """
+    The server side statistics of a query, from the QueryResourceConsumption row of its QueryCompletionInformation table,
+    combined with the client side timings of its request.
+    Statistics the service did not report are None.
+    """
+
+    client_request_id: Optional[str]
+    "The client request id of the query."
+
+    activity_id: Optional[str]
+    "The service's activity id of the query."
+
+    execution_seconds: Optional[float]
+    "The time the service spent executing the query."
+
+    cpu_user_seconds: Optional[float]
+    "The CPU time the query spent in user mode, across all nodes."
+
+    cpu_kernel_seconds: Optional[float]
+    "The CPU time the query spent in kernel mode, across all nodes."
+
+    cpu_total_seconds: Optional[float]
+    "The total CPU time of the query, across all nodes."
+
+    memory_peak_per_node: Optional[int]
+    "The peak memory the query used on a single node, in bytes."
+
+    memory_cache_hits: Optional[int]
+    "The data the query found in the memory cache."
+
+    memory_cache_misses: Optional[int]
+    "The data the query did not find in the memory cache."
+
+    disk_cache_hits: Optional[int]
+    "The data the query found in the disk cache."
+
+    disk_cache_misses: Optional[int]
+    "The data the query did not find in the disk cache."
+
+    shard_hot_hit_bytes: Optional[int]
+    "The bytes of hot data the query found in the shard cache."
+
+    shard_hot_miss_bytes: Optional[int]
+    "The bytes of hot data the query did not find in the shard cache, and had to retrieve."
+
+    extents_total: Optional[int]
+    "The number of extents in the scope of the query."
+
+    extents_scanned: Optional[int]
+    "The number of extents the query scanned."
+
+    rows_total: Optional[int]
+    "The number of rows in the scope of the query."
+
+    rows_scanned: Optional[int]
+    "The number of rows the query scanned."
+
+    result_row_count: Optional[int]
+    "The number of rows in the results of the query, as reported by the service."
+
+    result_size: Optional[int]
+    "The size of the results of the query in bytes, as reported by the service."
+
+    client_seconds: Optional[float]
+    "The time from starting the request until its response was parsed - for streaming queries, until it was read to its end."
+
+    request_event: Optional[RequestEvent]
+    "The timings of the phases of the request, if the client had request hooks (or metrics) when it was sent."
+
+    resource_consumption: Dict[str, Any]
+    "The QueryResourceConsumption payload as returned by the service, including statistics that have no attribute."
+
+    def __init__(self, resource_consumption: Dict[str, Any], client_request_id: Optional[str] = None, activity_id: Optional[str] = None):
+        self.resource_consumption = resource_consumption
+        self.client_request_id = client_request_id
+        self.activity_id = activity_id
+        self.client_seconds = None
+        self.request_event = None
+
+        self.execution_seconds = resource_consumption.get("ExecutionTime")
+
+        usage = resource_consumption.get("resource_usage") or {}
+        cpu = usage.get("cpu") or {}
+        self.cpu_user_seconds = _to_seconds(cpu.get("user"))
+        self.cpu_kernel_seconds = _to_seconds(cpu.get("kernel"))
+        self.cpu_total_seconds = _to_seconds(cpu.get("total cpu"))
+        self.memory_peak_per_node = (usage.get("memory") or {}).get("peak_per_node")
+
+        cache = usage.get("cache") or {}
+        memory_cache = cache.get("memory") or {}
+        disk_cache = cache.get("disk") or {}
+        hot_shards = (cache.get("shards") or {}).get("hot") or {}
+        self.memory_cache_hits = memory_cache.get("hits")
+        self.memory_cache_misses = memory_cache.get("misses")
+        self.disk_cache_hits = disk_cache.get("hits")
+        self.disk_cache_misses = disk_cache.get("misses")
+        self.shard_hot_hit_bytes = hot_shards.get("hitbytes")
+        self.shard_hot_miss_bytes = hot_shards.get("missbytes")
+
+        input_statistics = resource_consumption.get("input_dataset_statistics") or {}
+        extents = input_statistics.get("extents") or {}
+        rows = input_statistics.get("rows") or {}
+        self.extents_total = extents.get("total")
+        self.extents_scanned = extents.get("scanned")
+        self.rows_total = rows.get("total")
+        self.rows_scanned = rows.get("scanned")
+
+        dataset_statistics = resource_consumption.get("dataset_statistics")
+        if dataset_statistics:
+            self.result_row_count = sum(table.get("table_row_count", 0) for table in dataset_statistics)
+            self.result_size = sum(table.get("table_size", 0) for table in dataset_statistics)
+        else:
+            self.result_row_count = None
+            self.result_size = None
+
+    @property
+    def cache_hit_ratio(self) -> Optional[float]:
+        """The fraction of the data the query read from the memory and disk caches, or None if it read no data."""
+        hits = (self.memory_cache_hits or 0) + (self.disk_cache_hits or 0)
+        total = hits + (self.memory_cache_misses or 0) + (self.disk_cache_misses or 0)
+        return hits / total if total else None
+
+    @property
+    def client_overhead_seconds(self) -> Optional[float]:
+        """The part of the client's time that the service did not spend executing the query - the network, queuing, and reading the response."""
+        if self.client_seconds is None or self.execution_seconds is None:
+            return None
+        return self.client_seconds - self.execution_seconds
+
+    @classmethod
+    def _from_completion_information(cls, table) -> Optional["QueryProfile"]:
+        """Parses the QueryResourceConsumption row of a QueryCompletionInformation table, if it has one."""
+        # V1 responses (of management commands) report their status without resource consumption
+        if not any(column.column_name == "EventTypeName" for column in table.columns):
+            return None
+        for row in table:
+            if row["EventTypeName"] != _RESOURCE_CONSUMPTION_EVENT:
+                continue
+            payload = row["Payload"]
+            if isinstance(payload, str):
+                try:
+                    payload = json.loads(payload)
+                except ValueError:
+                    return None
+            if not isinstance(payload, dict):
+                return None
+            return cls(payload, row["ClientRequestId"], row["ActivityId"])
+        return None
+
+    def __repr__(self):
+        return "QueryProfile(client_request_id={}, execution_seconds={}, client_seconds={}, cpu_total_seconds={}, memory_peak_per_node={}, cache_hit_ratio={})".format(
+            self.client_request_id, self.execution_seconds, self.client_seconds, self.cpu_total_seconds, self.memory_peak_per_node, self.cache_hit_ratio
+        )
+
+
+def _to_seconds(timespan: Optional[str]) -> Optional[float]:
+    if timespan is None:
+        return None
+    return _converters.to_timedelta(timespan).total_seconds()
@@ -0,0 +1,182 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import threading
+import time
+from typing import Optional, Tuple
+
+
+class RequestEvent:
+    """
+    The phases of a single request, passed to the request hooks of a client.
+    Times are values of time.perf_counter(), set as each phase ends, so durations are differences between them.
+    """
+
+    endpoint: str
+    "The endpoint the request is sent to."
+
+    client_request_id: Optional[str]
+    "The client request id of the request."
+
+    database: Optional[str]
+    "The database of a query or a command. Not set for streaming ingestion, whose endpoint holds its database."
+
+    is_streaming: bool
+    "Whether the response is streamed (execute_streaming_query), rather than read and parsed as a whole."
+
+    start_time: float
+    "When the request started, before the token was acquired."
+
+    send_time: Optional[float]
+    "When the token was acquired and the request was handed to the HTTP session."
+
+    connection_time: Optional[float]
+    "When a connection was taken from the pool (or opened) for the request."
+
+    headers_time: Optional[float]
+    "When the response headers were received."
+
+    body_time: Optional[float]
+    "When the response body was read. For streamed responses - when the stream was read to its end."
+
+    parse_time: Optional[float]
+    "When the response was parsed. Not set for streamed responses, which are parsed while they are read."
+
+    status_code: Optional[int]
+    "The HTTP status of the response."
+
+    response_bytes: Optional[int]
+    "The size of the response body, after it was decompressed."
+
+    row_count: Optional[int]
+    "The number of rows in the primary results."
+
+    _hook: "RequestHook"
+    # The slow query log of the client, and the text of the query it records the hash of - set only while the client has a log
+    _slow_query_log = None
+    _query: Optional[str] = None
+
+    def __init__(self, endpoint: str, client_request_id: Optional[str], is_streaming: bool = False, database: Optional[str] = None):
+        self.endpoint = endpoint
+        self.client_request_id = client_request_id
+        self.database = database
+        self.is_streaming = is_streaming
+        self.start_time = time.perf_counter()
+        self.send_time = None
+        self.connection_time = None
+        self.headers_time = None
+        self.body_time = None
+        self.parse_time = None
+        self.status_code = None
+        self.response_bytes = None
+        self.row_count = None
+
+    @staticmethod
+    def _duration(start: Optional[float], end: Optional[float]) -> Optional[float]:
+        return None if start is None or end is None else end - start
+
+    @property
+    def token_seconds(self) -> Optional[float]:
+        """The time it took to acquire the token (and validate the endpoint)."""
+        return self._duration(self.start_time, self.send_time)
+
+    @property
+    def connection_seconds(self) -> Optional[float]:
+        """The time it took to get a connection, including waiting for a free one."""
+        return self._duration(self.send_time, self.connection_time)
+
+    @property
+    def time_to_first_byte_seconds(self) -> Optional[float]:
+        """The time from sending the request to receiving the response headers - including getting a connection."""
+        return self._duration(self.send_time, self.headers_time)
+
+    @property
+    def download_seconds(self) -> Optional[float]:
+        return self._duration(self.headers_time, self.body_time)
+
+    @property
+    def parse_seconds(self) -> Optional[float]:
+        return self._duration(self.body_time, self.parse_time)
+
+    def __repr__(self):
+        return "RequestEvent(endpoint={}, client_request_id={}, status_code={}, response_bytes={}, row_count={})".format(
+            self.endpoint, self.client_request_id, self.status_code, self.response_bytes, self.row_count
+        )
+
+
+class RequestHook:
+    """
+    Receives the phases of the requests of a client, registered with KustoClient.add_request_hook.
+    Override the phases of interest - each one is called with the same RequestEvent, as the phase ends.
+    Hooks are called on the requesting thread (or event loop), so they should be quick. Exceptions they raise fail the request.
+    """
+
+    def before_request(self, event: RequestEvent):
+        """Called once the token was acquired, right before the request is sent."""
+
+    def after_headers(self, event: RequestEvent):
+        """Called once the response headers were received."""
+
+    def after_body(self, event: RequestEvent):
+        """Called once the response body was read. Not called for streamed responses that aren't read to their end."""
+
+    def after_parse(self, event: RequestEvent):
+        """Called once a successful response was parsed. Not called for streamed responses."""
+
+
+class _CompositeRequestHook(RequestHook):
+    def __init__(self, hooks: Tuple[RequestHook, ...]):
+        self.hooks = hooks
+
+    def before_request(self, event: RequestEvent):
+        for hook in self.hooks:
+            hook.before_request(event)
+
+    def after_headers(self, event: RequestEvent):
+        for hook in self.hooks:
+            hook.after_headers(event)
+
+    def after_body(self, event: RequestEvent):
+        for hook in self.hooks:
+            hook.after_body(event)
+
+    def after_parse(self, event: RequestEvent):
+        for hook in self.hooks:
+            hook.after_parse(event)
+
+
+# The event of the request the current thread is sending, for the connection pool to time the connection of - set only while there are hooks
+_current_request = threading.local()
+
+
+def _set_connection_time():
+    event = getattr(_current_request, "event", None)
+    if event is not None and event.connection_time is None:
+        event.connection_time = time.perf_counter()
+
+
+class _HookedResponseStream:
+    """Wraps a streamed response body, to count its bytes and call after_body once it was read to its end."""
+
+    def __init__(self, stream, event: RequestEvent):
+        self._stream = stream
+        self._event = event
+        event.response_bytes = 0
+
+    def read(self, size: int = -1):
+        data = self._stream.read(size)
+        self._on_read(data, size)
+        return data
+
+    def _on_read(self, data, size: int):
+        if data:
+            self._event.response_bytes += len(data)
+        elif size != 0 and self._event.body_time is None:
+            self._event.body_time = time.perf_counter()
+            self._event._hook.after_body(self._event)
+
+
+class _AsyncHookedResponseStream(_HookedResponseStream):
+    async def read(self, size: int = -1):
+        data = await self._stream.read(size)
+        self._on_read(data, size)
+        return data
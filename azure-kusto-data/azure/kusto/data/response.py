@@ -1,10 +1,13 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
+import time
 from abc import ABCMeta, abstractmethod
-from typing import List, Iterator, Union, Dict, Any
+from typing import List, Iterator, Optional, Union, Dict, Any
 
 from ._models import KustoResultTable, WellKnownDataSet, KustoStreamingResultTable, BaseKustoResultTable
 from .exceptions import KustoStreamingQueryError
+from .query_profile import QueryProfile
+from .request_hooks import RequestEvent
 from .streaming_response import StreamingDataSetEnumerator, FrameType
 
 
@@ -13,6 +16,11 @@ class BaseKustoResponseDataSet(metaclass=ABCMeta):
     tables_count: int
     tables_names: list
 
+    # The client side timings of the request, set by the client that received the response
+    _client_start_time: Optional[float] = None
+    _client_end_time: Optional[float] = None
+    _request_event: Optional[RequestEvent] = None
+
     @property
     @abstractmethod
     def _error_column(self) -> str:
@@ -59,6 +67,37 @@ class BaseKustoResponseDataSet(metaclass=ABCMeta):
                 )
         return result
 
+    @property
+    def query_profile(self) -> Optional[QueryProfile]:
+        """
+        The server side statistics of the query (execution time, CPU, memory, cache and result size), with the client side timings of its request.
+        None if the response has no resource consumption, like responses of management commands.
+        """
+        query_status_table = next((t for t in self.tables if t.table_kind == WellKnownDataSet.QueryCompletionInformation), None)
+        if not query_status_table:
+            return None
+        profile = QueryProfile._from_completion_information(query_status_table)
+        if profile is None:
+            return None
+        if self._client_start_time is not None and self._client_end_time is not None:
+            profile.client_seconds = self._client_end_time - self._client_start_time
+        profile.request_event = self._request_event
+        return profile
+
+    def _set_client_timings(self, start_time: float, request_event: Optional[RequestEvent] = None):
+        """Called by the client once the response was parsed, with the time the request started."""
+        self._client_start_time = start_time
+        self._client_end_time = time.perf_counter()
+        self._request_event = request_event
+
+    def _set_finished(self):
+        """Called by streamed data sets once they were read to their end."""
+        self.finished = True
+        self._client_end_time = time.perf_counter()
+        event = self._request_event
+        if event is not None and event._slow_query_log is not None:
+            event._slow_query_log._observe(event, self)
+
     def __iter__(self) -> Iterator[BaseKustoResultTable]:
         return iter(self.tables)
 
@@ -182,7 +221,7 @@ class KustoStreamingResponseDataSet(BaseKustoResponseDataSet):
             try:
                 table = next(self.streamed_data)
             except StopIteration:
-                self.finished = True
+                self._set_finished()
                 raise
             if table["FrameType"] == FrameType.DataTable:
                 break
@@ -209,6 +248,12 @@ class KustoStreamingResponseDataSet(BaseKustoResponseDataSet):
             raise KustoStreamingQueryError("Unable to get errors count before reading all of the tables.")
         return super().get_exceptions()
 
+    @property
+    def query_profile(self) -> Optional[QueryProfile]:
+        if not self.finished:
+            raise KustoStreamingQueryError("Unable to get the query profile before reading all of the tables.")
+        return super().query_profile
+
     def __getitem__(self, key) -> KustoResultTable:
         if isinstance(key, int):
             return self.tables[key]
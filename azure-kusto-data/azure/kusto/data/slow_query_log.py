@@ -0,0 +1,242 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import hashlib
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from . import metrics
+from .query_profile import QueryProfile
+from .request_hooks import RequestEvent
+
+LOGGER_NAME = "azure.kusto.data.slow_query_log"
+
+# Values of SlowQueryRecord.exceeded
+LATENCY = "latency"
+ROWS = "rows"
+BYTES = "bytes"
+
+
+class SlowQueryRecord:
+    """A request that exceeded a threshold of a SlowQueryLog."""
+
+    timestamp: float
+    "When the request completed, as a value of time.time()."
+
+    operation: str
+    "The kind of the request - one of the operation values of azure.kusto.data.metrics (query, mgmt, streaming_query or streaming_ingest)."
+
+    database: str
+    "The database of the request."
+
+    client_request_id: Optional[str]
+    "The client request id of the request."
+
+    query_hash: Optional[str]
+    "A hash of the full text of the query or command, to group the records of the same query without logging it. None for streaming ingestion."
+
+    query_text: Optional[str]
+    "The beginning of the text of the query or command, up to the max_query_length of the log. None if the log doesn't record query texts."
+
+    exceeded: List[str]
+    "The thresholds the request exceeded - LATENCY, ROWS and BYTES."
+
+    duration_seconds: float
+    "The time from starting the request until its response was parsed - for streaming queries, until it was read to its end."
+
+    token_seconds: Optional[float]
+    "The time it took to acquire the token."
+
+    connection_seconds: Optional[float]
+    "The time it took to get a connection."
+
+    time_to_first_byte_seconds: Optional[float]
+    "The time from sending the request to receiving the response headers."
+
+    download_seconds: Optional[float]
+    "The time it took to read the response body."
+
+    parse_seconds: Optional[float]
+    "The time it took to parse the response. None for streaming queries, which are parsed while they are read."
+
+    status_code: Optional[int]
+    "The HTTP status of the response."
+
+    row_count: Optional[int]
+    "The number of rows in the primary results."
+
+    response_bytes: Optional[int]
+    "The size of the response body."
+
+    query_profile: Optional[QueryProfile]
+    "The server side statistics of the query, if its response reported them (management commands and streaming ingestion don't)."
+
+    suppressed: int
+    "The number of records the log dropped because of its rate limit since the previous record."
+
+    def __init__(self, event: RequestEvent, end_time: float, exceeded: List[str], query_profile: Optional[QueryProfile], max_query_length: int):
+        self.timestamp = time.time()
+        self.operation = metrics._operation_of(event)
+        self.database = metrics._database_of(event)
+        self.client_request_id = event.client_request_id
+        query = event._query
+        self.query_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()[:16] if query is not None else None
+        self.query_text = query[:max_query_length] if query is not None and max_query_length > 0 else None
+        self.exceeded = exceeded
+        self.duration_seconds = end_time - event.start_time
+        self.token_seconds = event.token_seconds
+        self.connection_seconds = event.connection_seconds
+        self.time_to_first_byte_seconds = event.time_to_first_byte_seconds
+        self.download_seconds = event.download_seconds
+        self.parse_seconds = event.parse_seconds
+        self.status_code = event.status_code
+        self.row_count = event.row_count
+        self.response_bytes = event.response_bytes
+        self.query_profile = query_profile
+        self.suppressed = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The record as a JSON serializable dict, with the server side statistics under "server"."""
+        result = {
+            key: getattr(self, key)
+            for key in (
+                "timestamp",
+                "operation",
+                "database",
+                "client_request_id",
+                "query_hash",
+                "query_text",
+                "exceeded",
+                "duration_seconds",
+                "token_seconds",
+                "connection_seconds",
+                "time_to_first_byte_seconds",
+                "download_seconds",
+                "parse_seconds",
+                "status_code",
+                "row_count",
+                "response_bytes",
+                "suppressed",
+            )
+        }
+        profile = self.query_profile
+        if profile is not None:
+            result["server"] = {
+                "execution_seconds": profile.execution_seconds,
+                "cpu_total_seconds": profile.cpu_total_seconds,
+                "memory_peak_per_node": profile.memory_peak_per_node,
+                "cache_hit_ratio": profile.cache_hit_ratio,
+                "extents_scanned": profile.extents_scanned,
+                "extents_total": profile.extents_total,
+                "rows_scanned": profile.rows_scanned,
+                "rows_total": profile.rows_total,
+                "result_row_count": profile.result_row_count,
+                "result_size": profile.result_size,
+            }
+        return result
+
+    def __repr__(self):
+        return "SlowQueryRecord(operation={}, database={}, client_request_id={}, exceeded={}, duration_seconds={})".format(
+            self.operation, self.database, self.client_request_id, self.exceeded, self.duration_seconds
+        )
+
+
+def logging_sink(record: SlowQueryRecord):
+    """The default sink of SlowQueryLog - logs the record as JSON, as a warning of the "azure.kusto.data.slow_query_log" logger."""
+    logging.getLogger(LOGGER_NAME).warning("Slow Kusto request: %s", json.dumps(record.to_dict()))
+
+
+class SlowQueryLog:
+    """
+    Records the requests of the clients it is set on (with KustoClient.set_slow_query_log) that exceed a threshold - queries, management commands,
+    streaming queries (once they were read to their end) and streaming ingestions. Requests that fail are not recorded.
+    A log can be shared by many clients, and costs nothing for requests under its thresholds besides timing them.
+    Usage: client.set_slow_query_log(SlowQueryLog(latency_threshold_seconds=2, row_count_threshold=1_000_000, sink=records.append))
+    """
+
+    def __init__(
+        self,
+        latency_threshold_seconds: Optional[float] = 5.0,
+        row_count_threshold: Optional[int] = None,
+        response_bytes_threshold: Optional[int] = None,
+        sink: Callable[[SlowQueryRecord], None] = logging_sink,
+        max_records_per_second: float = 1.0,
+        sample_rate: float = 1.0,
+        max_query_length: int = 128,
+    ):
+        """
+        :param latency_threshold_seconds: record requests that took longer, from starting them until their response was parsed (or read, for streaming queries).
+        :param row_count_threshold: record requests whose primary results had more rows.
+        :param response_bytes_threshold: record requests whose response body was larger.
+        :param sink: called with every SlowQueryRecord. Exceptions it raises are logged to the "azure.kusto.data.slow_query_log" logger, and don't fail the request.
+        :param max_records_per_second: the rate limit of the log - records over it are dropped, and counted by the suppressed field of the next record.
+            Bursts of up to a second's worth of records are allowed.
+        :param sample_rate: the fraction of the requests over a threshold to record.
+        :param max_query_length: the length of the beginning of the query text to include in the records. 0 leaves the text out, keeping only its hash.
+        """
+        if max_records_per_second <= 0:
+            raise ValueError("max_records_per_second must be positive")
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.latency_threshold_seconds = latency_threshold_seconds
+        self.row_count_threshold = row_count_threshold
+        self.response_bytes_threshold = response_bytes_threshold
+        self.sink = sink
+        self.max_records_per_second = max_records_per_second
+        self.sample_rate = sample_rate
+        self.max_query_length = max_query_length
+
+        self._capacity = max(1.0, max_records_per_second)
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        self._suppressed = 0
+        self._lock = threading.Lock()
+
+    def _observe(self, event: RequestEvent, response: Any):
+        """Called by the clients once the response of a request with the log was parsed, or a streamed response was read to its end."""
+        end_time = event.parse_time or event.body_time or time.perf_counter()
+        profile = None
+        exceeded = []
+        if self.latency_threshold_seconds is not None and end_time - event.start_time > self.latency_threshold_seconds:
+            exceeded.append(LATENCY)
+        if self.row_count_threshold is not None:
+            row_count = event.row_count
+            if row_count is None:
+                # Streamed rows aren't counted by the client, so the service's count is used
+                profile = response.query_profile
+                row_count = profile.result_row_count if profile is not None else None
+            if row_count is not None and row_count > self.row_count_threshold:
+                exceeded.append(ROWS)
+        if self.response_bytes_threshold is not None and event.response_bytes is not None and event.response_bytes > self.response_bytes_threshold:
+            exceeded.append(BYTES)
+        if not exceeded or (self.sample_rate < 1.0 and random.random() >= self.sample_rate):
+            return
+
+        suppressed = self._acquire()
+        if suppressed is None:
+            return
+        if profile is None:
+            profile = response.query_profile
+        record = SlowQueryRecord(event, end_time, exceeded, profile, self.max_query_length)
+        record.suppressed = suppressed
+        try:
+            self.sink(record)
+        except Exception:
+            # Only records within the rate limit get here, so failures are logged at the same rate
+            logging.getLogger(LOGGER_NAME).exception("The sink of the slow query log failed to record %r", record)
+
+    def _acquire(self) -> Optional[int]:
+        """Takes a token of the rate limit, returning the number of records suppressed since the previous one - or None if the record is suppressed."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._capacity, self._tokens + (now - self._last_refill) * self.max_records_per_second)
+            self._last_refill = now
+            if self._tokens < 1.0:
+                self._suppressed += 1
+                return None
+            self._tokens -= 1.0
+            suppressed, self._suppressed = self._suppressed, 0
+            return suppressed
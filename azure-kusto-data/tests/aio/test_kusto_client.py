@@ -1,5 +1,8 @@
 """Tests for KustoClient."""
+import asyncio
 import json
+import logging
+import socket
 import sys
 from unittest.mock import patch
 
@@ -10,8 +13,9 @@ from azure.kusto.data._decorators import aio_documented_by
 from azure.kusto.data.client_request_properties import ClientRequestProperties
 from azure.kusto.data.exceptions import KustoClosedError, KustoMultiApiError, KustoNetworkError
 from azure.kusto.data.helpers import dataframe_from_result_table
-from ..kusto_client_common import KustoClientTestsMixin, mocked_requests_post, proxy_kcsb
+from ..kusto_client_common import KeepAliveServer, KustoClientTestsMixin, RecordingRequestHook, mocked_requests_post, proxy_kcsb
 from ..test_kusto_client import TestKustoClient as KustoClientTestsSync
+from azure.kusto.data.client import KustoClient as KustoClientSync
 
 PANDAS = False
 try:
@@ -74,6 +78,48 @@ class TestKustoClient(KustoClientTestsMixin):
             self._assert_client_request_id(first_request[0].kwargs)
         self._assert_sanity_query_response(response)
 
+    @aio_documented_by(KustoClientTestsSync.test_request_hooks)
+    @pytest.mark.asyncio
+    async def test_request_hooks(self):
+        hook = RecordingRequestHook()
+        with aioresponses() as aioresponses_mock:
+            self._mock_query(aioresponses_mock)
+            async with KustoClient(self.HOST) as client:
+                client.add_request_hook(hook)
+                response = await client.execute_query("PythonTest", "Deft")
+        self._assert_sanity_query_response(response)
+
+        event = hook.phases[0][1]
+        assert [phase for phase, _ in hook.phases] == ["before_request", "after_headers", "after_body", "after_parse"]
+        assert event.client_request_id.startswith("KPC.execute;") and event.status_code == 200
+        assert event.response_bytes > 0 and event.row_count == 11
+        assert event.start_time <= event.send_time <= event.headers_time <= event.body_time <= event.parse_time
+
+    @aio_documented_by(KustoClientTestsSync.test_query_profile)
+    @pytest.mark.asyncio
+    async def test_query_profile(self):
+        with aioresponses() as aioresponses_mock:
+            self._mock_query(aioresponses_mock)
+            self._mock_mgmt(aioresponses_mock)
+            async with KustoClient(self.HOST) as client:
+                response = await client.execute_query("PythonTest", "Deft")
+                mgmt_response = await client.execute_mgmt("NetDefaultDB", ".show version")
+        self._assert_query_profile(response.query_profile)
+        assert mgmt_response.query_profile is None
+
+    @aio_documented_by(KustoClientTestsSync.test_request_hook_connection_time)
+    @pytest.mark.asyncio
+    async def test_request_hook_connection_time(self):
+        hook = RecordingRequestHook()
+        with KeepAliveServer() as server:
+            async with KustoClient(server.url) as client:
+                client.add_request_hook(hook)
+                await client.execute_query("db", "query")
+
+        event = hook.phases[0][1]
+        assert event.send_time <= event.connection_time <= event.headers_time <= event.body_time <= event.parse_time
+        assert (event.response_bytes, event.row_count) == (2, 0)
+
     @pytest.mark.asyncio
     async def test_raise_network(self):
         with aioresponses() as aioresponses_mock:
@@ -201,3 +247,53 @@ range x from 1 to 10 step 1"""
                 client._aad_helper.token_provider._init_resources()
 
                 mock_get.assert_called_with("https://somecluster.kusto.windows.net/v1/rest/auth/metadata", proxies=expected_dict, allow_redirects=False)
+
+    @aio_documented_by(KustoClientTestsSync.test_warm_up_and_pool_metrics)
+    @pytest.mark.asyncio
+    async def test_warm_up_and_pool_metrics(self):
+        with KeepAliveServer() as server:
+            async with KustoClient(server.url) as client:
+                await client.warm_up(connections=3)
+                metrics = client.get_pool_metrics()
+                assert (metrics.max_size, metrics.in_use, metrics.idle, metrics.connections_created, metrics.connections_acquired) == (100, 0, 3, 3, 3)
+                assert server.wait_for_connections(3)
+
+                # Idle connections are reused
+                await client.warm_up(connections=2)
+                metrics = client.get_pool_metrics()
+                assert (metrics.idle, metrics.connections_created, metrics.connections_acquired) == (3, 3, 5)
+
+            async with KustoClient(server.url + ";Max Connections=2") as client:
+                await client.warm_up(connections=5)
+                metrics = client.get_pool_metrics()
+                assert (metrics.max_size, metrics.idle, metrics.connections_created) == (2, 2, 2)
+
+    @pytest.mark.asyncio
+    async def test_connector_options(self):
+        with KeepAliveServer() as server:
+            async with KustoClient(server.url, max_connections=1, max_connections_per_host=1, keepalive_timeout=30, dns_cache_ttl=None) as client:
+                connector = client._session.connector
+                assert (connector.limit, connector.limit_per_host, connector.use_dns_cache) == (1, 1, True)
+
+                # Requests over the limit are queued, and counted
+                await asyncio.gather(*(client._open_connection() for _ in range(3)))
+                metrics = client.get_pool_metrics()
+                assert (metrics.connections_created, metrics.connections_acquired, metrics.requests_queued, metrics.waiting) == (1, 3, 2, 0)
+                assert metrics.max_wait_seconds > 0
+
+                # Connections get the same TCP keep-alive options as the sync client's
+                (protocol, _), *_ = next(iter(connector._conns.values()))
+                sock = protocol.transport.get_extra_info("socket")
+                for level, option, value in KustoClientSync.compose_socket_options():
+                    assert sock.getsockopt(level, option) == value
+
+    @pytest.mark.asyncio
+    async def test_connector_option_failures_are_logged_once(self, caplog):
+        with KeepAliveServer() as server:
+            async with KustoClient(server.url) as client:
+                # An option the platform doesn't support fails every connection, but is only logged once
+                client._session.connector._socket_options = [(socket.SOL_SOCKET, 0x7FFF, 1)]
+                with caplog.at_level(logging.WARNING, logger="azure.kusto.data.aio._connector"):
+                    await asyncio.gather(*(client._open_connection() for _ in range(3)))
+                assert client.get_pool_metrics().connections_created > 1
+                assert len(caplog.records) == 1
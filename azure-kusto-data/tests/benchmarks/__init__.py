@@ -0,0 +1,15 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+"""
+Benchmarks of parsing query responses and of querying a local fake server, across small, wide and tall results.
+With azure-kusto-ingest installed, also the MB/s of reading a stream through the buffered prefix and chained remainder of ManagedStreamingIngestClient
+(1GB, times --scale).
+
+Run them (from the azure-kusto-data directory) with:
+    python -m tests.benchmarks --save                # measure, and store the results as the baseline
+    python -m tests.benchmarks --threshold 0.2       # measure, and fail if any benchmark got over 20% slower than the baseline
+    python -m tests.benchmarks --filter tall --scale 0.1
+    python -m tests.benchmarks --filter managed_streaming --rounds 3   # the stream benchmark alone, on 1GB
+
+Baselines are stored in .benchmarks/baseline.json by default. They depend on the machine, so compare only runs of the same machine.
+"""
@@ -0,0 +1,58 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import argparse
+import asyncio
+import os
+import sys
+from contextlib import ExitStack
+from typing import Optional, Sequence
+
+from .harness import find_regressions, format_results, load_baseline, measure, save_baseline
+from .suite import SHAPES, build_benchmarks
+
+DEFAULT_BASELINE = os.path.join(".benchmarks", "baseline.json")
+
+
+def main(args: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m tests.benchmarks", description="Benchmarks of the azure-kusto-data query and parsing paths.")
+    parser.add_argument("--shapes", default=",".join(SHAPES), help="The comma separated result shapes to benchmark, out of: {}.".format(", ".join(SHAPES)))
+    parser.add_argument("--filter", default=None, help="Only run the benchmarks whose name contains this text.")
+    parser.add_argument("--scale", type=float, default=1.0, help="A factor of the rows (or bytes) of every benchmark.")
+    parser.add_argument("--rounds", type=int, default=5, help="The measured rounds of every benchmark, after a warm up round.")
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="Stop measuring a benchmark after this long, even before all of its rounds.")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="The baseline file to compare to, or to save to.")
+    parser.add_argument("--save", action="store_true", help="Save the results as the baseline, instead of comparing to it.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="The fraction a benchmark may get slower than its baseline before it fails the run.")
+    options = parser.parse_args(args)
+
+    loop = asyncio.new_event_loop()
+    try:
+        with ExitStack() as stack:
+            benchmarks = build_benchmarks(stack, loop, options.shapes.split(","), options.scale, options.filter)
+            results = []
+            for benchmark in benchmarks:
+                results.append(measure(benchmark, options.rounds, options.max_seconds, loop))
+                print("{}: {:.3f}ms".format(benchmark.name, results[-1].median * 1000), file=sys.stderr)
+    finally:
+        loop.close()
+
+    if options.save:
+        os.makedirs(os.path.dirname(os.path.abspath(options.baseline)), exist_ok=True)
+        save_baseline(options.baseline, results)
+        print(format_results(results))
+        print("Saved the baseline to {}".format(options.baseline))
+        return 0
+
+    baseline = load_baseline(options.baseline) if os.path.exists(options.baseline) else None
+    print(format_results(results, baseline))
+    if baseline is None:
+        print("No baseline at {} - run with --save to create one".format(options.baseline))
+        return 0
+    regressions = find_regressions(results, baseline, options.threshold)
+    for regression in regressions:
+        print("REGRESSION: {} is {:.1%} slower than its baseline".format(regression.name, regression.ratio - 1))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class Benchmark:
+    """A measured operation - a function (or a coroutine function) that processes a known number of items (usually rows, or MB for streams) per call."""
+
+    def __init__(self, name: str, run: Callable[[], Any], items: float = 1, is_async: bool = False):
+        self.name = name
+        self.run = run
+        self.items = items
+        self.is_async = is_async
+
+
+class BenchmarkResult:
+    """The timings of the rounds of a benchmark."""
+
+    def __init__(self, name: str, seconds: List[float], items: float):
+        self.name = name
+        self.seconds = seconds
+        self.items = items
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.seconds)
+
+    @property
+    def minimum(self) -> float:
+        return min(self.seconds)
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.median if self.median > 0 else float("inf")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"median": self.median, "min": self.minimum, "rounds": len(self.seconds), "items": self.items, "items_per_second": self.items_per_second}
+
+
+class Regression:
+    """A benchmark whose median got slower than its baseline by more than the threshold."""
+
+    def __init__(self, name: str, baseline_median: float, median: float):
+        self.name = name
+        self.baseline_median = baseline_median
+        self.median = median
+
+    @property
+    def ratio(self) -> float:
+        return self.median / self.baseline_median
+
+    def __repr__(self):
+        return "Regression({}: {:.6f}s -> {:.6f}s, x{:.2f})".format(self.name, self.baseline_median, self.median, self.ratio)
+
+
+def measure(benchmark: Benchmark, rounds: int = 5, max_seconds: float = 10.0, loop: Optional[asyncio.AbstractEventLoop] = None) -> BenchmarkResult:
+    """
+    Runs a benchmark once to warm up, and then for the given number of rounds - or fewer, once they took max_seconds.
+    :param loop: the event loop to run async benchmarks on.
+    """
+    if benchmark.is_async:
+        run = lambda: loop.run_until_complete(benchmark.run())
+    else:
+        run = benchmark.run
+    run()
+    seconds = []
+    deadline = time.perf_counter() + max_seconds
+    while len(seconds) < rounds and (not seconds or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    return BenchmarkResult(benchmark.name, seconds, benchmark.items)
+
+
+def to_baseline(results: List[BenchmarkResult]) -> Dict[str, Any]:
+    """The results as a baseline, with the machine they were measured on - baselines are only comparable on the same machine."""
+    return {
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "platform": sys.platform,
+        "results": {result.name: result.to_dict() for result in results},
+    }
+
+
+def save_baseline(path: str, results: List[BenchmarkResult]):
+    with open(path, "w") as f:
+        json.dump(to_baseline(results), f, indent=2, sort_keys=True)
+
+
+def load_baseline(path: str) -> Dict[str, Any]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def find_regressions(results: List[BenchmarkResult], baseline: Dict[str, Any], threshold: float = 0.2) -> List[Regression]:
+    """
+    Compares results to a baseline.
+    :param threshold: the fraction a median may grow by before it is a regression - 0.2 flags benchmarks over 20% slower than their baseline.
+        Benchmarks that are not in the baseline are ignored.
+    """
+    regressions = []
+    for result in results:
+        base = baseline["results"].get(result.name)
+        if base is not None and result.median > base["median"] * (1 + threshold):
+            regressions.append(Regression(result.name, base["median"], result.median))
+    return regressions
+
+
+def format_results(results: List[BenchmarkResult], baseline: Optional[Dict[str, Any]] = None) -> str:
+    lines = ["{:<48} {:>12} {:>12} {:>14} {:>9}".format("benchmark", "median (ms)", "min (ms)", "items/s", "vs base")]
+    for result in results:
+        base = baseline["results"].get(result.name) if baseline else None
+        change = "{:+.1%}".format(result.median / base["median"] - 1) if base else ""
+        lines.append(
+            "{:<48} {:>12.3f} {:>12.3f} {:>14,.0f} {:>9}".format(result.name, result.median * 1000, result.minimum * 1000, result.items_per_second, change)
+        )
+    return "\n".join(lines)
@@ -0,0 +1,232 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import asyncio
+import io
+import json
+from contextlib import ExitStack
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from azure.kusto.data import KustoClient, _converters
+from azure.kusto.data.response import KustoResponseDataSetV2
+from azure.kusto.data.streaming_response import JsonTokenReader, StreamingDataSetEnumerator
+
+from ..fake_kusto_server import DEFAULT_COLUMN_TYPES, VALUE_GENERATORS, FakeKustoServer, ResultShape, v2_frames
+from .harness import Benchmark
+
+PANDAS = False
+try:
+    import pandas
+    from azure.kusto.data.helpers import dataframe_from_result_table
+
+    PANDAS = True
+except ImportError:
+    pass
+
+AIO = False
+try:
+    from azure.kusto.data.aio import KustoClient as AsyncKustoClient
+    from azure.kusto.data.aio.streaming_response import JsonTokenReader as AsyncJsonTokenReader, StreamingDataSetEnumerator as AsyncStreamingDataSetEnumerator
+
+    AIO = True
+except ImportError:
+    pass
+
+INGEST = False
+try:
+    from azure.kusto.ingest._stream_extensions import chain_streams, read_until_size_or_end
+
+    INGEST = True
+except ImportError:
+    pass
+
+# The shapes of the results - rows, columns (None for one per type) and the column types, cycled to the number of columns
+SHAPES: Dict[str, Tuple[int, Optional[int], Sequence[str]]] = {
+    "small": (10, None, DEFAULT_COLUMN_TYPES),
+    "wide": (200, 500, DEFAULT_COLUMN_TYPES),
+    "tall": (50_000, 5, ("long", "string", "real", "datetime", "timespan")),
+}
+
+# The rows of the per column type DataFrame benchmarks, and the values of the converter benchmarks
+DATAFRAME_ROWS = 20_000
+CONVERTER_VALUES = 20_000
+
+# The bytes read through the buffered prefix and chained remainder of ManagedStreamingIngestClient, and the size of its prefix
+STREAM_BYTES = 1024 * 1024 * 1024
+STREAM_PREFIX_BYTES = 4 * 1024 * 1024 + 1
+MB = 1024 * 1024
+
+
+class _AsyncBytesReader:
+    """An in-memory stand-in for aiohttp's StreamReader, to measure the aio parser without the network."""
+
+    def __init__(self, data: bytes):
+        self._stream = io.BytesIO(data)
+
+    async def read(self, size: int = -1) -> bytes:
+        return self._stream.read(size)
+
+
+class _PatternStream(io.RawIOBase):
+    """A non-seekable stream of `size` bytes of a repeating pattern, which doesn't allocate while it is read - so the benchmark measures only the reader."""
+
+    def __init__(self, size: int, pattern: bytes = bytes(range(256)) * 4096):
+        self.remaining = size
+        self.pattern = memoryview(pattern)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        size = min(len(b), len(self.pattern), self.remaining)
+        b[:size] = self.pattern[:size]
+        self.remaining -= size
+        return size
+
+
+def _read_prefix_and_remainder(size: int) -> int:
+    """Reads a stream the way ManagedStreamingIngestClient does - a buffered prefix, and then the prefix chained to the rest of the stream."""
+    source = _PatternStream(size)
+    chained = chain_streams([read_until_size_or_end(source, STREAM_PREFIX_BYTES), source])
+    buffer = memoryview(bytearray(MB))
+    total = 0
+    while True:
+        read = chained.readinto(buffer)
+        if not read:
+            return total
+        total += read
+
+
+def _count_rows(enumerator: StreamingDataSetEnumerator) -> int:
+    rows = 0
+    for frame in enumerator:
+        for _ in frame.get("Rows", ()):
+            rows += 1
+    return rows
+
+
+async def _count_rows_async(enumerator: "AsyncStreamingDataSetEnumerator") -> int:
+    rows = 0
+    while True:
+        try:
+            frame = await enumerator.__anext__()
+        except StopAsyncIteration:
+            return rows
+        frame_rows = frame.get("Rows")
+        if frame_rows is None:
+            continue
+        if isinstance(frame_rows, list):
+            rows += len(frame_rows)
+        else:
+            async for _ in frame_rows:
+                rows += 1
+
+
+def _query_of(rows: int, columns: Optional[int], types: Sequence[str]) -> str:
+    """The query text the fake server answers with a result of the given shape."""
+    query = "rows={} types={}".format(rows, ",".join(types))
+    return query if columns is None else query + " columns={}".format(columns)
+
+
+def _add_shape_benchmarks(add: Callable, shape_name: str, scale: float, client: Callable[[], KustoClient], async_client: Callable[[], "AsyncKustoClient"]):
+    """Adds the benchmarks of a result shape - parsing it in memory, and querying it end to end from the fake server."""
+    rows, columns, types = SHAPES[shape_name]
+    rows = max(1, int(rows * scale))
+    shape = ResultShape(rows, columns, types)
+    body = json.dumps(v2_frames(shape)).encode("utf-8")
+    frames = json.loads(body)
+    query = _query_of(rows, columns, types)
+
+    add("response_v2[{}]".format(shape_name), lambda name: Benchmark(name, lambda: KustoResponseDataSetV2(frames), rows))
+
+    def row_materialization(name):
+        table = KustoResponseDataSetV2(frames).primary_results[0]
+        return Benchmark(name, lambda: sum(1 for _ in table), rows)
+
+    add("row_materialization[{}]".format(shape_name), row_materialization)
+    add(
+        "streaming_enumerator[{}]".format(shape_name),
+        lambda name: Benchmark(name, lambda: _count_rows(StreamingDataSetEnumerator(JsonTokenReader(io.BytesIO(body)))), rows),
+    )
+    add("e2e_query[{}]".format(shape_name), lambda name: Benchmark(name, lambda: client().execute_query("db", query), rows))
+
+    def e2e_streaming_query(name):
+        def run():
+            response = client().execute_streaming_query("db", query)
+            return sum(1 for table in response.iter_primary_results() for _ in table)
+
+        return Benchmark(name, run, rows)
+
+    add("e2e_streaming_query[{}]".format(shape_name), e2e_streaming_query)
+
+    if AIO:
+        add(
+            "streaming_enumerator_aio[{}]".format(shape_name),
+            lambda name: Benchmark(
+                name, lambda: _count_rows_async(AsyncStreamingDataSetEnumerator(AsyncJsonTokenReader(_AsyncBytesReader(body)))), rows, is_async=True
+            ),
+        )
+        add("e2e_query_aio[{}]".format(shape_name), lambda name: Benchmark(name, lambda: async_client().execute_query("db", query), rows, is_async=True))
+
+
+def build_benchmarks(
+    stack: ExitStack, loop: asyncio.AbstractEventLoop, shapes: Sequence[str] = tuple(SHAPES), scale: float = 1.0, name_filter: Optional[str] = None
+) -> List[Benchmark]:
+    """
+    Prepares the benchmarks of the suite - their data is generated once, before they are measured.
+    :param stack: holds the resources of the benchmarks (the fake server and the clients) until it is closed.
+    :param loop: the event loop of the async benchmarks.
+    :param scale: a factor of the number of rows (and values, and stream bytes) of every benchmark - below 1 for quick runs.
+    :param name_filter: only prepares the benchmarks whose name contains it.
+    """
+    benchmarks: List[Benchmark] = []
+    resources = {}
+
+    def add(name: str, factory: Callable[[str], Benchmark]):
+        if name_filter is None or name_filter in name:
+            benchmarks.append(factory(name))
+
+    def server() -> FakeKustoServer:
+        if "server" not in resources:
+            resources["server"] = stack.enter_context(FakeKustoServer())
+        return resources["server"]
+
+    def client() -> KustoClient:
+        if "client" not in resources:
+            resources["client"] = stack.enter_context(KustoClient(server().url))
+        return resources["client"]
+
+    def async_client() -> "AsyncKustoClient":
+        if "async_client" not in resources:
+
+            async def create():
+                return AsyncKustoClient(server().url)
+
+            created = resources["async_client"] = loop.run_until_complete(create())
+            stack.callback(lambda: loop.run_until_complete(created.close()))
+        return resources["async_client"]
+
+    for shape_name in shapes:
+        _add_shape_benchmarks(add, shape_name, scale, client, async_client)
+
+    if PANDAS:
+        dataframe_rows = max(1, int(DATAFRAME_ROWS * scale))
+        for column_type in VALUE_GENERATORS:
+
+            def dataframe(name, column_type=column_type):
+                table = KustoResponseDataSetV2(v2_frames(ResultShape(dataframe_rows, 4, [column_type]))).primary_results[0]
+                return Benchmark(name, lambda: dataframe_from_result_table(table), dataframe_rows)
+
+            add("dataframe[{}]".format(column_type), dataframe)
+
+    values = max(1, int(CONVERTER_VALUES * scale))
+    datetimes = [VALUE_GENERATORS["datetime"](i) for i in range(values)]
+    timespans = [VALUE_GENERATORS["timespan"](i * 7919) for i in range(values)]
+    add("converters[to_datetime]", lambda name: Benchmark(name, lambda: [_converters.to_datetime(value) for value in datetimes], values))
+    add("converters[to_timedelta]", lambda name: Benchmark(name, lambda: [_converters.to_timedelta(value) for value in timespans], values))
+
+    if INGEST:
+        # Always past the prefix, so even quick runs read through the chained remainder. Its items are MB, so its items/s is MB/s
+        stream_bytes = max(2 * STREAM_PREFIX_BYTES, int(STREAM_BYTES * scale))
+        add("managed_streaming_prefix[MB]", lambda name: Benchmark(name, lambda: _read_prefix_and_remainder(stream_bytes), stream_bytes / MB))
+
+    return benchmarks
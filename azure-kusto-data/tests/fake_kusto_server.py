@@ -0,0 +1,424 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+"""
+A local stand-in for a Kusto cluster, for load tests and parsing benchmarks without a real cluster.
+It answers queries (v2/rest/query) with synthetic V2 frames, management commands (v1/rest/mgmt) with the same table as V1, streaming ingestion
+(v1/rest/ingest) with the number of ingested records, and the cloud metadata endpoint (v1/rest/auth/metadata).
+
+The shape of the results is set on the server, and can be overridden per query by the query text, e.g. "rows=1000 columns=20 types=long,string".
+Responses can be delayed, throttled, gzipped and sent in chunks. Bodies are generated once per shape and cached, so the server isn't the bottleneck.
+
+From pytest:
+    with FakeKustoServer(rows=100, column_types=["long", "string"]) as server:
+        with KustoClient(server.url) as client:
+            client.execute_query("db", "rows=10")
+
+From the command line (from the azure-kusto-data directory):
+    python -m tests.fake_kusto_server --port 8080 --rows 100000 --columns 10 --gzip --chunked
+"""
+import argparse
+import gzip
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import unquote, urlparse
+
+QUERY_PATH = "/v2/rest/query"
+MGMT_PATH = "/v1/rest/mgmt"
+INGEST_PATH = "/v1/rest/ingest/"
+METADATA_PATH = "/v1/rest/auth/metadata"
+
+_BASE_DATETIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def _timespan(i: int) -> str:
+    days, seconds = divmod(i, 86400)
+    value = "{:02d}:{:02d}:{:02d}.{:07d}".format(seconds // 3600, seconds // 60 % 60, seconds % 60, i % 10_000_000)
+    return "{}.{}".format(days, value) if days else value
+
+
+# The values of the synthetic columns of each type, by row index, as they appear in V2 frames
+VALUE_GENERATORS: Dict[str, Callable[[int], Any]] = {
+    "bool": lambda i: i % 2 == 0,
+    "int": lambda i: i % 2_147_483_647,
+    "long": lambda i: i * 1_000_003,
+    "real": lambda i: i * 0.25 + 0.1,
+    "decimal": lambda i: "{}.{:02d}".format(i, i % 100),
+    "string": lambda i: "value_{}".format(i),
+    "datetime": lambda i: (_BASE_DATETIME + timedelta(seconds=i, microseconds=i % 1_000_000)).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+    "timespan": _timespan,
+    "guid": lambda i: str(uuid.UUID(int=i)),
+    "dynamic": lambda i: {"id": i, "tags": ["a", "b"], "nested": {"even": i % 2 == 0}},
+}
+
+# The .NET types of the columns in V1 tables
+_V1_DATA_TYPES = {
+    "bool": "Boolean",
+    "int": "Int32",
+    "long": "Int64",
+    "real": "Double",
+    "decimal": "Decimal",
+    "string": "String",
+    "datetime": "DateTime",
+    "timespan": "TimeSpan",
+    "guid": "Guid",
+    "dynamic": "Object",
+}
+
+DEFAULT_COLUMN_TYPES = ("long", "string", "real", "datetime", "bool", "int", "timespan", "guid", "decimal", "dynamic")
+
+CLOUD_METADATA = {
+    "AzureAD": {
+        "LoginEndpoint": "https://login.microsoftonline.com",
+        "LoginMfaRequired": False,
+        "KustoClientAppId": "db662dc1-0cfe-4e1c-a843-19a68e65be58",
+        "KustoClientRedirectUri": "https://microsoft/kustoclient",
+        "KustoServiceResourceId": "https://kusto.dev.kusto.windows.net",
+        "FirstPartyAuthorityUrl": "https://login.microsoftonline.com/f8cdef31-a31e-4b4a-93e4-5f571e91255a",
+    },
+    "dSTS": {
+        "CloudEndpointSuffix": "windows.net",
+        "DstsRealm": "realm://dsts.core.windows.net",
+        "DstsInstance": "prod-dsts.dsts.core.windows.net",
+        "KustoDnsHostName": "kusto.windows.net",
+        "ServiceName": "kusto",
+    },
+}
+
+_THROTTLED_BODY = json.dumps(
+    {
+        "error": {
+            "code": "LimitsExceeded",
+            "message": "Request is throttled by the fake server.",
+            "@type": "Kusto.DataNode.Exceptions.ControlCommandThrottledException",
+            "@permanent": False,
+        }
+    }
+).encode("utf-8")
+
+
+class ResultShape:
+    """The shape of a synthetic result - its row count, and the types of its columns (cycled to its width)."""
+
+    def __init__(self, rows: int = 100, columns: Optional[int] = None, column_types: Sequence[str] = DEFAULT_COLUMN_TYPES):
+        unknown = [t for t in column_types if t not in VALUE_GENERATORS]
+        if unknown or not column_types:
+            raise ValueError("Unsupported column types: {}. Supported types are: {}".format(unknown, ", ".join(VALUE_GENERATORS)))
+        if rows < 0 or (columns is not None and columns < 1):
+            raise ValueError("rows must not be negative, and columns must be positive")
+        self.rows = rows
+        width = len(column_types) if columns is None else columns
+        self.column_types: Tuple[str, ...] = tuple(column_types[i % len(column_types)] for i in range(width))
+
+    @property
+    def columns(self) -> List[Tuple[str, str]]:
+        return [("{}_{}".format(column_type, i), column_type) for i, column_type in enumerate(self.column_types)]
+
+    def with_overrides(self, query: str) -> "ResultShape":
+        """Returns the shape with the overrides of a query text of the form "rows=N columns=N types=a,b" - other texts keep the shape."""
+        overrides = dict(part.split("=", 1) for part in query.replace(";", " ").split() if "=" in part)
+        if not overrides:
+            return self
+        types = overrides["types"].split(",") if "types" in overrides else self.column_types
+        columns = int(overrides["columns"]) if "columns" in overrides else (None if "types" in overrides else len(self.column_types))
+        return ResultShape(int(overrides.get("rows", self.rows)), columns, types)
+
+    def rows_of(self) -> List[List[Any]]:
+        generators = [VALUE_GENERATORS[column_type] for column_type in self.column_types]
+        return [[generate(i) for generate in generators] for i in range(self.rows)]
+
+    def _key(self) -> Tuple[int, Tuple[str, ...]]:
+        return self.rows, self.column_types
+
+
+def v2_frames(shape: ResultShape, table_name: str = "PrimaryResult", client_request_id: str = "") -> List[Dict[str, Any]]:
+    """The V2 frames of a query result of the given shape, including its QueryCompletionInformation."""
+    primary = {
+        "FrameType": "DataTable",
+        "TableId": 1,
+        "TableName": table_name,
+        "TableKind": "PrimaryResult",
+        "Columns": [{"ColumnName": name, "ColumnType": column_type} for name, column_type in shape.columns],
+        "Rows": shape.rows_of(),
+    }
+    resource_consumption = {
+        "ExecutionTime": 0.0,
+        "resource_usage": {
+            "cache": {"memory": {"hits": 0, "misses": 0, "total": 0}, "disk": {"hits": 0, "misses": 0, "total": 0}},
+            "cpu": {"user": "00:00:00", "kernel": "00:00:00", "total cpu": "00:00:00"},
+            "memory": {"peak_per_node": 0},
+        },
+        "dataset_statistics": [{"table_row_count": shape.rows, "table_size": len(json.dumps(primary["Rows"]))}],
+    }
+    completion_columns = ["Timestamp", "ClientRequestId", "ActivityId", "Level", "LevelName", "StatusCode", "StatusCodeName", "EventTypeName", "Payload"]
+    completion_types = ["datetime", "string", "guid", "int", "string", "int", "string", "string", "string"]
+    timestamp = _BASE_DATETIME.strftime("%Y-%m-%dT%H:%M:%SZ")
+    activity_id = str(uuid.UUID(int=0))
+    return [
+        {"FrameType": "DataSetHeader", "IsProgressive": False, "Version": "v2.0"},
+        {
+            "FrameType": "DataTable",
+            "TableId": 0,
+            "TableName": "@ExtendedProperties",
+            "TableKind": "QueryProperties",
+            "Columns": [
+                {"ColumnName": "TableId", "ColumnType": "int"},
+                {"ColumnName": "Key", "ColumnType": "string"},
+                {"ColumnName": "Value", "ColumnType": "dynamic"},
+            ],
+            "Rows": [[1, "Visualization", '{"Visualization":null}']],
+        },
+        primary,
+        {
+            "FrameType": "DataTable",
+            "TableId": 2,
+            "TableName": "QueryCompletionInformation",
+            "TableKind": "QueryCompletionInformation",
+            "Columns": [{"ColumnName": name, "ColumnType": column_type} for name, column_type in zip(completion_columns, completion_types)],
+            "Rows": [
+                [timestamp, client_request_id, activity_id, 4, "Info", 0, "S_OK (0)", "QueryInfo", '{"Count":1,"Text":"Query completed successfully"}'],
+                [timestamp, client_request_id, activity_id, 6, "Stats", 0, "S_OK (0)", "QueryResourceConsumption", json.dumps(resource_consumption)],
+            ],
+        },
+        {"FrameType": "DataSetCompletion", "HasErrors": False, "Cancelled": False},
+    ]
+
+
+def v1_response(shape: ResultShape) -> Dict[str, Any]:
+    """The V1 response of a management command whose result has the given shape."""
+    columns = [{"ColumnName": name, "DataType": _V1_DATA_TYPES[column_type], "ColumnType": column_type} for name, column_type in shape.columns]
+    return {"Tables": [{"TableName": "Table_0", "Columns": columns, "Rows": shape.rows_of()}]}
+
+
+class FakeKustoServer:
+    """
+    A local HTTP server standing in for a Kusto cluster, running on a background thread while it is used as a context manager.
+    :param rows: the default number of rows of query and command results.
+    :param columns: the default number of columns - the column types are cycled to this width. Defaults to one column per type.
+    :param column_types: the default types of the columns, out of VALUE_GENERATORS.
+    :param latency_seconds: how long the server "executes" each request before responding.
+    :param throttle_every: respond to every Nth query, command and ingestion with 429 (Too Many Requests). 0 never throttles.
+    :param gzip: compress responses for clients that accept gzip.
+    :param chunked: send responses with chunked transfer encoding, instead of with a Content-Length.
+    :param chunk_size: the size of the chunks of chunked responses.
+    :param port: the port to listen on - 0 picks a free one.
+    """
+
+    def __init__(
+        self,
+        rows: int = 100,
+        columns: Optional[int] = None,
+        column_types: Sequence[str] = DEFAULT_COLUMN_TYPES,
+        latency_seconds: float = 0.0,
+        throttle_every: int = 0,
+        gzip: bool = False,
+        chunked: bool = False,
+        chunk_size: int = 64 * 1024,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.shape = ResultShape(rows, columns, column_types)
+        self.latency_seconds = latency_seconds
+        self.throttle_every = throttle_every
+        self.gzip = gzip
+        self.chunked = chunked
+        self.chunk_size = chunk_size
+
+        self.request_counts: Dict[str, int] = {}
+        "The number of requests to each path (query, mgmt, ingest and metadata), including throttled ones."
+        self.throttled_count = 0
+        self.ingested_records = 0
+
+        self._bodies: Dict[Tuple[Any, ...], bytes] = {}
+        self._data_requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        self._server.daemon_threads = True
+        self.url = "http://{}:{}".format(host, self._server.server_address[1])
+
+    def _body(self, key: Tuple[Any, ...], create: Callable[[], Any], compress: bool) -> bytes:
+        key = key + (compress,)
+        body = self._bodies.get(key)
+        if body is None:
+            body = json.dumps(create()).encode("utf-8")
+            if compress:
+                body = gzip.compress(body, compresslevel=1)
+            with self._lock:
+                self._bodies[key] = body
+        return body
+
+    def _count(self, path: str) -> bool:
+        """Counts a request, returning whether it should be throttled."""
+        with self._lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+            if path == METADATA_PATH:
+                return False
+            self._data_requests += 1
+            throttled = self.throttle_every > 0 and self._data_requests % self.throttle_every == 0
+            if throttled:
+                self.throttled_count += 1
+            return throttled
+
+    def _create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and bodies are written separately, which Nagle's algorithm would delay on kept-alive connections
+            disable_nagle_algorithm = True
+
+            def _read_body(self) -> bytes:
+                if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(b";", 1)[0], 16)
+                        if size == 0:
+                            self.rfile.readline()
+                            break
+                        chunks.append(self.rfile.read(size))
+                        self.rfile.readline()
+                    body = b"".join(chunks)
+                else:
+                    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Encoding", "").lower() == "gzip":
+                    body = gzip.decompress(body)
+                return body
+
+            def _send(self, status: int, body: bytes, compressed: bool = False, headers: Optional[Dict[str, str]] = None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if compressed:
+                    self.send_header("Content-Encoding", "gzip")
+                if server.chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for start in range(0, len(body), server.chunk_size):
+                        chunk = body[start : start + server.chunk_size]
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def _accepts_gzip(self) -> bool:
+                return server.gzip and "gzip" in self.headers.get("Accept-Encoding", "")
+
+            def do_GET(self):
+                path = urlparse(self.path).path
+                if path != METADATA_PATH:
+                    self._send(404, b'{"error": {"code": "NotFound", "message": "Unknown path"}}')
+                    return
+                server._count(path)
+                self._send(200, json.dumps(CLOUD_METADATA).encode("utf-8"))
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                request_body = self._read_body()
+                counted_path = INGEST_PATH if path.startswith(INGEST_PATH) else path
+                if counted_path not in (QUERY_PATH, MGMT_PATH, INGEST_PATH):
+                    self._send(404, b'{"error": {"code": "NotFound", "message": "Unknown path"}}')
+                    return
+                throttled = server._count(counted_path)
+                if server.latency_seconds:
+                    time.sleep(server.latency_seconds)
+                if throttled:
+                    self._send(429, _THROTTLED_BODY, headers={"Retry-After": "1"})
+                    return
+
+                compress = self._accepts_gzip()
+                if counted_path == INGEST_PATH:
+                    self._ingest(path, request_body, compress)
+                    return
+                query = json.loads(request_body or b"{}").get("csl", "")
+                try:
+                    shape = server.shape.with_overrides(query)
+                except ValueError as e:
+                    self._send(400, json.dumps({"error": {"code": "BadRequest", "message": str(e), "@permanent": True}}).encode("utf-8"))
+                    return
+                if counted_path == QUERY_PATH:
+                    body = server._body(("query",) + shape._key(), lambda: v2_frames(shape), compress)
+                else:
+                    body = server._body(("mgmt",) + shape._key(), lambda: v1_response(shape), compress)
+                self._send(200, body, compressed=compress)
+
+            def _ingest(self, path: str, request_body: bytes, compress: bool):
+                database, _, table = unquote(path[len(INGEST_PATH) :]).partition("/")
+                records = sum(1 for line in request_body.splitlines() if line.strip())
+                with server._lock:
+                    server.ingested_records += records
+                response = {
+                    "Tables": [
+                        {
+                            "TableName": "Table_0",
+                            "Columns": [
+                                {"ColumnName": "ConsumedRecordsCount", "DataType": "Int64"},
+                                {"ColumnName": "UpdatePolicyStatus", "DataType": "String"},
+                                {"ColumnName": "UpdatePolicyFailureCode", "DataType": "String"},
+                                {"ColumnName": "UpdatePolicyFailureReason", "DataType": "String"},
+                            ],
+                            "Rows": [[records, "Inactive", "Unknown", None]],
+                        }
+                    ]
+                }
+                body = json.dumps(response).encode("utf-8")
+                self._send(200, gzip.compress(body) if compress else body, compressed=compress)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main(args: Optional[Sequence[str]] = None):
+    parser = argparse.ArgumentParser(description="A local stand-in for a Kusto cluster, answering with synthetic results.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rows", type=int, default=100, help="The number of rows of results, unless a query overrides it with rows=N.")
+    parser.add_argument("--columns", type=int, default=None, help="The number of columns of results. Defaults to one column per type.")
+    parser.add_argument("--types", default=",".join(DEFAULT_COLUMN_TYPES), help="The comma separated types of the columns, cycled to their number.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before responding to each request.")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Respond to every Nth request with 429.")
+    parser.add_argument("--gzip", action="store_true", help="Compress responses for clients that accept gzip.")
+    parser.add_argument("--chunked", action="store_true", help="Send responses with chunked transfer encoding.")
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    options = parser.parse_args(args)
+
+    server = FakeKustoServer(
+        rows=options.rows,
+        columns=options.columns,
+        column_types=options.types.split(","),
+        latency_seconds=options.latency,
+        throttle_every=options.throttle_every,
+        gzip=options.gzip,
+        chunked=options.chunked,
+        chunk_size=options.chunk_size,
+        host=options.host,
+        port=options.port,
+    )
+    print("Serving a fake Kusto cluster at {}".format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
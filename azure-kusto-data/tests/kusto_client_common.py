@@ -2,16 +2,19 @@
 # Licensed under the MIT License
 import json
 import os
+import threading
+import time
 import uuid
 from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from io import BytesIO
-from typing import Optional, Any, Dict, Union, Iterator, Tuple
+from typing import Optional, Any, Dict, List, Union, Iterator, Tuple
 
 import pytest
 from dateutil.tz import UTC
 from requests import HTTPError
 
-from azure.kusto.data import KustoConnectionStringBuilder
+from azure.kusto.data import KustoConnectionStringBuilder, QueryProfile, RequestEvent, RequestHook
 from azure.kusto.data._models import KustoResultRow, KustoResultTable, KustoStreamingResultTable
 from azure.kusto.data.response import WellKnownDataSet, KustoStreamingResponseDataSet, KustoResponseDataSet
 
@@ -24,6 +27,71 @@ except:
     pass
 
 
+class KeepAliveServer:
+    """A local HTTP/1.1 server, which keeps connections alive and answers every request with an empty JSON object."""
+
+    def __init__(self):
+        accepted = self.accepted_connections = []
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                accepted.append(self.client_address)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.do_GET()
+
+            def do_GET(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = "http://127.0.0.1:{}".format(self._server.server_address[1])
+
+    def wait_for_connections(self, count: int, timeout: float = 5) -> bool:
+        deadline = time.monotonic() + timeout
+        while len(self.accepted_connections) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.accepted_connections) == count
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class RecordingRequestHook(RequestHook):
+    """Records the phases of the requests it is called for."""
+
+    def __init__(self):
+        self.phases: List[Tuple[str, RequestEvent]] = []
+
+    def before_request(self, event: RequestEvent):
+        self.phases.append(("before_request", event))
+
+    def after_headers(self, event: RequestEvent):
+        self.phases.append(("after_headers", event))
+
+    def after_body(self, event: RequestEvent):
+        self.phases.append(("after_body", event))
+
+    def after_parse(self, event: RequestEvent):
+        self.phases.append(("after_parse", event))
+
+
 def mocked_requests_post(*args, **kwargs):
     """Mock to replace requests.Session.post"""
 
@@ -43,6 +111,7 @@ def mocked_requests_post(*args, **kwargs):
             self.reason = ""
             self.url = url
             self.raw = Raw(json.dumps(json_data).encode())
+            self.content = self.raw.getvalue()
 
         def json(self) -> Optional[Dict[str, Any]]:
             """Get json data from response."""
@@ -298,6 +367,15 @@ class KustoClientTestsMixin:
     def _assert_sanity_query_response(response: SyncResponseSet):
         KustoClientTestsMixin._assert_sanity_query_primary_results(get_response_first_primary_result(response))
 
+    @staticmethod
+    def _assert_query_profile(profile: Optional[QueryProfile]):
+        # The QueryResourceConsumption of deft.json
+        assert profile.client_request_id == "unspecified;cc5ee2b9-9b77-4509-9a61-84ec8f0159c2"
+        assert profile.execution_seconds == 0.0156154 and profile.cpu_total_seconds == 0.0
+        assert (profile.memory_cache_hits, profile.memory_cache_misses, profile.cache_hit_ratio) == (40, 0, 1.0)
+        assert (profile.result_row_count, profile.result_size) == (11, 2444)
+        assert profile.client_seconds >= 0 and profile.client_overhead_seconds == profile.client_seconds - profile.execution_seconds
+
     @staticmethod
     def _assert_sanity_control_command_response(response: SyncResponseSet):
         assert len(response) == 1
@@ -0,0 +1,30 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import json
+
+from tests.benchmarks.__main__ import main
+from tests.benchmarks.harness import BenchmarkResult, find_regressions, to_baseline
+from tests.benchmarks.suite import INGEST, SHAPES
+
+
+def test_suite_runs(tmp_path, capsys):
+    # A tiny run of every benchmark, so they keep working as the client changes
+    baseline = str(tmp_path / "baseline.json")
+    assert main(["--scale", "0.001", "--rounds", "1", "--baseline", baseline, "--save"]) == 0
+    with open(baseline) as f:
+        names = set(json.load(f)["results"])
+    assert {"{}[{}]".format(benchmark, shape) for benchmark in ("response_v2", "e2e_query", "streaming_enumerator") for shape in SHAPES} <= names
+    assert {"dataframe[datetime]", "converters[to_timedelta]", "streaming_enumerator_aio[tall]"} <= names
+    assert ("managed_streaming_prefix[MB]" in names) == INGEST
+
+    assert main(["--scale", "0.001", "--rounds", "1", "--baseline", baseline, "--filter", "small", "--threshold", "1000"]) == 0
+    assert "response_v2[small]" in capsys.readouterr().out
+
+
+def test_find_regressions():
+    baseline = to_baseline([BenchmarkResult("a", [1.0], 10), BenchmarkResult("b", [1.0, 2.0, 3.0], 10)])
+    results = [BenchmarkResult("a", [1.1], 10), BenchmarkResult("b", [2.5], 10), BenchmarkResult("new", [9.0], 10)]
+
+    regressions = find_regressions(results, baseline, threshold=0.2)
+    assert [(regression.name, regression.ratio) for regression in regressions] == [("b", 1.25)]
+    assert find_regressions(results, baseline, threshold=0.3) == []
@@ -0,0 +1,70 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import gzip
+import io
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from azure.kusto.data import KustoClient
+from azure.kusto.data.data_format import DataFormat
+from azure.kusto.data.exceptions import KustoThrottlingError
+from tests.fake_kusto_server import DEFAULT_COLUMN_TYPES, INGEST_PATH, METADATA_PATH, QUERY_PATH, FakeKustoServer, ResultShape
+
+
+class TestFakeKustoServer:
+    def test_query(self):
+        with FakeKustoServer(rows=5) as server:
+            with KustoClient(server.url) as client:
+                response = client.execute_query("db", "Table")
+
+        table = response.primary_results[0]
+        assert table.rows_count == 5 and [column.column_type for column in table.columns] == list(DEFAULT_COLUMN_TYPES)
+        row = table[3]
+        assert row["long_0"] == 3_000_009 and row["string_1"] == "value_3" and row["bool_4"] is False
+        assert isinstance(row["datetime_3"], datetime) and row["timespan_6"] == timedelta(seconds=3, microseconds=0.3)
+        assert row["dynamic_9"]["id"] == 3
+        assert response.query_profile.result_row_count == 5
+        assert server.request_counts == {QUERY_PATH: 1}
+
+    @pytest.mark.parametrize("compress", [False, True])
+    def test_shape_overrides_gzip_and_chunks(self, compress):
+        with FakeKustoServer(gzip=compress, chunked=True, chunk_size=100) as server:
+            with KustoClient(server.url) as client:
+                table = client.execute_query("db", "rows=1000 columns=3 types=real,guid").primary_results[0]
+                assert [column.column_name for column in table.columns] == ["real_0", "guid_1", "real_2"]
+                assert table.rows_count == 1000 and table[999]["real_2"] == 999 * 0.25 + 0.1
+
+                response = client.execute_streaming_query("db", "rows=1000 columns=30")
+                streamed = next(response.iter_primary_results())
+                assert sum(1 for _ in streamed) == 1000 and len(streamed.columns) == 30
+
+                mgmt = client.execute_mgmt("db", ".show tables rows=2").primary_results[0]
+                assert mgmt.rows_count == 2 and mgmt[1]["long_0"] == 1_000_003
+
+    def test_throttling_and_latency(self):
+        with FakeKustoServer(throttle_every=2, latency_seconds=0.05) as server:
+            with KustoClient(server.url) as client:
+                client.execute_query("db", "rows=1")
+                with pytest.raises(KustoThrottlingError):
+                    client.execute_query("db", "rows=1")
+                profile = client.execute_query("db", "rows=1").query_profile
+        assert profile.client_seconds >= 0.05 and server.throttled_count == 1
+
+    def test_ingest_and_metadata(self):
+        with FakeKustoServer() as server:
+            with KustoClient(server.url) as client:
+                data = io.BytesIO(gzip.compress(b"1,a\n2,b\n3,c\n"))
+                client.execute_streaming_ingest("db", "table", data, None, DataFormat.CSV)
+            metadata = requests.get(server.url + METADATA_PATH).json()
+
+        assert server.ingested_records == 3 and server.request_counts == {INGEST_PATH: 1, METADATA_PATH: 1}
+        assert metadata["AzureAD"]["LoginEndpoint"] == "https://login.microsoftonline.com"
+
+    def test_shapes(self):
+        assert ResultShape(columns=3, column_types=["long", "string"]).column_types == ("long", "string", "long")
+        assert ResultShape(rows=7).with_overrides("print 1").rows == 7
+        assert ResultShape(rows=7).with_overrides("rows=2;types=bool").column_types == ("bool",)
+        with pytest.raises(ValueError):
+            ResultShape(column_types=["float"])
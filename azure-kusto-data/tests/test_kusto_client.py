@@ -8,10 +8,19 @@ import pytest
 
 from azure.kusto.data import ClientRequestProperties, KustoClient, KustoConnectionStringBuilder
 from azure.kusto.data._cloud_settings import CloudSettings
-from azure.kusto.data.exceptions import KustoClosedError, KustoMultiApiError, KustoNetworkError
+from azure.kusto.data._shared_resources import _SharedResourceRegistry
+from azure.kusto.data.exceptions import KustoClosedError, KustoMultiApiError, KustoNetworkError, KustoStreamingQueryError
 from azure.kusto.data.helpers import dataframe_from_result_table
 from azure.kusto.data.response import KustoStreamingResponseDataSet
-from tests.kusto_client_common import KustoClientTestsMixin, mocked_requests_post, get_response_first_primary_result, get_table_first_row, proxy_kcsb
+from tests.kusto_client_common import (
+    KeepAliveServer,
+    RecordingRequestHook,
+    KustoClientTestsMixin,
+    mocked_requests_post,
+    get_response_first_primary_result,
+    get_table_first_row,
+    proxy_kcsb,
+)
 
 
 @pytest.fixture(params=[KustoClient.execute_query, KustoClient.execute_streaming_query])
@@ -37,6 +46,53 @@ class TestKustoClient(KustoClientTestsMixin):
             self._assert_sanity_query_response(response)
             self._assert_client_request_id(mock_post.call_args[-1])
 
+    @patch("requests.Session.post", side_effect=mocked_requests_post)
+    def test_request_hooks(self, mock_post, method):
+        hook = RecordingRequestHook()
+        is_streaming = method is KustoClient.execute_streaming_query
+        with KustoClient(self.HOST) as client:
+            client.add_request_hook(hook)
+            response = method.__call__(client, "PythonTest", "Deft")
+            self._assert_sanity_query_response(response)
+
+            phases = [phase for phase, _ in hook.phases]
+            event = hook.phases[0][1]
+            assert all(e is event for _, e in hook.phases)
+            assert event.client_request_id == mock_post.call_args[-1]["headers"]["x-ms-client-request-id"]
+            assert event.endpoint == client._query_endpoint and event.is_streaming == is_streaming and event.status_code == 200
+            assert event.token_seconds >= 0 and event.time_to_first_byte_seconds >= 0
+            # The body is read separately from the headers, so it can be timed
+            assert mock_post.call_args[-1]["stream"]
+            if is_streaming:
+                # Streamed responses are read as they are iterated
+                assert phases[:2] == ["before_request", "after_headers"]
+            else:
+                assert phases == ["before_request", "after_headers", "after_body", "after_parse"]
+                assert event.response_bytes > 0 and event.row_count == 11
+                assert event.download_seconds >= 0 and event.parse_seconds >= 0
+
+            # Without hooks, requests are sent as before
+            client.remove_request_hook(hook)
+            hook.phases.clear()
+            method.__call__(client, "PythonTest", "Deft")
+            assert hook.phases == []
+            assert mock_post.call_args[-1]["stream"] == is_streaming
+
+    @patch("requests.Session.post", side_effect=mocked_requests_post)
+    def test_query_profile(self, mock_post, method):
+        with KustoClient(self.HOST) as client:
+            response = method.__call__(client, "PythonTest", "Deft")
+            if isinstance(response, KustoStreamingResponseDataSet):
+                # Streamed responses have the profile once they were read to their end
+                with pytest.raises(KustoStreamingQueryError):
+                    _ = response.query_profile
+                response.set_skip_incomplete_tables(True)
+                _ = [table for table in response]
+            self._assert_query_profile(response.query_profile)
+
+            # Management commands report no resource consumption
+            assert client.execute_mgmt("NetDefaultDB", ".show version").query_profile is None
+
     @patch("requests.Session.post", side_effect=mocked_requests_post)
     def test_raise_network(self, mock_post, method):
         """Test query V2."""
@@ -247,3 +303,80 @@ class TestKustoClient(KustoClientTestsMixin):
         for actual_url, expected in tests.items():
             kcsb = KustoConnectionStringBuilder(actual_url)
             assert (kcsb.data_source, kcsb.initial_catalog) == expected
+
+    def test_share_resources(self):
+        """Test sharing sessions and token providers between clients of the same cluster"""
+        kcsb = KustoConnectionStringBuilder.with_aad_application_key_authentication("https://somecluster.kusto.windows.net", "app", "key", "tenant")
+        dm_kcsb = KustoConnectionStringBuilder.with_aad_application_key_authentication("https://ingest-SomeCluster.kusto.windows.net", "app", "key", "tenant")
+        other_identity_kcsb = KustoConnectionStringBuilder.with_aad_application_key_authentication(
+            "https://somecluster.kusto.windows.net", "other_app", "key", "tenant"
+        )
+        session_key = _SharedResourceRegistry.session_key(kcsb)
+
+        client = KustoClient(kcsb, share_resources=True)
+        dm_client = KustoClient(dm_kcsb, share_resources=True)
+        other_identity_client = KustoClient(other_identity_kcsb, share_resources=True)
+        private_client = KustoClient(kcsb)
+
+        assert client._session is dm_client._session is other_identity_client._session
+        assert client._aad_helper is dm_client._aad_helper
+        assert client._aad_helper is not other_identity_client._aad_helper
+        assert private_client._session is not client._session and private_client._aad_helper is not client._aad_helper
+        assert _SharedResourceRegistry.reference_count(session_key) == 3
+
+        # A shared session isn't affected by a client's proxy
+        client.set_proxy("https://my_proxy.sample")
+        assert client._session.proxies == {}
+        assert client._proxies == {"http": "https://my_proxy.sample", "https": "https://my_proxy.sample"}
+
+        with patch("requests.Session.close") as session_close:
+            client.close()
+            other_identity_client.close()
+            assert _SharedResourceRegistry.reference_count(session_key) == 1
+            session_close.assert_not_called()
+
+            dm_client.close()
+            assert _SharedResourceRegistry.reference_count(session_key) == 0
+            session_close.assert_called_once()
+        private_client.close()
+
+    def test_warm_up_and_pool_metrics(self):
+        with KeepAliveServer() as server:
+            with KustoClient(server.url) as client:
+                client.warm_up(connections=3)
+                metrics = client.get_pool_metrics()
+                assert (metrics.max_size, metrics.in_use, metrics.idle, metrics.connections_created, metrics.connections_acquired) == (100, 0, 3, 3, 3)
+                assert server.wait_for_connections(3)
+
+                # Idle connections are reused
+                client.warm_up(connections=2)
+                metrics = client.get_pool_metrics()
+                assert (metrics.idle, metrics.connections_created, metrics.connections_acquired) == (3, 3, 5)
+                assert metrics.max_wait_seconds >= 0 and metrics.average_wait_seconds == metrics.total_wait_seconds / 5
+
+            # The pool size is configured in the connection string, or overridden by the client
+            kcsb = KustoConnectionStringBuilder(server.url + ";Max Connections=2")
+            assert kcsb.max_connections == 2
+            with KustoClient(kcsb) as client:
+                client.warm_up(connections=5)
+                metrics = client.get_pool_metrics()
+                assert (metrics.max_size, metrics.idle, metrics.connections_created) == (2, 2, 2)
+            with KustoClient(kcsb, max_connections=4) as client:
+                assert client.get_pool_metrics().max_size == 4
+
+        with pytest.raises(ValueError):
+            KustoClient(server.url, max_connections=0)
+
+    def test_request_hook_connection_time(self):
+        hook = RecordingRequestHook()
+        with KeepAliveServer() as server:
+            with KustoClient(server.url) as client:
+                client.add_request_hook(hook)
+                # The local server answers with an empty object - a response without tables
+                client.execute_query("db", "query")
+
+        phases = [phase for phase, _ in hook.phases]
+        event = hook.phases[0][1]
+        assert phases == ["before_request", "after_headers", "after_body", "after_parse"]
+        assert event.send_time <= event.connection_time <= event.headers_time <= event.body_time <= event.parse_time
+        assert (event.response_bytes, event.row_count) == (2, 0) and event.connection_seconds >= 0
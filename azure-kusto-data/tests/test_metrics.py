@@ -0,0 +1,77 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+from unittest.mock import patch
+
+import pytest
+
+from azure.kusto.data import KustoClient, metrics
+from azure.kusto.data._token_providers import CallbackTokenProvider
+from azure.kusto.data.metrics import InMemoryMeter, _MetricsRequestHook
+from azure.kusto.data.request_hooks import RequestEvent
+from tests.kusto_client_common import KustoClientTestsMixin, mocked_requests_post
+
+
+@pytest.fixture
+def meter():
+    meter = InMemoryMeter()
+    metrics.enable_metrics(meter)
+    try:
+        yield meter
+    finally:
+        metrics.disable_metrics()
+
+
+def test_in_memory_meter():
+    meter = InMemoryMeter()
+    counter = meter.create_counter("counter", unit="By")
+    assert meter.create_counter("counter") is counter
+    counter.add(2, {"database": "a"})
+    counter.add(3, {"database": "b"})
+    meter.create_histogram("histogram").record(0.5)
+
+    assert meter.sum("counter") == 5 and meter.sum("counter", database="b") == 3
+    assert meter.count("histogram") == 1 and meter.get_points("missing") == []
+    meter.clear()
+    assert meter.count("counter") == 0
+
+
+def test_disabled_by_default():
+    assert metrics._get_instruments() is None and metrics._get_request_hook() is None
+    with KustoClient(KustoClientTestsMixin.HOST) as client:
+        # Without metrics or hooks, requests don't create events
+        assert client._create_request_event(client._query_endpoint, None) is None
+
+
+class TestMetrics(KustoClientTestsMixin):
+    @patch("requests.Session.post", side_effect=mocked_requests_post)
+    def test_query_metrics(self, mock_post, meter):
+        with KustoClient(self.HOST) as client:
+            client.execute_query("PythonTest", "Deft")
+            client.execute_mgmt("NetDefaultDB", ".show version")
+
+        attributes = {metrics.DATABASE: "PythonTest", metrics.OPERATION: metrics.QUERY, metrics.STATUS_CODE: 200}
+        assert meter.count("kusto.client.request.duration", **attributes) == 1
+        assert meter.sum("kusto.client.response.rows", **attributes) == 11
+        assert meter.sum("kusto.client.response.size", **attributes) > 0
+        assert meter.count("kusto.client.request.duration", **{metrics.DATABASE: "NetDefaultDB", metrics.OPERATION: metrics.MGMT}) == 1
+        assert meter.count("kusto.client.throttled_requests") == 0
+
+    def test_throttled_requests(self, meter):
+        hook = _MetricsRequestHook(metrics._get_instruments())
+        event = RequestEvent(KustoClientTestsMixin.HOST + "/v1/rest/ingest/db%201/table", "id")
+        event.status_code = 429
+        hook.after_headers(event)
+        event.body_time = event.start_time + 1
+        hook.after_body(event)
+
+        attributes = {metrics.DATABASE: "db 1", metrics.OPERATION: metrics.STREAMING_INGEST, metrics.STATUS_CODE: 429}
+        assert meter.sum("kusto.client.throttled_requests", **attributes) == 1
+        # Failed requests aren't parsed, so their duration ends with their body
+        assert meter.sum("kusto.client.request.duration", **attributes) == 1
+
+    def test_token_duration(self, meter):
+        # Tokens of callbacks aren't cached, so every call acquires one
+        provider = CallbackTokenProvider(lambda: "token", None)
+        provider.get_token()
+        provider.get_token()
+        assert meter.count("kusto.client.token.duration", **{metrics.TOKEN_PROVIDER: CallbackTokenProvider.name()}) == 2
@@ -0,0 +1,112 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import json
+import logging
+from unittest.mock import patch
+
+import pytest
+
+from azure.kusto.data import KustoClient, SlowQueryLog, metrics
+from azure.kusto.data.slow_query_log import BYTES, LATENCY, LOGGER_NAME, ROWS
+from tests.kusto_client_common import KustoClientTestsMixin, mocked_requests_post
+
+
+class TestSlowQueryLog(KustoClientTestsMixin):
+    @patch("requests.Session.post", side_effect=mocked_requests_post)
+    def test_records_slow_queries(self, mock_post):
+        records = []
+        with KustoClient(self.HOST) as client:
+            client.set_slow_query_log(SlowQueryLog(latency_threshold_seconds=0, sink=records.append, max_records_per_second=10, max_query_length=3))
+            client.execute_query("PythonTest", "Deft")
+            client.execute_mgmt("NetDefaultDB", ".show version")
+
+        query, mgmt = records
+        assert (query.operation, query.database, query.exceeded, query.suppressed) == (metrics.QUERY, "PythonTest", [LATENCY], 0)
+        assert query.query_text == "Def" and len(query.query_hash) == 16 and query.client_request_id.startswith("KPC.execute;")
+        assert query.row_count == 11 and query.response_bytes > 0 and query.status_code == 200
+        assert query.duration_seconds >= query.parse_seconds >= 0
+        assert query.to_dict()["server"]["result_size"] == 2444
+        # Management commands have no server side statistics
+        assert (mgmt.operation, mgmt.database, mgmt.query_profile) == (metrics.MGMT, "NetDefaultDB", None)
+        assert "server" not in json.loads(json.dumps(mgmt.to_dict()))
+
+    @patch("requests.Session.post", side_effect=mocked_requests_post)
+    def test_thresholds(self, mock_post):
+        records = []
+        with KustoClient(self.HOST) as client:
+            client.set_slow_query_log(
+                SlowQueryLog(latency_threshold_seconds=None, row_count_threshold=11, response_bytes_threshold=10**9, sink=records.append)
+            )
+            client.execute_query("PythonTest", "Deft")
+            assert records == []
+
+            client.set_slow_query_log(SlowQueryLog(latency_threshold_seconds=None, row_count_threshold=10, response_bytes_threshold=10, sink=records.append))
+            client.execute_query("PythonTest", "Deft")
+            assert records[0].exceeded == [ROWS, BYTES]
+
+            # Without a log or hooks, requests are not timed at all
+            client.set_slow_query_log(None)
+            assert client._create_request_event(client._query_endpoint, None) is None
+
+    @patch("requests.Session.post", side_effect=mocked_requests_post)
+    def test_streaming_query(self, mock_post):
+        records = []
+        with KustoClient(self.HOST) as client:
+            client.set_slow_query_log(SlowQueryLog(latency_threshold_seconds=None, row_count_threshold=10, sink=records.append))
+            response = client.execute_streaming_query("PythonTest", "Deft")
+            response.set_skip_incomplete_tables(True)
+            tables = iter(response)
+            next(tables)
+            # Streamed queries are recorded once they were read to their end
+            assert records == []
+            _ = [table for table in tables]
+
+        record = records[0]
+        assert (record.operation, record.exceeded, record.row_count, record.parse_seconds) == (metrics.STREAMING_QUERY, [ROWS], None, None)
+        assert record.query_profile.result_row_count == 11 and record.download_seconds >= 0
+
+    @patch("requests.Session.post", side_effect=mocked_requests_post)
+    def test_rate_limit_and_sampling(self, mock_post):
+        records = []
+        log = SlowQueryLog(latency_threshold_seconds=0, sink=records.append, max_records_per_second=1)
+        with KustoClient(self.HOST) as client:
+            client.set_slow_query_log(log)
+            for _ in range(3):
+                client.execute_query("PythonTest", "Deft")
+            assert len(records) == 1
+
+            # A second later the bucket has a token again, and the next record counts the ones dropped meanwhile
+            log._last_refill -= 1
+            client.execute_query("PythonTest", "Deft")
+            assert [record.suppressed for record in records] == [0, 2]
+
+            client.set_slow_query_log(SlowQueryLog(latency_threshold_seconds=0, sink=records.append, sample_rate=0))
+            client.execute_query("PythonTest", "Deft")
+            assert len(records) == 2
+
+    @patch("requests.Session.post", side_effect=mocked_requests_post)
+    def test_sinks(self, mock_post, caplog):
+        def failing_sink(record):
+            raise ValueError("sink is down")
+
+        with KustoClient(self.HOST) as client:
+            # Failing sinks don't fail the query, and their failures are logged within the rate limit
+            client.set_slow_query_log(SlowQueryLog(latency_threshold_seconds=0, sink=failing_sink))
+            with caplog.at_level(logging.ERROR, logger=LOGGER_NAME):
+                self._assert_sanity_query_response(client.execute_query("PythonTest", "Deft"))
+                client.execute_query("PythonTest", "Deft")
+            assert len(caplog.records) == 1 and caplog.records[0].exc_info[0] is ValueError
+            caplog.clear()
+
+            client.set_slow_query_log(SlowQueryLog(latency_threshold_seconds=0, max_query_length=0))
+            with caplog.at_level(logging.WARNING, logger=LOGGER_NAME):
+                client.execute_query("PythonTest", "Deft")
+
+        logged = json.loads(caplog.records[0].getMessage().split(": ", 1)[1])
+        assert logged["database"] == "PythonTest" and logged["query_text"] is None and logged["query_hash"]
+
+    def test_invalid_settings(self):
+        with pytest.raises(ValueError):
+            SlowQueryLog(max_records_per_second=0)
+        with pytest.raises(ValueError):
+            SlowQueryLog(sample_rate=1.5)
@@ -1,6 +1,8 @@
 import pytest
+from azure.core.settings import settings
 
-from azure.kusto.data._telemetry import MonitoredActivity, Span
+from azure.kusto.data import _telemetry
+from azure.kusto.data._telemetry import MonitoredActivity, Span, _TracingState, set_tracing_sample_rate
 from azure.kusto.data.client_request_properties import ClientRequestProperties
 
 
@@ -116,3 +118,122 @@ def test_create_http_attributes():
     headers = {"User-Agent": "user_agent_test"}
     attributes = Span.create_http_attributes("method_test", "url_test", headers)
     assert attributes == {"component": "http", "http.method": "method_test", "http.url": "url_test", "http.user_agent": "user_agent_test"}
+
+
+class RecordingSpan:
+    """A minimal azure-core tracing implementation, recording the spans it creates."""
+
+    spans = []
+    current = None
+
+    def __init__(self, span=None, name=None, kind=None, **kwargs):
+        self.name = name
+        self.attributes = {}
+        self._parent = None
+        if span is None:
+            RecordingSpan.spans.append(self)
+
+    def __enter__(self):
+        self._parent, RecordingSpan.current = RecordingSpan.current, self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        RecordingSpan.current = self._parent
+
+    def add_attribute(self, key, value):
+        (RecordingSpan.current or self).attributes[key] = value
+
+    @classmethod
+    def get_current_span(cls):
+        return cls.current
+
+
+@pytest.fixture
+def recording_tracer():
+    previous = settings.tracing_implementation()
+    settings.tracing_implementation = RecordingSpan
+    RecordingSpan.spans = []
+    _TracingState.reset()
+    try:
+        yield RecordingSpan
+    finally:
+        settings.tracing_implementation = previous
+        set_tracing_sample_rate(1.0)
+        _TracingState.reset()
+
+
+def test_no_tracer_skips_spans_and_attributes(monkeypatch):
+    _TracingState.reset()
+    decorated = MonitoredActivity.trace("test_span")(lambda value: value)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("No span should be created without a tracer")
+
+    monkeypatch.setattr(_telemetry, "distributed_trace", fail)
+    assert not MonitoredActivity.is_tracing()
+    assert MonitoredActivity.invoke(lambda: "Hello World", "test_span", tracing_attributes=fail) == "Hello World"
+    assert decorated("Hello World") == "Hello World"
+    Span.add_attributes(tracing_attributes={"key": "value"})
+
+
+def test_tracer_records_spans(recording_tracer):
+    @MonitoredActivity.trace(name_of_span="outer")
+    def outer():
+        Span.set_query_attributes("cluster_test", "database_test")
+        return MonitoredActivity.invoke(lambda: "Hello World", "inner", tracing_attributes=lambda: {"key": "value"})
+
+    assert outer() == "Hello World"
+    assert [span.name for span in recording_tracer.spans] == ["outer", "inner"]
+    assert recording_tracer.spans[0].attributes == {"kusto_cluster": "cluster_test", "database": "database_test"}
+    assert recording_tracer.spans[1].attributes == {"key": "value"}
+
+
+def test_tracer_detection_is_cached(recording_tracer):
+    assert MonitoredActivity.is_tracing()
+    settings.tracing_implementation = None
+    assert MonitoredActivity.is_tracing()
+    _TracingState.reset()
+    assert not MonitoredActivity.is_tracing()
+
+
+def test_sampling_is_per_operation(recording_tracer, monkeypatch):
+    @MonitoredActivity.trace(name_of_span="operation")
+    def operation():
+        return MonitoredActivity.invoke(lambda: MonitoredActivity.is_tracing(), "request")
+
+    set_tracing_sample_rate(0.5)
+    monkeypatch.setattr(_telemetry.random, "random", lambda: 0.7)
+    assert operation() is False
+    assert recording_tracer.spans == []
+
+    monkeypatch.setattr(_telemetry.random, "random", lambda: 0.2)
+    assert operation() is True
+    assert [span.name for span in recording_tracer.spans] == ["operation", "request"]
+
+    set_tracing_sample_rate(0.0)
+    assert operation() is False
+    assert len(recording_tracer.spans) == 2
+
+
+@pytest.mark.asyncio
+async def test_sampling_async(recording_tracer):
+    @MonitoredActivity.trace_async(name_of_span="operation")
+    async def operation():
+        async def request():
+            return MonitoredActivity.is_tracing()
+
+        return await MonitoredActivity.invoke_async(request, "request")
+
+    assert await operation() is True
+    assert [span.name for span in recording_tracer.spans] == ["operation", "request"]
+
+    set_tracing_sample_rate(0.0)
+    assert await operation() is False
+    assert len(recording_tracer.spans) == 2
+
+
+def test_invalid_sample_rate():
+    with pytest.raises(ValueError):
+        set_tracing_sample_rate(1.5)
+    with pytest.raises(ValueError):
+        set_tracing_sample_rate(-0.1)
@@ -1,9 +1,10 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
 from ._version import VERSION as __version__
-from .base_ingest_client import IngestionResult, IngestionStatus
+from .base_ingest_client import IngestionResult, IngestionStatus, BulkIngestionResult
 from .descriptors import BlobDescriptor, FileDescriptor, StreamDescriptor
-from .exceptions import KustoMissingMappingError
+from .exceptions import KustoMissingMappingError, KustoPartialIngestionError
+from ._blob_enqueuer import EnqueueMetrics
 from .ingest_client import QueuedIngestClient
 from .ingestion_properties import (
     ValidationPolicy,
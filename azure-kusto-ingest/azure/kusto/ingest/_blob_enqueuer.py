@@ -0,0 +1,232 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import itertools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import BoundedSemaphore, Lock
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional
+
+from azure.kusto.data import metrics
+from azure.kusto.data._telemetry import MonitoredActivity
+
+from ._ingest_telemetry import IngestTracingAttributes
+from ._resource_manager import _ResourceUri
+from .base_ingest_client import BulkIngestionResult, IngestionResult, IngestionStatus
+from .descriptors import BlobDescriptor
+from .exceptions import KustoQueueError
+from .ingestion_blob_info import IngestionBlobInfoTemplate
+from .ingestion_properties import IngestionProperties
+
+if TYPE_CHECKING:
+    from .ingest_client import QueuedIngestClient
+
+_logger = logging.getLogger(__name__)
+
+
+class EnqueueMetrics:
+    """A snapshot of the throughput of a client's enqueue path, as returned by QueuedIngestClient.get_enqueue_metrics()."""
+
+    messages_sent: int
+    "The number of ingestion messages that were enqueued."
+
+    messages_failed: int
+    "The number of ingestion messages that couldn't be enqueued on any queue."
+
+    retries: int
+    "The number of sends that failed and were retried on another queue."
+
+    elapsed_seconds: float
+    "The time from the first send to the last completed one."
+
+    total_send_seconds: float
+    "The total duration of the successful sends."
+
+    messages_per_queue: Dict[str, int]
+    "The number of messages enqueued, per queue name."
+
+    def __init__(self):
+        self.messages_sent = 0
+        self.messages_failed = 0
+        self.retries = 0
+        self.elapsed_seconds = 0.0
+        self.total_send_seconds = 0.0
+        self.messages_per_queue = {}
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.messages_sent / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    @property
+    def average_send_seconds(self) -> float:
+        return self.total_send_seconds / self.messages_sent if self.messages_sent else 0.0
+
+    def __repr__(self):
+        return "EnqueueMetrics(messages_sent={}, messages_failed={}, retries={}, messages_per_second={:.1f}, average_send_seconds={:.4f})".format(
+            self.messages_sent, self.messages_failed, self.retries, self.messages_per_second, self.average_send_seconds
+        )
+
+
+class _MessageTemplates:
+    """Holds the message template of an ingestion, and rebuilds it when the authorization context is refreshed."""
+
+    def __init__(self, client: "QueuedIngestClient", ingestion_properties: IngestionProperties):
+        self._client = client
+        self._ingestion_properties = ingestion_properties
+        self._lock = Lock()
+        self._template: Optional[IngestionBlobInfoTemplate] = None
+
+    def to_json(self, blob_descriptor: BlobDescriptor) -> str:
+        auth_context = self._client._resource_manager.get_authorization_context()
+        template = self._template
+        if template is None or template.auth_context != auth_context:
+            with self._lock:
+                template = self._template
+                if template is None or template.auth_context != auth_context:
+                    template = self._template = IngestionBlobInfoTemplate(
+                        self._ingestion_properties,
+                        auth_context=auth_context,
+                        application_for_tracing=self._client.application_for_tracing,
+                        client_version_for_tracing=self._client.client_version_for_tracing,
+                    )
+        return template.to_json(blob_descriptor)
+
+
+class _BlobEnqueuer:
+    """
+    The high rate enqueue path of a queued ingest client.
+    Messages are sent by a long-lived pool of sender threads (that keep their warm queue clients and connections),
+    and are spread round-robin across the ranked ingestion queues. A failed send is retried on the following queues.
+    The ranked queues are refreshed periodically rather than per message, so the ranking still follows the storage accounts' health.
+    """
+
+    # The maximal number of sender threads
+    MAX_SENDERS = 64
+    # How often the ranked queues are taken from the resource manager
+    QUEUES_REFRESH_INTERVAL_SECONDS = 1.0
+
+    DEFAULT_TIME_PROVIDER_IN_SECONDS: Callable[[], float] = time.monotonic
+
+    def __init__(self, client: "QueuedIngestClient", time_provider: Callable[[], float] = DEFAULT_TIME_PROVIDER_IN_SECONDS):
+        self._client = client
+        self._time_provider = time_provider
+        self._senders = ThreadPoolExecutor(self.MAX_SENDERS, thread_name_prefix="KustoEnqueue")
+        self._queues_lock = Lock()
+        self._queues: List[_ResourceUri] = []
+        self._queues_refresh_time = 0.0
+        self._next_queue = itertools.count()
+
+        self._metrics_lock = Lock()
+        self._metrics = EnqueueMetrics()
+        self._first_send_time: Optional[float] = None
+
+    def close(self):
+        self._senders.shutdown(wait=True)
+
+    def get_metrics(self) -> EnqueueMetrics:
+        with self._metrics_lock:
+            snapshot = EnqueueMetrics()
+            snapshot.__dict__.update(self._metrics.__dict__)
+            snapshot.messages_per_queue = dict(self._metrics.messages_per_queue)
+        return snapshot
+
+    def enqueue(
+        self, blob_descriptors: Iterable[BlobDescriptor], ingestion_properties: IngestionProperties, max_concurrent_sends: int
+    ) -> List[BulkIngestionResult]:
+        if max_concurrent_sends < 1:
+            raise ValueError("Concurrency limits must be positive")
+
+        templates = _MessageTemplates(self._client, ingestion_properties)
+        in_flight = BoundedSemaphore(max_concurrent_sends)
+        results = []
+        sends = []
+        for blob_descriptor in blob_descriptors:
+            result = BulkIngestionResult(blob_descriptor)
+            results.append(result)
+            in_flight.acquire()
+            sends.append(self._senders.submit(self._send, result, blob_descriptor, ingestion_properties, templates, in_flight))
+
+        wait(sends)
+        return results
+
+    def _get_queues(self) -> List[_ResourceUri]:
+        now = self._time_provider()
+        if now >= self._queues_refresh_time:
+            with self._queues_lock:
+                if now >= self._queues_refresh_time:
+                    self._queues = self._client._resource_manager.get_ingestion_queues()
+                    self._queues_refresh_time = now + self.QUEUES_REFRESH_INTERVAL_SECONDS
+        return self._queues
+
+    def _send(
+        self,
+        result: BulkIngestionResult,
+        blob_descriptor: BlobDescriptor,
+        ingestion_properties: IngestionProperties,
+        templates: _MessageTemplates,
+        in_flight: BoundedSemaphore,
+    ):
+        try:
+            result.result = self._send_with_retries(blob_descriptor, ingestion_properties, templates)
+        except Exception as e:
+            result.error = e
+        finally:
+            in_flight.release()
+
+    def _send_with_retries(self, blob_descriptor: BlobDescriptor, ingestion_properties: IngestionProperties, templates: _MessageTemplates) -> IngestionResult:
+        IngestTracingAttributes.set_ingest_descriptor_attributes(blob_descriptor, ingestion_properties)
+        message = templates.to_json(blob_descriptor)
+        queues = self._get_queues()
+        if not queues:
+            raise KustoQueueError()
+
+        first = next(self._next_queue)
+        attempts = min(self._client._MAX_RETRIES, len(queues))
+        for attempt in range(attempts):
+            queue = queues[(first + attempt) % len(queues)]
+            self._record_send_start()
+            start_time = time.perf_counter()
+            try:
+                queue_client = self._client._resource_manager.get_queue_client(queue, self._client._proxy_dict)
+                invoker = lambda: queue_client.send_message(content=message, timeout=self._client._SERVICE_CLIENT_TIMEOUT_SECONDS)
+                enqueue_trace_attributes = lambda: IngestTracingAttributes.create_enqueue_request_attributes(queue_client.queue_name, blob_descriptor.source_id)
+                MonitoredActivity.invoke(invoker, name_of_span="QueuedIngestClient.enqueue_request", tracing_attributes=enqueue_trace_attributes)
+            except Exception as e:
+                self._client._resource_manager.report_resource_usage_result(queue.storage_account_name, False)
+                if attempt == attempts - 1:
+                    self._record_failure()
+                    raise KustoQueueError() from e
+                _logger.warning("Enqueuing %s to queue %s failed, retrying with the next queue: %s", blob_descriptor.source_id, queue.object_name, e)
+                self._record_retry()
+                metrics._record_retry(metrics.ENQUEUE, **{metrics.STORAGE_ACCOUNT: queue.storage_account_name})
+                continue
+
+            duration = time.perf_counter() - start_time
+            self._client._resource_manager.report_resource_usage_result(queue.storage_account_name, True, duration)
+            self._record_success(queue.object_name, duration)
+            return IngestionResult(
+                IngestionStatus.QUEUED, ingestion_properties.database, ingestion_properties.table, blob_descriptor.source_id, blob_descriptor.path
+            )
+
+    def _record_send_start(self):
+        if self._first_send_time is None:
+            with self._metrics_lock:
+                if self._first_send_time is None:
+                    self._first_send_time = self._time_provider()
+
+    def _record_success(self, queue_name: str, duration: float):
+        with self._metrics_lock:
+            metrics = self._metrics
+            metrics.messages_sent += 1
+            metrics.total_send_seconds += duration
+            metrics.messages_per_queue[queue_name] = metrics.messages_per_queue.get(queue_name, 0) + 1
+            metrics.elapsed_seconds = self._time_provider() - self._first_send_time
+
+    def _record_failure(self):
+        with self._metrics_lock:
+            self._metrics.messages_failed += 1
+            self._metrics.elapsed_seconds = self._time_provider() - self._first_send_time
+
+    def _record_retry(self):
+        with self._metrics_lock:
+            self._metrics.retries += 1
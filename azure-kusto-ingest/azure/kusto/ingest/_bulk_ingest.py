@@ -0,0 +1,159 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import functools
+import gzip
+import time
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from io import BytesIO
+from threading import BoundedSemaphore
+from typing import TYPE_CHECKING, IO, Any, AnyStr, Callable, Iterable, List, Optional, Tuple, Union
+
+from azure.kusto.data.data_format import DataFormat
+
+from .base_ingest_client import BaseIngestClient, BulkIngestionResult
+from .descriptors import BlobDescriptor, FileDescriptor, StreamDescriptor
+from .ingestion_properties import IngestionProperties
+
+if TYPE_CHECKING:
+    import pandas
+
+    from .ingest_client import QueuedIngestClient
+
+_PreparedSource = Tuple[Union[FileDescriptor, StreamDescriptor], IO[AnyStr]]
+
+
+def serialize_dataframe_chunk(df: "pandas.DataFrame", data_format: DataFormat) -> Tuple[bytes, int]:
+    """
+    Serializes a DataFrame to CSV (gzip compressed) or Parquet.
+    Defined at module level so that it can run in a process pool.
+    :return: the serialized payload, and its uncompressed size.
+    """
+    if data_format == DataFormat.PARQUET:
+        stream = BytesIO()
+        df.to_parquet(stream, index=False)
+        payload = stream.getvalue()
+        return payload, len(payload)
+
+    data = df.to_csv(index=False, header=False).encode("utf-8")
+    return gzip.compress(data, compresslevel=6), len(data)
+
+
+class _BulkIngestPipeline:
+    """
+    Ingests many sources concurrently with a queued ingest client.
+    Each source goes through the stages read (and compress, or serialize) -> upload -> enqueue, and each stage runs on its own bounded thread pool.
+    The number of sources in flight is bounded as well, so that at most that many compressed payloads are held in memory.
+    Every source picks its container and queue from the ranked resources separately, which spreads the load across storage accounts.
+    """
+
+    def __init__(
+        self,
+        client: "QueuedIngestClient",
+        ingestion_properties: IngestionProperties,
+        max_concurrent_reads: int,
+        max_concurrent_uploads: int,
+        max_concurrent_enqueues: int,
+    ):
+        if min(max_concurrent_reads, max_concurrent_uploads, max_concurrent_enqueues) < 1:
+            raise ValueError("Concurrency limits must be positive")
+
+        self._client = client
+        self._ingestion_properties = ingestion_properties
+        self._max_concurrent_reads = max_concurrent_reads
+        self._max_concurrent_uploads = max_concurrent_uploads
+        self._max_concurrent_enqueues = max_concurrent_enqueues
+        self._in_flight = BoundedSemaphore(max_concurrent_reads + max_concurrent_uploads + max_concurrent_enqueues)
+
+    def ingest_files(self, file_descriptors: Iterable[Union[FileDescriptor, str]]) -> List[BulkIngestionResult]:
+        return self._ingest(file_descriptors, self._open_file)
+
+    def ingest_dataframe(
+        self, df: "pandas.DataFrame", data_format: DataFormat, chunk_rows: int, serialization_executor: Optional[Executor]
+    ) -> List[BulkIngestionResult]:
+        """
+        Splits the DataFrame into chunks of rows, and ingests every chunk as its own blob.
+        Chunks are serialized on `serialization_executor` if given (e.g. a process pool), otherwise on the read threads.
+        """
+        if chunk_rows < 1:
+            raise ValueError("chunk_rows must be positive")
+
+        name = "df_{id}_{timestamp}_{uid}".format(id=id(df), timestamp=int(time.time()), uid=uuid.uuid4())
+        extension = ".parquet" if data_format == DataFormat.PARQUET else ".csv.gz"
+
+        def serialize(chunk_index: int, chunk: "pandas.DataFrame") -> _PreparedSource:
+            if serialization_executor is not None:
+                payload, raw_size = serialization_executor.submit(serialize_dataframe_chunk, chunk, data_format).result()
+            else:
+                payload, raw_size = serialize_dataframe_chunk(chunk, data_format)
+            stream_name = "{}_{}{}".format(name, chunk_index, extension)
+            descriptor = StreamDescriptor(BytesIO(payload), is_compressed=data_format != DataFormat.PARQUET, stream_name=stream_name, size=raw_size)
+            return descriptor, descriptor.stream
+
+        chunks = (df.iloc[start : start + chunk_rows] for start in range(0, len(df), chunk_rows))
+        return self._ingest(chunks, serialize)
+
+    def _ingest(self, sources: Iterable[Any], prepare: Callable[[int, Any], _PreparedSource]) -> List[BulkIngestionResult]:
+        results = []
+        read_pool = ThreadPoolExecutor(self._max_concurrent_reads, thread_name_prefix="KustoBulkIngestRead")
+        upload_pool = ThreadPoolExecutor(self._max_concurrent_uploads, thread_name_prefix="KustoBulkIngestUpload")
+        enqueue_pool = ThreadPoolExecutor(self._max_concurrent_enqueues, thread_name_prefix="KustoBulkIngestEnqueue")
+        try:
+            for index, source in enumerate(sources):
+                result = BulkIngestionResult(source)
+                results.append(result)
+                self._in_flight.acquire()
+                read_pool.submit(self._read, result, functools.partial(prepare, index, source), upload_pool, enqueue_pool)
+        finally:
+            # Every stage submits to the next one before it completes, so the pools are drained in order
+            read_pool.shutdown(wait=True)
+            upload_pool.shutdown(wait=True)
+            enqueue_pool.shutdown(wait=True)
+
+        return results
+
+    def _fail(self, result: BulkIngestionResult, error: Exception):
+        result.error = error
+        self._in_flight.release()
+
+    def _open_file(self, index: int, file_descriptor: Union[FileDescriptor, str]) -> _PreparedSource:
+        file_descriptor, should_compress = BaseIngestClient._prepare_file(file_descriptor, self._ingestion_properties)
+        return file_descriptor, file_descriptor.open(should_compress)
+
+    def _read(
+        self, result: BulkIngestionResult, prepare_source: Callable[[], _PreparedSource], upload_pool: ThreadPoolExecutor, enqueue_pool: ThreadPoolExecutor
+    ):
+        try:
+            descriptor, stream = prepare_source()
+        except Exception as e:
+            self._fail(result, e)
+            return
+
+        upload_pool.submit(self._upload, result, descriptor, stream, enqueue_pool)
+
+    def _upload(self, result: BulkIngestionResult, descriptor: Union[FileDescriptor, StreamDescriptor], stream: IO[AnyStr], enqueue_pool: ThreadPoolExecutor):
+        try:
+            with stream:
+                blob_descriptor = self._client.upload_blob(
+                    self._client._get_containers(),
+                    descriptor,
+                    self._ingestion_properties.database,
+                    self._ingestion_properties.table,
+                    stream,
+                    self._client._proxy_dict,
+                    self._client._SERVICE_CLIENT_TIMEOUT_SECONDS,
+                    self._client._MAX_RETRIES,
+                )
+        except Exception as e:
+            self._fail(result, e)
+            return
+
+        enqueue_pool.submit(self._enqueue, result, blob_descriptor)
+
+    def _enqueue(self, result: BulkIngestionResult, blob_descriptor: BlobDescriptor):
+        try:
+            result.result = self._client.ingest_from_blob(blob_descriptor, ingestion_properties=self._ingestion_properties)
+        except Exception as e:
+            result.error = e
+        finally:
+            self._in_flight.release()
@@ -1,6 +1,6 @@
 import uuid
 
-from azure.kusto.data._telemetry import Span
+from azure.kusto.data._telemetry import MonitoredActivity, Span
 
 from .descriptors import DescriptorBase
 from .ingestion_properties import IngestionProperties
@@ -16,6 +16,8 @@ class IngestTracingAttributes:
 
     @classmethod
     def set_ingest_descriptor_attributes(cls, descriptor: DescriptorBase, ingestion_properties: IngestionProperties) -> None:
+        if not MonitoredActivity.is_tracing():
+            return
         Span.add_attributes(tracing_attributes={**ingestion_properties.get_tracing_attributes(), **descriptor.get_tracing_attributes()})
 
     @classmethod
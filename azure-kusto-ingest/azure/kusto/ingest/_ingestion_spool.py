@@ -0,0 +1,288 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from threading import Event, Lock, Thread
+from typing import IO, Callable, List, Optional, Union
+
+from .descriptors import BlobDescriptor, StreamDescriptor
+from .exceptions import KustoQueueError
+from .ingestion_properties import ColumnMapping, IngestionProperties, ReportLevel, ReportMethod, ValidationImplications, ValidationOptions, ValidationPolicy
+from azure.kusto.data.data_format import DataFormat, IngestionMappingKind
+from azure.kusto.data.exceptions import KustoBlobError, KustoServiceError, KustoThrottlingError
+from requests import RequestException
+
+_SpooledSource = Union[StreamDescriptor, BlobDescriptor]
+
+# Errors of storage, or of fetching the ingestion resources from the service (KustoNetworkError is a KustoServiceError), that pass once it recovers.
+# Ingestions that fail with them are spooled, and spooled entries that fail with them are kept for the next attempt.
+UNAVAILABLE_ERRORS = (KustoBlobError, KustoQueueError, KustoServiceError, KustoThrottlingError, RequestException)
+
+_logger = logging.getLogger(__name__)
+
+
+class _IngestionSpool:
+    """
+    A write-ahead spool of ingestions, in a local directory, for when storage can't be reached.
+    Every entry is either a payload (compressed, as it would have been uploaded) or a blob to enqueue, along with its ingestion properties.
+    A background thread replays the entries in the order they were added, once storage is healthy again, at a limited rate.
+    Entries are only deleted once they were replayed, so they survive restarts of the process - a new spool on the same directory picks them up.
+
+    While storage is unhealthy, the oldest entry is still replayed once every retry interval, as nothing else may be sent to storage to find out it recovered.
+
+    Every entry is written to a temporary file and renamed into place, and its payload is written before it, so partially written entries are never replayed.
+    Entries are JSON files, and the payloads may contain sensitive data, so the directory should be kept in a private location.
+    """
+
+    ENTRY_SUFFIX = ".entry"
+    PAYLOAD_SUFFIX = ".payload"
+    # Entries that can't be replayed (corrupt, or failing with a non transient error) are renamed with this suffix, and kept for inspection
+    FAILED_SUFFIX = ".failed"
+    _TEMP_SUFFIX = ".tmp"
+    _VERSION = 2
+
+    DEFAULT_TIME_PROVIDER_IN_SECONDS: Callable[[], float] = time.monotonic
+
+    def __init__(
+        self,
+        directory: str,
+        replay: Callable[[_SpooledSource, IngestionProperties], object],
+        is_healthy: Callable[[], bool],
+        max_replays_per_second: float = 10.0,
+        retry_interval: float = 5.0,
+        time_provider: Callable[[], float] = DEFAULT_TIME_PROVIDER_IN_SECONDS,
+    ):
+        """
+        :param directory: the spool directory. Created if it doesn't exist.
+        :param replay: ingests a spooled source. Should raise one of UNAVAILABLE_ERRORS if storage or the service is still unavailable.
+        :param is_healthy: whether storage is healthy enough to replay entries.
+        :param max_replays_per_second: the maximal rate in which entries are replayed.
+        :param retry_interval: seconds to wait before replaying again, after storage was found unhealthy.
+        :param time_provider: the clock, for tests.
+        """
+        if max_replays_per_second <= 0:
+            raise ValueError("max_replays_per_second must be positive")
+
+        self.directory = directory
+        self._replay = replay
+        self._is_healthy = is_healthy
+        self._replay_interval = 1.0 / max_replays_per_second
+        self.retry_interval = retry_interval
+        self._time_provider = time_provider
+        self._lock = Lock()
+        self._sequence = 0
+        self._pending = Event()
+        self._closed = Event()
+        self.failed_replays = 0
+        "The number of entries that failed to replay with a non transient error, and were set aside."
+
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        self._remove_temporary_files()
+        if self._list_entries():
+            self._pending.set()
+        self._drainer = Thread(target=self._drain, name="KustoIngestionSpool", daemon=True)
+        self._drainer.start()
+
+    def close(self):
+        """Stops replaying. Entries that weren't replayed stay in the directory."""
+        self._closed.set()
+        self._pending.set()
+        self._drainer.join()
+
+    def pending_count(self) -> int:
+        return len(self._list_entries())
+
+    def spool_stream(self, stream: IO[bytes], stream_descriptor: StreamDescriptor, ingestion_properties: IngestionProperties):
+        """Persists a payload, read from the stream's current position, as it should be uploaded."""
+        name = self._next_name(stream_descriptor.source_id)
+        payload_path = os.path.join(self.directory, name + self.PAYLOAD_SUFFIX)
+        self._write_atomically(payload_path, lambda f: shutil.copyfileobj(stream, f))
+        entry = {
+            "source_id": str(stream_descriptor.source_id),
+            "stream_name": stream_descriptor.stream_name,
+            "size": stream_descriptor.size,
+            "is_compressed": stream_descriptor.is_compressed,
+        }
+        self._add_entry(name, entry, ingestion_properties)
+
+    def spool_blob(self, blob_descriptor: BlobDescriptor, ingestion_properties: IngestionProperties):
+        """Persists a blob that should be enqueued for ingestion."""
+        entry = {"source_id": str(blob_descriptor.source_id), "path": blob_descriptor.path, "size": blob_descriptor.size}
+        self._add_entry(self._next_name(blob_descriptor.source_id), entry, ingestion_properties)
+
+    def _next_name(self, source_id: uuid.UUID) -> str:
+        # Names sort in the order the entries were added
+        with self._lock:
+            self._sequence += 1
+            return "{:020d}_{:06d}_{}".format(time.time_ns(), self._sequence % 1_000_000, source_id)
+
+    def _add_entry(self, name: str, entry: dict, ingestion_properties: IngestionProperties):
+        entry = {**entry, "version": self._VERSION, "ingestion_properties": self._properties_to_dict(ingestion_properties)}
+        self._write_atomically(os.path.join(self.directory, name + self.ENTRY_SUFFIX), lambda f: f.write(json.dumps(entry).encode("utf-8")))
+        self._pending.set()
+
+    @staticmethod
+    def _properties_to_dict(properties: IngestionProperties) -> dict:
+        mappings = properties.ingestion_mapping
+        policy = properties.validation_policy
+        return {
+            "database": properties.database,
+            "table": properties.table,
+            "format": properties.format.name,
+            "ingestion_mapping": None
+            if mappings is None
+            else [{"column": mapping.column, "datatype": mapping.datatype, "properties": mapping.properties} for mapping in mappings],
+            "ingestion_mapping_type": properties.ingestion_mapping_type.name if properties.ingestion_mapping_type is not None else None,
+            "ingestion_mapping_reference": properties.ingestion_mapping_reference,
+            "additional_tags": properties.additional_tags,
+            "ingest_if_not_exists": properties.ingest_if_not_exists,
+            "ingest_by_tags": properties.ingest_by_tags,
+            "drop_by_tags": properties.drop_by_tags,
+            "flush_immediately": properties.flush_immediately,
+            "ignore_first_record": properties.ignore_first_record,
+            "report_level": int(properties.report_level),
+            "report_method": int(properties.report_method),
+            "validation_policy": None
+            if policy is None
+            else {"validation_options": int(policy.ValidationOptions), "validation_implications": int(policy.ValidationImplications)},
+            "additional_properties": properties.additional_properties,
+        }
+
+    @staticmethod
+    def _properties_from_dict(values: dict) -> IngestionProperties:
+        mappings: Optional[List[ColumnMapping]] = None
+        if values["ingestion_mapping"] is not None:
+            mappings = []
+            for value in values["ingestion_mapping"]:
+                mapping = ColumnMapping(value["column"], value["datatype"])
+                mapping.properties = value["properties"]
+                mappings.append(mapping)
+        policy = values["validation_policy"]
+        return IngestionProperties(
+            database=values["database"],
+            table=values["table"],
+            data_format=DataFormat[values["format"]],
+            column_mappings=mappings,
+            ingestion_mapping_kind=IngestionMappingKind[values["ingestion_mapping_type"]] if values["ingestion_mapping_type"] is not None else None,
+            ingestion_mapping_reference=values["ingestion_mapping_reference"],
+            ingest_if_not_exists=values["ingest_if_not_exists"],
+            ingest_by_tags=values["ingest_by_tags"],
+            drop_by_tags=values["drop_by_tags"],
+            additional_tags=values["additional_tags"],
+            flush_immediately=values["flush_immediately"],
+            ignore_first_record=values["ignore_first_record"],
+            report_level=ReportLevel(values["report_level"]),
+            report_method=ReportMethod(values["report_method"]),
+            validation_policy=None
+            if policy is None
+            else ValidationPolicy(ValidationOptions(policy["validation_options"]), ValidationImplications(policy["validation_implications"])),
+            additional_properties=values["additional_properties"],
+        )
+
+    @classmethod
+    def _write_atomically(cls, path: str, write: Callable[[IO[bytes]], None]):
+        temp_path = path + cls._TEMP_SUFFIX
+        try:
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _remove_temporary_files(self):
+        for name in os.listdir(self.directory):
+            if name.endswith(self._TEMP_SUFFIX):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def _list_entries(self) -> List[str]:
+        return sorted(name[: -len(self.ENTRY_SUFFIX)] for name in os.listdir(self.directory) if name.endswith(self.ENTRY_SUFFIX))
+
+    def _drain(self):
+        next_replay_time = 0.0
+        while not self._closed.is_set():
+            self._pending.wait()
+            if self._closed.is_set():
+                return
+
+            names = self._list_entries()
+            if not names:
+                self._pending.clear()
+                # An entry may have been added after the listing
+                if self._list_entries():
+                    self._pending.set()
+                continue
+
+            if not self._is_healthy():
+                # Nothing else may be sent to storage while it is unhealthy, so the oldest entry probes whether it recovered
+                if self._closed.wait(self.retry_interval):
+                    return
+                names = names[:1]
+
+            for name in names:
+                delay = next_replay_time - self._time_provider()
+                if delay > 0 and self._closed.wait(delay):
+                    return
+                next_replay_time = self._time_provider() + self._replay_interval
+
+                if not self._replay_entry(name):
+                    # Storage is still unavailable - keep the rest of the entries (in order) for the next attempt
+                    self._closed.wait(self.retry_interval)
+                    break
+                if self._closed.is_set():
+                    return
+
+    def _replay_entry(self, name: str) -> bool:
+        """Replays a single entry. Returns False if storage or the service is still unavailable."""
+        entry_path = os.path.join(self.directory, name + self.ENTRY_SUFFIX)
+        payload_path = os.path.join(self.directory, name + self.PAYLOAD_SUFFIX)
+        try:
+            with open(entry_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            if not isinstance(entry, dict) or entry.get("version") != self._VERSION:
+                raise ValueError("Unsupported spool entry version {}".format(entry.get("version") if isinstance(entry, dict) else None))
+
+            ingestion_properties = self._properties_from_dict(entry["ingestion_properties"])
+            if "path" in entry:
+                self._replay(BlobDescriptor(entry["path"], entry["size"], entry["source_id"]), ingestion_properties)
+            else:
+                with open(payload_path, "rb") as payload:
+                    descriptor = StreamDescriptor(
+                        payload, entry["source_id"], is_compressed=entry["is_compressed"], stream_name=entry["stream_name"], size=entry["size"]
+                    )
+                    self._replay(descriptor, ingestion_properties)
+        except UNAVAILABLE_ERRORS as e:
+            _logger.warning("Replaying spooled ingestion %s failed, storage or the service is still unavailable: %s", name, e)
+            return False
+        except Exception:
+            _logger.exception("Replaying spooled ingestion %s failed, it is set aside with the %s suffix", name, self.FAILED_SUFFIX)
+            self.failed_replays += 1
+            self._rename_if_exists(entry_path, entry_path + self.FAILED_SUFFIX)
+            self._rename_if_exists(payload_path, payload_path + self.FAILED_SUFFIX)
+            return True
+
+        # The entry is removed first, so that a crash in between leaves an orphaned payload rather than an entry without one
+        os.unlink(entry_path)
+        if os.path.exists(payload_path):
+            os.unlink(payload_path)
+        return True
+
+    @staticmethod
+    def _rename_if_exists(path: str, new_path: str):
+        try:
+            os.replace(path, new_path)
+        except FileNotFoundError:
+            pass
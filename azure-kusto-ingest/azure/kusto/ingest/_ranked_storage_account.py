@@ -1,19 +1,34 @@
-from typing import Callable
+from typing import Callable, Optional
 
 
 class _StorageAccountStats:
     def __init__(self):
         self.success_count = 0
         self.total_count = 0
+        # Durations and sizes are only accumulated for successful results
+        self.timed_count = 0
+        self.total_duration = 0.0
+        self.sized_duration = 0.0
+        self.total_size = 0
 
-    def log_result(self, success: bool):
+    def log_result(self, success: bool, duration: Optional[float] = None, size: Optional[int] = None):
         self.total_count += 1
         if success:
             self.success_count += 1
+            if duration is not None:
+                self.timed_count += 1
+                self.total_duration += duration
+                if size:
+                    self.sized_duration += duration
+                    self.total_size += size
 
     def reset(self):
         self.success_count = 0
         self.total_count = 0
+        self.timed_count = 0
+        self.total_duration = 0.0
+        self.sized_duration = 0.0
+        self.total_size = 0
 
 
 class _RankedStorageAccount:
@@ -21,6 +36,9 @@ class _RankedStorageAccount:
     The rank is used to determine the order in which the storage accounts are used for ingestion.
     """
 
+    # The weight of each bucket in the latency and throughput averages, relative to the next (newer) bucket
+    DECAY_FACTOR: float = 0.5
+
     def __init__(self, account_name: str, number_of_buckets: int, bucket_duration: float, time_provider: Callable[[], float]):
         self.account_name = account_name
         self.number_of_buckets = number_of_buckets
@@ -30,14 +48,16 @@ class _RankedStorageAccount:
         self.last_update_time = self.time_provider()
         self.current_bucket_index = 0
 
-    def log_result(self, success: bool):
+    def log_result(self, success: bool, duration: Optional[float] = None, size: Optional[int] = None):
         self.current_bucket_index = self._adjust_for_time_passed()
-        self.buckets[self.current_bucket_index].log_result(success)
+        self.buckets[self.current_bucket_index].log_result(success, duration, size)
 
     def get_account_name(self) -> str:
         return self.account_name
 
     def get_rank(self) -> float:
+        # Results age out even when none are logged, so that an account that failed recovers its rank once it is left alone for long enough
+        self.current_bucket_index = self._adjust_for_time_passed()
         rank = 0
         total_weight = 0
 
@@ -60,6 +80,34 @@ class _RankedStorageAccount:
 
         return rank / total_weight
 
+    def _get_weighted_average(
+        self, numerator: Callable[[_StorageAccountStats], float], denominator: Callable[[_StorageAccountStats], float]
+    ) -> Optional[float]:
+        # Exponentially weighted moving average over the buckets - the newest bucket has a weight of 1, the one before it DECAY_FACTOR, and so on.
+        total = 0.0
+        total_weight = 0.0
+        weight = 1.0
+        for i in range(self.number_of_buckets):
+            bucket = self.buckets[(self.current_bucket_index - i) % self.number_of_buckets]
+            bucket_denominator = denominator(bucket)
+            if bucket_denominator > 0:
+                total += weight * numerator(bucket) / bucket_denominator
+                total_weight += weight
+            weight *= self.DECAY_FACTOR
+
+        if total_weight == 0:
+            return None
+
+        return total / total_weight
+
+    def get_latency(self) -> Optional[float]:
+        """Average duration in seconds of successful operations, or None if no durations were reported."""
+        return self._get_weighted_average(lambda bucket: bucket.total_duration, lambda bucket: bucket.timed_count)
+
+    def get_throughput(self) -> Optional[float]:
+        """Average throughput in bytes per second of successful operations, or None if no sizes were reported."""
+        return self._get_weighted_average(lambda bucket: bucket.total_size, lambda bucket: bucket.sized_duration)
+
     def _adjust_for_time_passed(self) -> int:
         # Get the current window (bucket) index and reset old windows.
         # This is part of the moving avarge calculation.
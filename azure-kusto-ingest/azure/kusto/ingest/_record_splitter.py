@@ -0,0 +1,166 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import re
+import zlib
+from typing import IO, Callable, Dict, Iterator, List, Tuple
+
+from azure.kusto.data.data_format import DataFormat
+
+# Structural tokens of JSON. Escape sequences are matched as a unit, so that escaped quotes are skipped - a trailing backslash is matched alone.
+_JSON_TOKENS = re.compile(rb'\\.?|["{}\[\]]', re.DOTALL)
+_CSV_TOKENS = re.compile(rb'["\n]')
+
+# The amount of data read from the source stream at a time
+_READ_SIZE = 1024 * 1024
+
+
+class _LineScanner:
+    """
+    Finds record boundaries in a buffer that grows as the stream is read. Every byte is scanned once - the scanner keeps its state between calls,
+    and is only given the bytes that were added since the previous call.
+    """
+
+    def scan(self, data: bytearray, start: int) -> Tuple[int, int]:
+        """
+        Scans data[start:].
+        :return: the offset after the last complete record in it (0 if there is none), and the offset to resume scanning from.
+        """
+        return data.rfind(b"\n", start) + 1, len(data)
+
+
+class _CsvScanner(_LineScanner):
+    """Line breaks inside quoted fields do not end a record."""
+
+    def __init__(self):
+        self._in_quotes = False
+
+    def scan(self, data: bytearray, start: int) -> Tuple[int, int]:
+        if not self._in_quotes and data.find(b'"', start) == -1:
+            return super().scan(data, start)
+
+        last_boundary = 0
+        for match in _CSV_TOKENS.finditer(data, start):
+            if match.group() == b'"':
+                self._in_quotes = not self._in_quotes
+            elif not self._in_quotes:
+                last_boundary = match.end()
+        return last_boundary, len(data)
+
+
+class _JsonScanner(_LineScanner):
+    """Top level JSON values may span multiple lines."""
+
+    def __init__(self):
+        self._depth = 0
+        self._in_string = False
+
+    def scan(self, data: bytearray, start: int) -> Tuple[int, int]:
+        last_boundary = 0
+        resume = len(data)
+        for match in _JSON_TOKENS.finditer(data, start):
+            token = match.group()
+            if token == b"\\":
+                # A backslash at the end of the data escapes the first byte read next, so it is scanned again along with it
+                resume = match.start()
+            elif len(token) == 2:
+                continue
+            elif token == b'"':
+                self._in_string = not self._in_string
+            elif self._in_string:
+                continue
+            elif token in (b"{", b"["):
+                self._depth += 1
+            elif self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    last_boundary = match.end()
+        return last_boundary, resume
+
+
+_SCANNERS: Dict[DataFormat, Callable[[], _LineScanner]] = {
+    DataFormat.CSV: _CsvScanner,
+    DataFormat.TSV: _CsvScanner,
+    DataFormat.TSVE: _CsvScanner,
+    DataFormat.SCSV: _CsvScanner,
+    DataFormat.PSV: _CsvScanner,
+    DataFormat.SOHSV: _CsvScanner,
+    DataFormat.TXT: _LineScanner,
+    DataFormat.JSON: _JsonScanner,
+    DataFormat.MULTIJSON: _JsonScanner,
+}
+
+
+def can_split(data_format: DataFormat) -> bool:
+    return data_format in _SCANNERS
+
+
+def _compress_bound(length: int) -> int:
+    """An upper bound on the gzip compressed size of `length` bytes (zlib's compressBound, plus the gzip header and trailer)."""
+    return length + (length >> 12) + (length >> 14) + (length >> 25) + 13 + 18
+
+
+class _CompressedChunk:
+    def __init__(self):
+        self._compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        self._output: List[bytes] = []
+        self._output_size = 0
+        self.raw_size = 0
+
+    def fits(self, length: int, max_size: int) -> bool:
+        """Checks whether `length` more raw bytes are guaranteed to fit within max_size once compressed."""
+        if _compress_bound(self.raw_size + length) <= max_size:
+            return True
+        # The cheap bound isn't enough, so measure the exact compressed size so far (on a copy of the compressor)
+        current_size = self._output_size + len(self._compressor.copy().flush())
+        return current_size + _compress_bound(length) <= max_size
+
+    def write(self, data: bytes):
+        output = self._compressor.compress(data)
+        if output:
+            self._output.append(output)
+            self._output_size += len(output)
+        self.raw_size += len(data)
+
+    def finish(self) -> bytes:
+        self._output.append(self._compressor.flush())
+        return b"".join(self._output)
+
+
+def split_records(stream: IO[bytes], data_format: DataFormat, max_chunk_size: int) -> Iterator[bytes]:
+    """
+    Splits an uncompressed stream of line delimited records into gzip compressed chunks, on record boundaries.
+    Every chunk is at most max_chunk_size bytes, unless a single record can't fit in it.
+    Only the chunk being built is held in memory.
+    :param stream: the records, uncompressed.
+    :param data_format: the format of the records. Must be one for which can_split() is true.
+    :param max_chunk_size: the maximal compressed size of a chunk.
+    """
+    scanner = _SCANNERS[data_format]()
+    chunk = _CompressedChunk()
+    # The bytes read after the last complete record, and how far into them the scanner got
+    pending = bytearray()
+    scanned = 0
+    while True:
+        block = stream.read(_READ_SIZE)
+        if block:
+            pending += block
+            boundary, scanned = scanner.scan(pending, scanned)
+        else:
+            # The end of the stream completes the last record
+            boundary = len(pending)
+        records = bytes(pending[:boundary])
+        del pending[:boundary]
+        scanned -= boundary
+
+        if records and chunk.raw_size > 0 and not chunk.fits(len(records), max_chunk_size):
+            yield chunk.finish()
+            chunk = _CompressedChunk()
+        # Don't start a chunk with whitespace only (such as the line break between JSON values)
+        if records and (chunk.raw_size > 0 or records.strip()):
+            chunk.write(records)
+
+        if not block:
+            break
+
+    if chunk.raw_size > 0:
+        yield chunk.finish()
@@ -0,0 +1,145 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import csv
+import io
+import json
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, Optional
+
+from azure.kusto.data.data_format import DataFormat
+
+from ._stream_extensions import compress_chunks
+from .descriptors import StreamDescriptor
+
+_CSV_DELIMITERS = {
+    DataFormat.CSV: ",",
+    DataFormat.TSV: "\t",
+    DataFormat.TSVE: "\t",
+    DataFormat.SCSV: ";",
+    DataFormat.PSV: "|",
+    DataFormat.SOHSV: "\x01",
+}
+
+_JSON_FORMATS = (DataFormat.JSON, DataFormat.MULTIJSON)
+
+SUPPORTED_RECORD_FORMATS = tuple(_CSV_DELIMITERS) + _JSON_FORMATS
+
+# The amount of serialized records handed to the compressor at a time
+_SERIALIZATION_CHUNK_SIZE = 64 * 1024
+
+
+def get_record_serializer(data_format: DataFormat) -> Callable[[Any], str]:
+    """
+    Returns a function that serializes a single record to a line of the given format.
+    Records are either mappings or sequences. Mappings are written as JSON objects, or by the order of their values in CSV formats.
+    """
+    if data_format in _JSON_FORMATS:
+
+        def serialize_json(record: Any) -> str:
+            if not isinstance(record, Mapping):
+                record = list(record)
+            return json.dumps(record, separators=(",", ":"), default=str) + "\n"
+
+        return serialize_json
+
+    if data_format in _CSV_DELIMITERS:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter=_CSV_DELIMITERS[data_format], lineterminator="\n")
+
+        def serialize_csv(record: Any) -> str:
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerow(record.values() if isinstance(record, Mapping) else record)
+            return buffer.getvalue()
+
+        return serialize_csv
+
+    raise ValueError(
+        "Records can only be ingested in one of the formats {}, found {}".format(", ".join(f.kusto_value for f in SUPPORTED_RECORD_FORMATS), data_format)
+    )
+
+
+class _RecordBatch:
+    """A size bounded batch of records, serialized lazily as it is being read."""
+
+    def __init__(self, records: "_PeekableRecords", serialize: Callable[[Any], str], max_size: int):
+        self._records = records
+        self._serialize = serialize
+        self._max_size = max_size
+        self.size = 0
+        self.is_complete = False
+
+    def chunks(self) -> Iterator[bytes]:
+        chunk: List[bytes] = []
+        chunk_size = 0
+        while self.size < self._max_size and self._records.has_next():
+            line = self._serialize(self._records.next()).encode("utf-8")
+            chunk.append(line)
+            chunk_size += len(line)
+            self.size += len(line)
+            if chunk_size >= _SERIALIZATION_CHUNK_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+                chunk_size = 0
+
+        if chunk:
+            yield b"".join(chunk)
+        self.is_complete = True
+
+
+class _PeekableRecords:
+    _END = object()
+
+    def __init__(self, records: Iterable[Any]):
+        self._iterator = iter(records)
+        self._next = next(self._iterator, self._END)
+
+    def has_next(self) -> bool:
+        return self._next is not self._END
+
+    def next(self) -> Any:
+        record = self._next
+        self._next = next(self._iterator, self._END)
+        return record
+
+
+class RecordBatchDescriptor(StreamDescriptor):
+    """
+    A StreamDescriptor of a compressed record batch.
+    The raw size of the batch is only known once it was read, so it is reported from then on, unless a size was set explicitly.
+    The size is kept by the batch, so that copies of the descriptor (as the ingest clients make) report it as well.
+    """
+
+    def __init__(self, batch: _RecordBatch, stream_name: str):
+        self._batch = batch
+        self._explicit_size: Optional[int] = None
+        super().__init__(compress_chunks(batch.chunks()), is_compressed=True, stream_name=stream_name)
+
+    @property
+    def size(self) -> Optional[int]:
+        if self._explicit_size is not None:
+            return self._explicit_size
+        return self._batch.size if self._batch.is_complete else None
+
+    @size.setter
+    def size(self, value: Optional[int]):
+        self._explicit_size = value
+
+
+def record_batches(records: Iterable[Any], data_format: DataFormat, max_batch_size: int) -> Iterator[RecordBatchDescriptor]:
+    """
+    Lazily splits records into size bounded, compressed batches.
+    Every batch must be fully read before the next one is requested, as they all consume the same iterable.
+    :param records: mappings or sequences, may be an unbounded generator.
+    :param data_format: the format to serialize the records to.
+    :param max_batch_size: the raw size in bytes after which a batch is ended. A batch always contains at least one record.
+    """
+    if max_batch_size < 1:
+        raise ValueError("max_batch_size must be positive")
+
+    serialize = get_record_serializer(data_format)
+    peekable_records = _PeekableRecords(records)
+    index = 0
+    while peekable_records.has_next():
+        batch = _RecordBatch(peekable_records, serialize, max_batch_size)
+        yield RecordBatchDescriptor(batch, "records_{}.{}.gz".format(index, data_format.kusto_value))
+        index += 1
@@ -1,7 +1,9 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Dict
+from threading import Lock
+from typing import Callable, List, Dict, Optional
 from urllib.parse import urlparse
 
 from tenacity import retry_if_exception_type, stop_after_attempt, Retrying, wait_random_exponential
@@ -10,7 +12,11 @@ from azure.kusto.data import KustoClient
 from azure.kusto.data._models import KustoResultTable
 from azure.kusto.data._telemetry import MonitoredActivity, Span
 from azure.kusto.data.exceptions import KustoThrottlingError
+from azure.kusto.ingest._resource_snapshot import _ResourceSnapshotFile
 from azure.kusto.ingest._storage_account_set import _RankedStorageAccountSet
+from azure.kusto.ingest._storage_client_cache import _StorageClientCache
+from azure.storage.blob import BlobServiceClient
+from azure.storage.queue import QueueClient
 
 _SHOW_VERSION = ".show version"
 _SERVICE_TYPE_COLUMN_NAME = "ServiceType"
@@ -56,23 +62,46 @@ class _IngestClientResources:
         ]
         return all(resources)
 
+    def to_dict(self) -> Dict[str, List[str]]:
+        return {name: [resource.url for resource in resources or []] for name, resources in vars(self).items()}
+
+    @classmethod
+    def from_dict(cls, resources: Dict[str, List[str]]) -> "_IngestClientResources":
+        return cls(**{name: [_ResourceUri(url) for url in urls] for name, urls in resources.items()})
+
 
 class _ResourceManager:
-    def __init__(self, kusto_client: KustoClient):
+    def __init__(self, kusto_client: KustoClient, snapshot_path: Optional[str] = None):
         self._kusto_client = kusto_client
         self._refresh_period = timedelta(hours=1)
+        # Resources are refreshed in the background this long before they expire, while callers keep using the current ones
+        self._refresh_ahead = timedelta(minutes=5)
 
         self._ingest_client_resources = None
         self._ingest_client_resources_last_update = None
+        self._ingest_client_resources_lock = Lock()
         self._ranked_storage_account_set = _RankedStorageAccountSet()
+        self._storage_client_cache = _StorageClientCache()
 
         self._authorization_context = None
         self._authorization_context_last_update = None
+        self._authorization_context_lock = Lock()
+
+        # A single worker, so that there is at most one request to the service per resource in flight
+        self._refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="KustoIngestResourceRefresh")
+        self._pending_refreshes: Dict[str, Future] = {}
+        self._pending_refreshes_lock = Lock()
 
         self.__set_throttling_settings()
 
+        self._snapshot_file = _ResourceSnapshotFile(snapshot_path, kusto_client._kusto_cluster) if snapshot_path else None
+        if self._snapshot_file:
+            self._load_snapshot()
+
     def close(self):
+        self._refresh_executor.shutdown(wait=False)
         self._kusto_client.close()
+        self._storage_client_cache.close()
 
     def __set_throttling_settings(self, num_of_attempts: int = 4, max_seconds_per_retry: float = 30):
         self._retryer = Retrying(
@@ -82,15 +111,66 @@ class _ResourceManager:
             reraise=True,
         )
 
+    def _should_refresh(self, last_update: datetime) -> bool:
+        return (last_update + self._refresh_period - self._refresh_ahead) <= datetime.utcnow()
+
+    def _refresh_in_background(self, name: str, refresh: Callable[[], None]) -> Future:
+        """
+        Schedules `refresh` on the background worker, unless a refresh with the same name is already pending.
+        Failures are swallowed - the current value keeps being served, and the next access schedules another attempt.
+        """
+        with self._pending_refreshes_lock:
+            pending = self._pending_refreshes.get(name)
+            if pending is not None:
+                return pending
+
+            def run():
+                try:
+                    refresh()
+                finally:
+                    with self._pending_refreshes_lock:
+                        self._pending_refreshes.pop(name, None)
+
+            try:
+                future = self._refresh_executor.submit(run)
+            except RuntimeError:
+                # The resource manager was closed
+                future = Future()
+                future.set_result(None)
+                return future
+            self._pending_refreshes[name] = future
+            return future
+
     def _refresh_ingest_client_resources(self):
-        if (
-            not self._ingest_client_resources
-            or (self._ingest_client_resources_last_update + self._refresh_period) <= datetime.utcnow()
-            or not self._ingest_client_resources.is_applicable()
-        ):
-            self._ingest_client_resources = self._get_ingest_client_resources_from_service()
-            self._ingest_client_resources_last_update = datetime.utcnow()
-            self._populate_ranked_storage_account_set()
+        # Missing, expired or partial resources are fetched while the caller waits - once, for all the callers waiting for them.
+        # Before they expire, the current resources are served while they are refreshed in the background.
+        if self._ingest_client_resources_unusable():
+            with self._ingest_client_resources_lock:
+                if self._ingest_client_resources_unusable():
+                    self._fetch_ingest_client_resources()
+            return
+
+        if self._should_refresh(self._ingest_client_resources_last_update):
+            self._refresh_in_background("ingest_client_resources", self._update_ingest_client_resources)
+
+    def _ingest_client_resources_unusable(self) -> bool:
+        resources = self._ingest_client_resources
+        return not resources or not resources.is_applicable() or self._is_expired(self._ingest_client_resources_last_update)
+
+    def _update_ingest_client_resources(self):
+        # Holding the lock keeps a blocking fetch and a background one from running at the same time
+        with self._ingest_client_resources_lock:
+            if self._ingest_client_resources_unusable() or self._should_refresh(self._ingest_client_resources_last_update):
+                self._fetch_ingest_client_resources()
+
+    def _fetch_ingest_client_resources(self):
+        resources = self._get_ingest_client_resources_from_service()
+        self._populate_ranked_storage_account_set(resources)
+        self._ingest_client_resources = resources
+        self._ingest_client_resources_last_update = datetime.utcnow()
+        # clients of the previous resources hold stale SASes, drop them (the connection pool is kept)
+        self._storage_client_cache.clear()
+        self._save_snapshot()
 
     def _get_resource_by_name(self, table: KustoResultTable, resource_name: str):
         return [_ResourceUri(row["StorageRoot"]) for row in table if row["ResourceTypeName"] == resource_name]
@@ -101,7 +181,7 @@ class _ResourceManager:
             return MonitoredActivity.invoke(
                 lambda: self._kusto_client.execute("NetDefaultDB", ".get ingestion resources"),
                 name_of_span="_ResourceManager.get_ingestion_resources",
-                tracing_attributes=Span.create_cluster_attributes(self._kusto_client._kusto_cluster),
+                tracing_attributes=lambda: Span.create_cluster_attributes(self._kusto_client._kusto_cluster),
             )
 
         result = self._retryer(invoker)
@@ -115,14 +195,75 @@ class _ResourceManager:
 
         return _IngestClientResources(secured_ready_for_aggregation_queues, failed_ingestions_queues, successful_ingestions_queues, containers, status_tables)
 
+    def _is_authorization_context_missing(self) -> bool:
+        return not self._authorization_context or self._authorization_context.isspace()
+
     def _refresh_authorization_context(self):
-        if (
-            not self._authorization_context
-            or self._authorization_context.isspace()
-            or (self._authorization_context_last_update + self._refresh_period) <= datetime.utcnow()
-        ):
-            self._authorization_context = self._get_authorization_context_from_service()
-            self._authorization_context_last_update = datetime.utcnow()
+        # Like the ingest client resources, a missing or expired context is fetched while the caller waits, and otherwise refreshed in the background
+        if self._authorization_context_unusable():
+            with self._authorization_context_lock:
+                if self._authorization_context_unusable():
+                    self._fetch_authorization_context()
+            return
+
+        if self._should_refresh(self._authorization_context_last_update):
+            self._refresh_in_background("authorization_context", self._update_authorization_context)
+
+    def _authorization_context_unusable(self) -> bool:
+        return self._is_authorization_context_missing() or self._is_expired(self._authorization_context_last_update)
+
+    def _update_authorization_context(self):
+        with self._authorization_context_lock:
+            if self._authorization_context_unusable() or self._should_refresh(self._authorization_context_last_update):
+                self._fetch_authorization_context()
+
+    def _fetch_authorization_context(self):
+        self._authorization_context = self._get_authorization_context_from_service()
+        self._authorization_context_last_update = datetime.utcnow()
+        self._save_snapshot()
+
+    def _is_expired(self, last_update: Optional[datetime]) -> bool:
+        return not last_update or (last_update + self._refresh_period) <= datetime.utcnow()
+
+    def _load_snapshot(self):
+        """
+        Loads the resources and the authorization context persisted by a previous client, if they have not expired yet.
+        From then on, they are refreshed in the background like resources fetched from the service.
+        """
+        snapshot = self._snapshot_file.load()
+        if not snapshot:
+            return
+
+        try:
+            resources_last_update = _ResourceSnapshotFile.parse_time(snapshot.get("ingest_client_resources_last_update"))
+            if snapshot.get("ingest_client_resources") and not self._is_expired(resources_last_update):
+                resources = _IngestClientResources.from_dict(snapshot["ingest_client_resources"])
+                self._populate_ranked_storage_account_set(resources)
+                self._ingest_client_resources = resources
+                self._ingest_client_resources_last_update = resources_last_update
+
+            authorization_context_last_update = _ResourceSnapshotFile.parse_time(snapshot.get("authorization_context_last_update"))
+            if snapshot.get("authorization_context") and not self._is_expired(authorization_context_last_update):
+                self._authorization_context = snapshot["authorization_context"]
+                self._authorization_context_last_update = authorization_context_last_update
+        except (TypeError, ValueError, AttributeError):
+            # A malformed snapshot is ignored, and the resources are fetched from the service
+            self._ingest_client_resources = None
+            self._authorization_context = None
+
+    def _save_snapshot(self):
+        if not self._snapshot_file:
+            return
+
+        resources = self._ingest_client_resources
+        self._snapshot_file.save(
+            {
+                "ingest_client_resources": resources.to_dict() if resources else None,
+                "ingest_client_resources_last_update": _ResourceSnapshotFile.format_time(self._ingest_client_resources_last_update),
+                "authorization_context": self._authorization_context,
+                "authorization_context_last_update": _ResourceSnapshotFile.format_time(self._authorization_context_last_update),
+            }
+        )
 
     def _get_authorization_context_from_service(self):
         # trace all calls to get identity token
@@ -130,16 +271,16 @@ class _ResourceManager:
             return MonitoredActivity.invoke(
                 lambda: self._kusto_client.execute("NetDefaultDB", ".get kusto identity token"),
                 name_of_span="_ResourceManager.get_identity_token",
-                tracing_attributes=Span.create_cluster_attributes(self._kusto_client._kusto_cluster),
+                tracing_attributes=lambda: Span.create_cluster_attributes(self._kusto_client._kusto_cluster),
             )
 
         result = self._retryer(invoker)
         return result.primary_results[0][0]["AuthorizationContext"]
 
-    def _populate_ranked_storage_account_set(self):
-        for resource in self._ingest_client_resources.containers:
+    def _populate_ranked_storage_account_set(self, resources: _IngestClientResources):
+        for resource in resources.containers:
             self._ranked_storage_account_set.add_storage_account(resource.storage_account_name)
-        for resource in self._ingest_client_resources.secured_ready_for_aggregation_queues:
+        for resource in resources.secured_ready_for_aggregation_queues:
             self._ranked_storage_account_set.add_storage_account(resource.storage_account_name)
 
     def _group_resources_by_storage_account(self, resources: List[_ResourceUri]) -> Dict[str, List[_ResourceUri]]:
@@ -169,13 +310,11 @@ class _ResourceManager:
 
         # select resources with non-repeating round robin and flatten the list
         result = []
-        while True:
-            if all(not lst for lst in rank_shuffled_resources_list):
-                break
-
+        longest = max((len(lst) for lst in rank_shuffled_resources_list), default=0)
+        for i in range(longest):
             for lst in rank_shuffled_resources_list:
-                if lst:
-                    result.append(lst.pop(0))
+                if i < len(lst):
+                    result.append(lst[i])
 
         return result
 
@@ -210,8 +349,25 @@ class _ResourceManager:
         except (TypeError, KeyError):
             return ""
 
+    def get_blob_service_client(self, resource: _ResourceUri, proxy_dict: Optional[Dict[str, str]] = None) -> BlobServiceClient:
+        return self._storage_client_cache.get_blob_service_client(resource.account_uri, proxy_dict)
+
+    def get_queue_client(self, resource: _ResourceUri, proxy_dict: Optional[Dict[str, str]] = None) -> QueueClient:
+        return self._storage_client_cache.get_queue_client(resource.account_uri, resource.object_name, proxy_dict)
+
     def set_proxy(self, proxy_url: str):
         self._kusto_client.set_proxy(proxy_url)
-
-    def report_resource_usage_result(self, storage_account_name: str, success_status: bool):
-        self._ranked_storage_account_set.add_account_result(storage_account_name, success_status)
+        self._storage_client_cache.set_proxy({"http": proxy_url, "https": proxy_url})
+
+    def has_healthy_storage_accounts(self) -> bool:
+        return self._ranked_storage_account_set.has_healthy_accounts()
+
+    def report_resource_usage_result(self, storage_account_name: str, success_status: bool, duration: Optional[float] = None, size: Optional[int] = None):
+        """
+        Reports the result of using a storage resource, to rank the storage accounts.
+        :param str storage_account_name: the storage account of the resource.
+        :param bool success_status: whether the operation succeeded.
+        :param Optional[float] duration: how long the operation took, in seconds.
+        :param Optional[int] size: how many bytes the operation transferred, if applicable.
+        """
+        self._ranked_storage_account_set.add_account_result(storage_account_name, success_status, duration, size)
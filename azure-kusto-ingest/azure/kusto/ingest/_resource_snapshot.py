@@ -0,0 +1,65 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import json
+import logging
+import os
+from datetime import datetime
+from threading import Lock
+from typing import Optional
+
+_logger = logging.getLogger(__name__)
+
+
+class _ResourceSnapshotFile:
+    """
+    Persists the ingestion resources and the authorization context of a cluster to a local file,
+    so that new processes can start ingesting without first querying the service.
+    The file contains SAS uris and an identity token, so it is created readable by the current user only.
+    """
+
+    _VERSION = 1
+
+    def __init__(self, path: str, cluster: str):
+        self.path = path
+        self.cluster = cluster
+        self._lock = Lock()
+
+    def load(self) -> Optional[dict]:
+        """Returns the stored snapshot, or None if there is no valid snapshot for this cluster."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(snapshot, dict) or snapshot.get("version") != self._VERSION or snapshot.get("cluster") != self.cluster:
+            return None
+        return snapshot
+
+    def save(self, snapshot: dict):
+        """Atomically replaces the stored snapshot. Failures are ignored, as the snapshot is only an optimization."""
+        snapshot = {**snapshot, "version": self._VERSION, "cluster": self.cluster}
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with self._lock:
+            try:
+                fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                _logger.warning("Failed to save the ingestion resources snapshot to %s: %s", self.path, e)
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def format_time(time: Optional[datetime]) -> Optional[str]:
+        return time.isoformat() if time else None
+
+    @staticmethod
+    def parse_time(time: Optional[str]) -> Optional[datetime]:
+        try:
+            return datetime.fromisoformat(time) if time else None
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,102 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import io
+import zlib
+from typing import IO, Iterator, List, NamedTuple, Optional
+
+from ._stream_extensions import chain_streams, compress_chunks, read_until_size_or_end, remaining_length
+from .descriptors import StreamDescriptor
+
+# The amount of data compressed to estimate the compression ratio of a stream, split into several samples when the stream is seekable
+SAMPLE_SIZE = 256 * 1024
+_SAMPLE_COUNT = 4
+
+_READ_SIZE = 1024 * 1024
+
+
+class SizeEstimate(NamedTuple):
+    size: int
+    "The estimated size of the stream, as it would be sent (compressed if it should be)."
+
+    is_exact: bool
+    "Whether the size is known, rather than estimated from a sampled compression ratio."
+
+
+def compression_ratio(samples: List[bytes]) -> float:
+    """Returns the ratio between the raw and the compressed size of the samples."""
+    raw_size = sum(len(sample) for sample in samples)
+    compressed_size = sum(len(zlib.compress(sample)) for sample in samples)
+    return raw_size / compressed_size if compressed_size else 1.0
+
+
+def _sample_seekable(stream: IO[bytes], length: int) -> List[bytes]:
+    """Reads samples spread across the stream, and seeks back to where it was."""
+    position = stream.tell()
+    if length <= SAMPLE_SIZE:
+        samples = [stream.read(length)]
+    else:
+        step = length // _SAMPLE_COUNT
+        samples = []
+        for i in range(_SAMPLE_COUNT):
+            stream.seek(position + i * step, io.SEEK_SET)
+            samples.append(stream.read(SAMPLE_SIZE // _SAMPLE_COUNT))
+    stream.seek(position, io.SEEK_SET)
+    return samples
+
+
+def estimate_size(stream_descriptor: StreamDescriptor, should_compress: bool, max_size: int) -> Optional[SizeEstimate]:
+    """
+    Estimates the size a stream would be sent with, without reading (or compressing) all of it.
+    Streams that are sent as they are have an exact size if they are seekable.
+    Streams that would be compressed are measured by their raw size (from the descriptor's size, or by seeking),
+    and their compression ratio is estimated by compressing a few samples.
+    Reading the samples of a stream that isn't seekable replaces the descriptor's stream with an equivalent one.
+    :param max_size: the size that matters to the caller. Raw sizes up to it are returned as they are (as an upper bound), without sampling.
+    :return: the estimate, or None if the size can't be known in advance.
+    """
+    stream = stream_descriptor.stream
+    if isinstance(stream, io.TextIOWrapper):
+        stream = stream_descriptor.stream = stream.buffer
+    if isinstance(stream, io.TextIOBase):
+        return None
+
+    length = remaining_length(stream)
+    if not should_compress:
+        return SizeEstimate(length, True) if length is not None else None
+
+    raw_size = length if length is not None else stream_descriptor.size
+    if not raw_size:
+        return None
+    if raw_size <= max_size:
+        return SizeEstimate(raw_size, False)
+
+    if length is not None:
+        samples = _sample_seekable(stream, length)
+    else:
+        sample = read_until_size_or_end(stream, SAMPLE_SIZE).getvalue()
+        stream_descriptor.stream = chain_streams([io.BytesIO(sample), stream])
+        samples = [sample]
+        if len(sample) < SAMPLE_SIZE:
+            # The whole stream was read, so its raw size is known
+            raw_size = len(sample)
+
+    return SizeEstimate(int(raw_size / compression_ratio(samples)), False)
+
+
+def _read_chunks(stream: IO[bytes]) -> Iterator[bytes]:
+    while True:
+        chunk = stream.read(_READ_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def compress_lazily(stream_descriptor: StreamDescriptor) -> StreamDescriptor:
+    """Returns a descriptor of the stream, compressed as it is being read rather than in memory up front."""
+    return StreamDescriptor(
+        compress_chunks(_read_chunks(stream_descriptor.stream)),
+        source_id=stream_descriptor.source_id,
+        is_compressed=True,
+        stream_name=stream_descriptor.stream_name + ".gz",
+        size=stream_descriptor.size,
+    )
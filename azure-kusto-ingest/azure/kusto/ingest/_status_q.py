@@ -2,7 +2,7 @@
 # Licensed under the MIT License
 import random
 
-from typing import List, Callable
+from typing import List, Callable, Optional
 
 from azure.kusto.ingest._resource_manager import _ResourceUri
 from azure.storage.queue import QueueServiceClient, QueueClient, QueueMessage, TextBase64EncodePolicy, TextBase64DecodePolicy
@@ -20,15 +20,23 @@ class QueueDetails:
 class StatusQueue:
     """StatusQueue is a class to simplify access to Kusto status queues (backed by azure storage queues)."""
 
-    def __init__(self, get_queues_func: Callable[[], List[_ResourceUri]], message_cls):
+    def __init__(
+        self,
+        get_queues_func: Callable[[], List[_ResourceUri]],
+        message_cls,
+        get_queue_client_func: Optional[Callable[[_ResourceUri], QueueClient]] = None,
+    ):
         self.get_queues_func = get_queues_func
         self.message_cls = message_cls
+        self.get_queue_client_func = get_queue_client_func
+
+    def _get_queue_client(self, q: _ResourceUri) -> QueueClient:
+        if self.get_queue_client_func is not None:
+            return self.get_queue_client_func(q)
+        return QueueServiceClient(q.account_uri).get_queue_client(queue=q.object_name, message_decode_policy=TextBase64DecodePolicy())
 
     def _get_queues(self) -> List[QueueClient]:
-        return [
-            QueueServiceClient(q.account_uri).get_queue_client(queue=q.object_name, message_decode_policy=TextBase64DecodePolicy())
-            for q in self.get_queues_func()
-        ]
+        return [self._get_queue_client(q) for q in self.get_queues_func()]
 
     def is_empty(self) -> bool:
         """Checks if Status queue has any messages"""
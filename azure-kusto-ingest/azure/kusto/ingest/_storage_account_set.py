@@ -1,5 +1,5 @@
 import random
-from typing import Callable, Dict, List, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 import time
 
 from azure.kusto.data.exceptions import KustoClientError
@@ -11,6 +11,7 @@ class _RankedStorageAccountSet:
     DEFAULT_BUCKET_DURATION_IN_SECONDS: int = 10
     DEFAULT_TIERS: Tuple[int, int, int, int] = (90, 70, 30, 0)
     DEFAULT_TIME_PROVIDER_IN_SECONDS: Callable[[], float] = time.time
+    MIN_LATENCY_IN_SECONDS: float = 0.001
 
     def __init__(
         self,
@@ -18,17 +19,20 @@ class _RankedStorageAccountSet:
         bucket_duration: float = DEFAULT_BUCKET_DURATION_IN_SECONDS,
         tiers: Tuple[int, int, int, int] = DEFAULT_TIERS,
         time_provider: Callable[[], float] = DEFAULT_TIME_PROVIDER_IN_SECONDS,
+        random_generator: Optional[random.Random] = None,
     ):
         self.accounts: Dict[str, _RankedStorageAccount] = dict()
         self.number_of_buckets = number_of_buckets
         self.bucket_duration = bucket_duration
         self.tiers = tiers
         self.time_provider = time_provider
+        # The accounts of each tier are shuffled with it - a seeded generator makes the order reproducible, for tests
+        self.random_generator = random_generator if random_generator is not None else random.Random()
 
-    def add_account_result(self, account_name: str, success: bool):
+    def add_account_result(self, account_name: str, success: bool, duration: Optional[float] = None, size: Optional[int] = None):
         if self.accounts.get(account_name) is None:
             raise KustoClientError(f"Account {account_name} does not exist in the set")
-        self.accounts[account_name].log_result(success)
+        self.accounts[account_name].log_result(success, duration, size)
 
     def add_storage_account(self, account_name: str):
         if self.accounts.get(account_name) is None:
@@ -37,19 +41,53 @@ class _RankedStorageAccountSet:
     def get_storage_account(self, account_name: str) -> _RankedStorageAccount:
         return self.accounts.get(account_name)
 
+    def has_healthy_accounts(self) -> bool:
+        """Whether any account is in the top tier. With no known accounts, there is nothing to rule out, so this is true as well."""
+        accounts = list(self.accounts.values())
+        return not accounts or any(account.get_rank() * 100.0 >= self.tiers[0] for account in accounts)
+
     def get_ranked_shuffled_accounts(self) -> List[_RankedStorageAccount]:
         accounts_by_tier: List[List[_RankedStorageAccount]] = [[] for _ in range(len(self.tiers))]
 
-        for account in self.accounts.values():
+        # Copy the accounts, as they may be added to concurrently when the ingestion resources are refreshed
+        for account in list(self.accounts.values()):
             rank_percentage = account.get_rank() * 100.0
             for i in range(len(self.tiers)):
                 if rank_percentage >= self.tiers[i]:
                     accounts_by_tier[i].append(account)
                     break
 
-        # Shuffle accounts in each tier
-        for tier in accounts_by_tier:
-            random.shuffle(tier)
+        # Shuffle accounts in each tier, preferring faster accounts
+        accounts_by_tier = [self._weighted_shuffle(tier) for tier in accounts_by_tier]
 
         # Flatten the list
         return [item for sublist in accounts_by_tier for item in sublist]
+
+    @staticmethod
+    def _get_speed_weights(accounts: List[_RankedStorageAccount]) -> Optional[List[float]]:
+        """
+        Returns a weight per account, proportional to its measured speed, or None if no speeds were measured.
+        Throughput is used when it is known for all the accounts, otherwise the inverse of the latency.
+        Accounts without measurements get the weight of the fastest account, so that they keep being probed.
+        """
+        throughputs = [account.get_throughput() for account in accounts]
+        if all(throughputs):
+            return throughputs
+
+        latencies = [account.get_latency() for account in accounts]
+        known_latencies = [latency for latency in latencies if latency is not None]
+        if not known_latencies:
+            return None
+
+        fastest = min(known_latencies)
+        return [1.0 / max(latency if latency is not None else fastest, _RankedStorageAccountSet.MIN_LATENCY_IN_SECONDS) for latency in latencies]
+
+    def _weighted_shuffle(self, accounts: List[_RankedStorageAccount]) -> List[_RankedStorageAccount]:
+        weights = self._get_speed_weights(accounts) if len(accounts) > 1 else None
+        if weights is None:
+            self.random_generator.shuffle(accounts)
+            return accounts
+
+        # Weighted random permutation (Efraimidis-Spirakis) - each account is first with a probability proportional to its weight
+        keys = {account.account_name: self.random_generator.random() ** (1.0 / weight) for account, weight in zip(accounts, weights)}
+        return sorted(accounts, key=lambda account: keys[account.account_name], reverse=True)
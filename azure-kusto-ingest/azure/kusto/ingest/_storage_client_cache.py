@@ -0,0 +1,96 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient
+from azure.storage.queue import QueueClient, TextBase64EncodePolicy, TextBase64DecodePolicy
+
+from azure.kusto.data.client import HTTPAdapterWithSocketOptions, KustoClient
+
+
+class _StorageClientCache:
+    """
+    Caches blob and queue service clients per storage resource, so that repeated uploads and enqueues reuse warm connections.
+    All clients share a single HTTP transport (and therefore a single connection pool).
+    Entries are keyed by the resource's account uri, which includes the SAS, so refreshed resources naturally get fresh clients.
+    """
+
+    # The maximum amount of connections to storage to be able to operate in parallel
+    _max_pool_size = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._proxy_dict: Optional[Dict[str, str]] = None
+        self._session = requests.Session()
+        # Retries are handled by the storage pipeline, so they are disabled at the connection level (same as azure-core's default adapter)
+        adapter = HTTPAdapterWithSocketOptions(
+            socket_options=(HTTPConnection.default_socket_options or []) + KustoClient.compose_socket_options(),
+            pool_maxsize=self._max_pool_size,
+            max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._transport = RequestsTransport(session=self._session, session_owner=False)
+
+        self._blob_service_clients: Dict[Tuple, BlobServiceClient] = {}
+        self._queue_clients: Dict[Tuple, QueueClient] = {}
+
+    def close(self):
+        self.clear()
+        self._session.close()
+
+    def clear(self):
+        """Drops all cached clients. The shared connection pool is kept."""
+        with self._lock:
+            self._blob_service_clients = {}
+            self._queue_clients = {}
+
+    def set_proxy(self, proxy_dict: Optional[Dict[str, str]]):
+        with self._lock:
+            self._proxy_dict = proxy_dict
+            self._blob_service_clients = {}
+            self._queue_clients = {}
+
+    def _get_proxies(self, proxy_dict: Optional[Dict[str, str]]) -> Optional[Dict[str, str]]:
+        return proxy_dict if proxy_dict is not None else self._proxy_dict
+
+    @staticmethod
+    def _proxy_key(proxies: Optional[Dict[str, str]]) -> Optional[Tuple]:
+        return tuple(sorted(proxies.items())) if proxies else None
+
+    def get_blob_service_client(self, account_uri: str, proxy_dict: Optional[Dict[str, str]] = None) -> BlobServiceClient:
+        proxies = self._get_proxies(proxy_dict)
+        key = (account_uri, self._proxy_key(proxies))
+        client = self._blob_service_clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._blob_service_clients.get(key)
+                if client is None:
+                    client = BlobServiceClient(account_uri, proxies=proxies, transport=self._transport)
+                    self._blob_service_clients[key] = client
+        return client
+
+    def get_queue_client(self, account_uri: str, queue_name: str, proxy_dict: Optional[Dict[str, str]] = None) -> QueueClient:
+        proxies = self._get_proxies(proxy_dict)
+        key = (account_uri, queue_name, self._proxy_key(proxies))
+        client = self._queue_clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._queue_clients.get(key)
+                if client is None:
+                    client = QueueClient(
+                        account_uri,
+                        queue_name,
+                        proxies=proxies,
+                        transport=self._transport,
+                        message_encode_policy=TextBase64EncodePolicy(),
+                        message_decode_policy=TextBase64DecodePolicy(),
+                    )
+                    self._queue_clients[key] = client
+        return client
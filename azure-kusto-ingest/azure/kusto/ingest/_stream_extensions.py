@@ -1,32 +1,86 @@
 import io
+import zlib
 
-from typing import IO, AnyStr
+from typing import IO, AnyStr, Iterable, Optional
+
+from azure.kusto.data import metrics
+
+
+# The initial capacity of the buffer of read_until_size_or_end, when the size of the stream isn't known. It doubles as it fills.
+_INITIAL_BUFFER_SIZE = 64 * 1024
+
+
+def _readinto(stream: IO[AnyStr], buffer: memoryview) -> Optional[int]:
+    """Reads into the buffer directly if the stream supports it, and otherwise copies what it reads."""
+    readinto = getattr(stream, "readinto", None)
+    if readinto is not None:
+        return readinto(buffer)
+
+    data = stream.read(len(buffer))
+    if isinstance(data, str):
+        raise TypeError("Expected a binary stream, found a text stream")
+    buffer[: len(data)] = data
+    return len(data)
+
+
+def remaining_length(stream: IO[AnyStr]) -> Optional[int]:
+    """Returns the number of bytes left in a seekable stream, or None if it isn't seekable."""
+    try:
+        if stream.seekable():
+            position = stream.tell()
+            return stream.seek(0, io.SEEK_END) - stream.seek(position, io.SEEK_SET)
+    except (AttributeError, OSError, ValueError):
+        pass
+    return None
 
 
 def read_until_size_or_end(stream: IO[AnyStr], size: int) -> io.BytesIO:
-    pos = 0
+    """
+    Reads up to `size` bytes from the stream into memory.
+    The data is read directly into the buffer of the returned BytesIO, without intermediate copies.
+    The buffer is sized by the remaining length of the stream if it is seekable, and grows geometrically otherwise.
+    """
+    remaining = remaining_length(stream)
+    capacity = 0
     result = io.BytesIO()
+    pos = 0
     while True:
-        try:
-            returned = stream.read(size - pos)
-            pos += len(returned)
-            result.write(returned)
-
-            if len(returned) == 0 or pos == size:
-                result.seek(0, io.SEEK_SET)
-                return result
+        if pos == capacity:
+            if capacity == size or (remaining is not None and capacity >= remaining > 0):
+                break
+            if remaining is not None and capacity == 0:
+                capacity = min(size, max(remaining, 1))
+            else:
+                capacity = min(size, max(capacity * 2, _INITIAL_BUFFER_SIZE))
+            # Extend the BytesIO's own buffer (zero filled) to the capacity, so the stream can be read directly into it
+            result.seek(capacity - 1)
+            result.write(b"\0")
 
+        try:
+            with result.getbuffer() as buffer, buffer[pos:capacity] as target:
+                returned = _readinto(stream, target)
         except BlockingIOError:
             continue
+        if returned is None:
+            # A non-blocking stream with no data available yet
+            continue
+        if returned == 0:
+            break
+        pos += returned
+
+    result.truncate(pos)
+    result.seek(0, io.SEEK_SET)
+    return result
 
 
 class ChainStream(io.RawIOBase):
     """
-    https://stackoverflow.com/questions/24528278/stream-multiple-files-into-a-readable-object-in-python
+    A readable stream of the concatenation of streams.
+    Streams that support readinto are read directly into the caller's buffer, so data is not copied on the way.
+    Every stream is closed once it is exhausted.
     """
 
     def __init__(self, streams):
-        self.leftover = b""
         self.stream_iter = iter(streams)
         try:
             self.stream = next(self.stream_iter)
@@ -36,33 +90,20 @@ class ChainStream(io.RawIOBase):
     def readable(self):
         return True
 
-    def _read_next_chunk(self, max_length):
-        # Return 0 or more bytes from the current stream, first returning all
-        # leftover bytes. If the stream is closed returns b''
-        if self.leftover:
-            return self.leftover
-        elif self.stream is not None:
-            return self.stream.read(max_length)
-        else:
-            return b""
-
     def readinto(self, b):
-        buffer_length = len(b)
-        chunk = self._read_next_chunk(buffer_length)
-        while len(chunk) == 0:
+        buffer = memoryview(b).cast("B")
+        while self.stream is not None:
+            returned = _readinto(self.stream, buffer)
+            if returned != 0:
+                # Either data, or None for a non-blocking stream with no data available yet
+                return returned
+
             # move to next stream
-            if self.stream is not None:
-                self.stream.close()
-            try:
-                self.stream = next(self.stream_iter)
-                chunk = self._read_next_chunk(buffer_length)
-            except StopIteration:
-                # No more streams to chain together
-                self.stream = None
-                return 0  # indicate EOF
-        output, self.leftover = chunk[:buffer_length], chunk[buffer_length:]
-        b[: len(output)] = output
-        return len(output)
+            self.stream.close()
+            self.stream = next(self.stream_iter, None)
+
+        # No more streams to chain together
+        return 0
 
 
 def chain_streams(streams, buffer_size=io.DEFAULT_BUFFER_SIZE):
@@ -76,3 +117,58 @@ def chain_streams(streams, buffer_size=io.DEFAULT_BUFFER_SIZE):
         f.read()
     """
     return io.BufferedReader(ChainStream(streams), buffer_size=buffer_size)
+
+
+class GzipChunkStream(io.RawIOBase):
+    """
+    A readable stream of the gzip compression of an iterable of byte chunks.
+    Chunks are pulled from the iterable and compressed only as the stream is read, so the whole payload is never held in memory.
+    Its compression ratio is recorded once the iterable is exhausted.
+    """
+
+    # zlib's wbits for a gzip header and trailer
+    _GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+    def __init__(self, chunks: Iterable[bytes], compression_level: int = zlib.Z_DEFAULT_COMPRESSION):
+        self._chunks = iter(chunks)
+        self._compressor = zlib.compressobj(compression_level, zlib.DEFLATED, self._GZIP_WBITS)
+        self._pending = bytearray()
+        self.uncompressed_size = 0
+        self.compressed_size = 0
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        while not self._pending and self._compressor is not None:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                compressed = self._compressor.flush()
+                self._compressor = None
+            else:
+                self.uncompressed_size += len(chunk)
+                compressed = self._compressor.compress(chunk)
+            self.compressed_size += len(compressed)
+            self._pending += compressed
+            if self._compressor is None:
+                metrics._record_compression(self.uncompressed_size, self.compressed_size)
+
+    def readinto(self, b):
+        self._fill()
+        size = min(len(b), len(self._pending))
+        b[:size] = self._pending[:size]
+        del self._pending[:size]
+        return size
+
+
+def compress_chunks(chunks: Iterable[bytes], buffer_size=io.DEFAULT_BUFFER_SIZE) -> io.BufferedReader:
+    """
+    Lazily gzip an iterable of byte chunks into a single buffered stream.
+    Usage:
+        def generate_lines():
+            for row in rows:
+                yield row.encode("utf-8") + b"\n"
+        f = compress_chunks(generate_lines())
+        f.read()
+    """
+    return io.BufferedReader(GzipChunkStream(chunks), buffer_size=buffer_size)
@@ -0,0 +1,92 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import time
+from threading import Lock
+from typing import Callable, Dict, Tuple
+
+from azure.kusto.data.exceptions import OneApiError
+
+# Error codes that mean streaming ingestion isn't enabled for the table, the database or the cluster
+_STREAMING_DISABLED_ERROR_CODES = frozenset(
+    {
+        "BadRequest_StreamingIngestionPolicyNotEnabled",
+        "BadRequest_StreamingIngestionDisabledForCluster",
+    }
+)
+
+
+def is_streaming_disabled_error(error: OneApiError) -> bool:
+    return error.code in _STREAMING_DISABLED_ERROR_CODES
+
+
+class _TableStreamingState:
+    def __init__(self):
+        self.consecutive_failures = 0
+        # While the circuit is open, streaming isn't attempted until this time
+        self.retry_time = 0.0
+
+
+class _StreamingCapabilityCache:
+    """
+    Remembers, per (database, table), whether streaming ingestion works, as a circuit breaker.
+    A table is skipped (the circuit is open) once streaming is known to be disabled for it, or after repeated transient failures.
+    Once the skip period ends, a single ingestion is let through as a probe - its success closes the circuit again,
+    and every other ingestion keeps skipping streaming until the next probe.
+    """
+
+    DEFAULT_TIME_PROVIDER_IN_SECONDS: Callable[[], float] = time.monotonic
+
+    def __init__(
+        self,
+        disabled_ttl: float = 15 * 60,
+        failure_ttl: float = 60,
+        failure_threshold: int = 3,
+        time_provider: Callable[[], float] = DEFAULT_TIME_PROVIDER_IN_SECONDS,
+    ):
+        """
+        :param disabled_ttl: seconds to skip streaming for a table after streaming was found to be disabled for it.
+        :param failure_ttl: seconds to skip streaming for a table after failure_threshold consecutive transient failures.
+        :param failure_threshold: number of consecutive failed ingestions (each after all of its retries) that open the circuit.
+        :param time_provider: the clock, for tests.
+        """
+        self.disabled_ttl = disabled_ttl
+        self.failure_ttl = failure_ttl
+        self.failure_threshold = failure_threshold
+        self.time_provider = time_provider
+        self._lock = Lock()
+        self._tables: Dict[Tuple[str, str], _TableStreamingState] = {}
+
+    def should_stream(self, database: str, table: str) -> bool:
+        state = self._tables.get((database, table))
+        if state is None:
+            return True
+
+        with self._lock:
+            if state.consecutive_failures < self.failure_threshold:
+                return True
+            now = self.time_provider()
+            if now < state.retry_time:
+                return False
+            # Let this ingestion probe the table, and hold off the others until the probe's outcome is reported (or another TTL passes)
+            state.retry_time = now + self.failure_ttl
+            return True
+
+    def report_success(self, database: str, table: str):
+        if (database, table) in self._tables:
+            with self._lock:
+                self._tables.pop((database, table), None)
+
+    def report_failure(self, database: str, table: str):
+        """Reports an ingestion that failed to stream after all of its retries, due to transient errors."""
+        self._open(database, table, self.failure_ttl, 1)
+
+    def report_disabled(self, database: str, table: str):
+        """Reports that streaming ingestion is disabled for the table. The circuit opens immediately."""
+        self._open(database, table, self.disabled_ttl, self.failure_threshold)
+
+    def _open(self, database: str, table: str, ttl: float, failures: int):
+        with self._lock:
+            state = self._tables.setdefault((database, table), _TableStreamingState())
+            state.consecutive_failures = min(state.consecutive_failures + failures, self.failure_threshold)
+            if state.consecutive_failures >= self.failure_threshold:
+                state.retry_time = self.time_provider() + ttl
@@ -1,19 +1,19 @@
 import ipaddress
-import os
-import tempfile
 import time
 import uuid
 from abc import ABCMeta, abstractmethod
 from copy import copy
 from enum import Enum
-from io import TextIOWrapper
-from typing import TYPE_CHECKING, Union, IO, AnyStr, Optional, Tuple
+from io import BytesIO, TextIOWrapper
+from typing import TYPE_CHECKING, Any, Union, IO, AnyStr, Iterable, List, Mapping, Optional, Sequence, Tuple
 from urllib.parse import urlparse
 
 from azure.kusto.data.data_format import DataFormat
 from azure.kusto.data.exceptions import KustoClosedError
 
-from .descriptors import FileDescriptor, StreamDescriptor
+from ._records import record_batches
+from ._stream_extensions import compress_chunks
+from .descriptors import BlobDescriptor, FileDescriptor, StreamDescriptor
 from .ingestion_properties import IngestionProperties
 
 
@@ -34,6 +34,10 @@ class IngestionStatus(Enum):
     The ingestion was successfully streamed
     """
     SUCCESS = "SUCCESS"
+    """
+    Storage was unavailable, so the ingestion was persisted to the client's local spool directory, and will be queued once storage recovers
+    """
+    SPOOLED = "SPOOLED"
 
 
 class IngestionResult:
@@ -72,6 +76,40 @@ class IngestionResult:
         return f"IngestionResult(status={self.status}, database={self.database}, table={self.table}, source_id={self.source_id}{blob_uri})"
 
 
+class BulkIngestionResult:
+    """
+    The result of ingesting a single source as part of a bulk ingestion.
+    A failure of one source does not affect the others, so each source has either a result or an error.
+    """
+
+    source: Union[FileDescriptor, BlobDescriptor, str, "pandas.DataFrame"]
+    "The source, as it was passed to the bulk ingestion method (or the chunk, when ingesting a DataFrame in chunks)."
+
+    result: Optional[IngestionResult]
+    "The result of the ingestion, if it succeeded."
+
+    error: Optional[Exception]
+    "The error the ingestion failed with, if it failed."
+
+    def __init__(
+        self,
+        source: Union[FileDescriptor, BlobDescriptor, str, "pandas.DataFrame"],
+        result: Optional[IngestionResult] = None,
+        error: Optional[Exception] = None,
+    ):
+        self.source = source
+        self.result = result
+        self.error = error
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None and self.result is not None
+
+    def __repr__(self):
+        outcome = f"result={self.result}" if self.error is None else f"error={self.error!r}"
+        return f"BulkIngestionResult({outcome})"
+
+
 class BaseIngestClient(metaclass=ABCMeta):
     def __init__(self):
         self._is_closed: bool = False
@@ -101,33 +139,83 @@ class BaseIngestClient(metaclass=ABCMeta):
         if self._is_closed:
             raise KustoClosedError()
 
-    def ingest_from_dataframe(self, df: "pandas.DataFrame", ingestion_properties: IngestionProperties) -> IngestionResult:
-        """Enqueue an ingest command from local files.
+    def ingest_from_dataframe(
+        self, df: "pandas.DataFrame", ingestion_properties: IngestionProperties, data_format: Optional[DataFormat] = None
+    ) -> IngestionResult:
+        """Ingest from a pandas DataFrame.
+        The DataFrame is serialized in memory, without temporary files. CSV is serialized and compressed lazily, as it is being sent.
         To learn more about ingestion methods go to:
         https://docs.microsoft.com/en-us/azure/data-explorer/ingest-data-overview#ingestion-methods
         :param pandas.DataFrame df: input dataframe to ingest.
-        :param azure.kusto.ingest.IngestionProperties ingestion_properties: Ingestion properties.
+        :param azure.kusto.ingest.IngestionProperties ingestion_properties: Ingestion properties. Its format is set to the serialization format.
+        :param Optional[DataFormat] data_format: The serialization format - DataFormat.CSV (the default) or DataFormat.PARQUET.
+            Parquet preserves the column types, and requires pandas' parquet support (pyarrow or fastparquet) to be installed.
         """
 
         if self._is_closed:
             raise KustoClosedError()
 
+        data_format = BaseIngestClient._validate_dataframe(df, data_format)
+        ingestion_properties.format = data_format
+        stream_descriptor = BaseIngestClient._dataframe_to_stream_descriptor(df, data_format)
+        return self.ingest_from_stream(stream_descriptor, ingestion_properties)
+
+    # The raw size after which records are split into another blob
+    _MAX_RECORDS_BATCH_SIZE_IN_BYTES = 100 * 1024 * 1024
+
+    def ingest_from_records(
+        self, records: Iterable[Union[Mapping[str, Any], Sequence[Any]]], ingestion_properties: IngestionProperties, max_batch_size: Optional[int] = None
+    ) -> List[IngestionResult]:
+        """Ingest from an iterable of records, such as dicts or tuples, without building a DataFrame or a file first.
+        The records are serialized and compressed lazily according to ingestion_properties.format - JSON lines for JSON and MULTIJSON,
+        or delimited rows for the CSV family (mappings are written by the order of their values). Other formats are not supported.
+        The records are split into batches of a bounded raw size, and each batch is ingested as its own stream,
+        so memory stays flat even for unbounded generators. ManagedStreamingIngestClient streams batches that are small enough.
+        :param records: the records to ingest. May be a lazy, unbounded iterable.
+        :param azure.kusto.ingest.IngestionProperties ingestion_properties: Ingestion properties.
+        :param int max_batch_size: the raw size in bytes after which the records are split into another batch. Defaults to 100MB.
+        :return: an IngestionResult per batch.
+        """
+        if self._is_closed:
+            raise KustoClosedError()
+
+        batches = record_batches(records, ingestion_properties.format, max_batch_size or self._MAX_RECORDS_BATCH_SIZE_IN_BYTES)
+        return [self.ingest_from_stream(batch, ingestion_properties) for batch in batches]
+
+    @staticmethod
+    def _validate_dataframe(df: "pandas.DataFrame", data_format: Optional[DataFormat]) -> DataFormat:
+        """Validates the input of a DataFrame ingestion, and returns the serialization format to use."""
         from pandas import DataFrame
 
         if not isinstance(df, DataFrame):
             raise ValueError("Expected DataFrame instance, found {}".format(type(df)))
 
-        file_name = "df_{id}_{timestamp}_{uid}.csv.gz".format(id=id(df), timestamp=int(time.time()), uid=uuid.uuid4())
-        temp_file_path = os.path.join(tempfile.gettempdir(), file_name)
+        data_format = data_format or DataFormat.CSV
+        if data_format not in (DataFormat.CSV, DataFormat.PARQUET):
+            raise ValueError("DataFrames can only be ingested as {} or {}, found {}".format(DataFormat.CSV, DataFormat.PARQUET, data_format))
+        return data_format
 
-        df.to_csv(temp_file_path, index=False, encoding="utf-8", header=False, compression="gzip")
+    # The number of DataFrame rows serialized to CSV at a time, when streaming a DataFrame
+    _DATAFRAME_CHUNK_ROWS = 10_000
 
-        ingestion_properties.format = DataFormat.CSV
-
-        try:
-            return self.ingest_from_file(temp_file_path, ingestion_properties)
-        finally:
-            os.unlink(temp_file_path)
+    @staticmethod
+    def _dataframe_to_stream_descriptor(df: "pandas.DataFrame", data_format: DataFormat) -> StreamDescriptor:
+        name = "df_{id}_{timestamp}_{uid}".format(id=id(df), timestamp=int(time.time()), uid=uuid.uuid4())
+        # The exact serialized size is only known after serialization, the in-memory size is a close enough hint for the service
+        size = int(df.memory_usage(index=False, deep=True).sum()) or None
+
+        if data_format == DataFormat.PARQUET:
+            stream = BytesIO()
+            df.to_parquet(stream, index=False)
+            stream.seek(0)
+            return StreamDescriptor(stream, is_compressed=False, stream_name=name + ".parquet", size=stream.getbuffer().nbytes)
+
+        def csv_chunks():
+            for start in range(0, len(df), BaseIngestClient._DATAFRAME_CHUNK_ROWS):
+                chunk = df.iloc[start : start + BaseIngestClient._DATAFRAME_CHUNK_ROWS]
+                yield chunk.to_csv(index=False, header=False).encode("utf-8")
+
+        return StreamDescriptor(compress_chunks(csv_chunks()), is_compressed=True, stream_name=name + ".csv.gz", size=size)
 
     @staticmethod
     def _prepare_stream(stream_descriptor: Union[StreamDescriptor, IO[AnyStr]], ingestion_properties: IngestionProperties) -> StreamDescriptor:
@@ -12,6 +12,7 @@ from io import BytesIO, SEEK_END
 from typing import Union, Optional, AnyStr, IO, List, Dict
 from zipfile import ZipFile
 
+from azure.kusto.data import metrics
 from azure.storage.blob import BlobClient
 
 OptionalUUID = Optional[Union[str, uuid.UUID]]
@@ -115,6 +116,8 @@ class FileDescriptor(DescriptorBase):
         file_stream = BytesIO()
         with open(self.path, "rb") as f_in, GzipFile(filename="data", fileobj=file_stream, mode="wb") as f_out:
             shutil.copyfileobj(f_in, f_out)
+            raw_size = f_in.tell()
+        metrics._record_compression(raw_size, file_stream.tell())
         file_stream.seek(0)
         return file_stream
 
@@ -194,6 +197,8 @@ class StreamDescriptor(DescriptorBase):
                 f_out.write(data)
             else:
                 f_out.write(stream_buffer)
+            raw_size = f_out.tell()
+        metrics._record_compression(raw_size, zipped_stream.tell())
         zipped_stream.seek(0)
         self.is_compressed = True
         self.stream_name += ".gz"
@@ -1,5 +1,8 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
+from typing import List, Sequence
+from uuid import UUID
+
 from azure.kusto.data.exceptions import KustoClientError
 
 
@@ -43,3 +46,20 @@ class KustoQueueError(KustoClientError):
     def __init__(self):
         message = "Failed to upload message to queues in all reties."
         super(KustoQueueError, self).__init__(message)
+
+
+class KustoPartialIngestionError(KustoClientError):
+    """
+    Raised when some chunks of a split stream failed to ingest, after others were already ingested.
+    The ingested chunks can't be undone, so retrying the whole stream duplicates them - their source ids identify the data that landed.
+    The error of the first failed chunk is the cause of this error.
+    """
+
+    def __init__(self, source_id: UUID, ingested_source_ids: Sequence[UUID], errors: Sequence[Exception]):
+        self.source_id = source_id
+        self.ingested_source_ids: List[UUID] = list(ingested_source_ids)
+        self.errors: List[Exception] = list(errors)
+        message = "Failed to ingest {} chunk(s) of the stream with source id {}. {} chunk(s) were ingested, with source ids: {}".format(
+            len(self.errors), source_id, len(self.ingested_source_ids), ", ".join(str(ingested) for ingested in self.ingested_source_ids) or "none"
+        )
+        super(KustoPartialIngestionError, self).__init__(message)
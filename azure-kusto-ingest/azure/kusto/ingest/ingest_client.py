@@ -1,28 +1,35 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
+import os
 import random
-from typing import Union, AnyStr, IO, List, Optional, Dict
+import time
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import TYPE_CHECKING, Union, AnyStr, IO, Iterable, List, Optional, Dict
 from urllib.parse import urlparse
 
-from azure.storage.blob import BlobServiceClient
-
-from azure.core.tracing.decorator import distributed_trace
 from azure.core.tracing import SpanKind
-from azure.storage.queue import QueueServiceClient, TextBase64EncodePolicy
 
-from azure.kusto.data import KustoClient, KustoConnectionStringBuilder
+from azure.kusto.data import KustoClient, KustoConnectionStringBuilder, metrics
 from azure.kusto.data._telemetry import MonitoredActivity
+from azure.kusto.data.data_format import DataFormat
 from azure.kusto.data.exceptions import KustoClosedError, KustoServiceError
 
+from ._blob_enqueuer import EnqueueMetrics, _BlobEnqueuer
+from ._bulk_ingest import _BulkIngestPipeline
+from ._ingestion_spool import UNAVAILABLE_ERRORS, _IngestionSpool
 from ._ingest_telemetry import IngestTracingAttributes
 from ._resource_manager import _ResourceManager, _ResourceUri
-from .base_ingest_client import BaseIngestClient, IngestionResult, IngestionStatus
+from .base_ingest_client import BaseIngestClient, BulkIngestionResult, IngestionResult, IngestionStatus
 from .descriptors import BlobDescriptor, FileDescriptor, StreamDescriptor
 from .exceptions import KustoInvalidEndpointError, KustoQueueError
 from azure.kusto.data.exceptions import KustoBlobError
 from .ingestion_blob_info import IngestionBlobInfo
 from .ingestion_properties import IngestionProperties
 
+if TYPE_CHECKING:
+    import pandas
+
 
 class QueuedIngestClient(BaseIngestClient):
     """
@@ -35,9 +42,28 @@ class QueuedIngestClient(BaseIngestClient):
     _SERVICE_CLIENT_TIMEOUT_SECONDS = 10 * 60
     _MAX_RETRIES = 3
 
-    def __init__(self, kcsb: Union[str, KustoConnectionStringBuilder], auto_correct_endpoint: bool = True):
+    def __init__(
+        self,
+        kcsb: Union[str, KustoConnectionStringBuilder],
+        auto_correct_endpoint: bool = True,
+        resources_snapshot_path: Optional[str] = None,
+        spool_directory: Optional[str] = None,
+        spool_max_replays_per_second: float = 10.0,
+        share_resources: bool = False,
+    ):
         """Kusto Ingest Client constructor.
         :param kcsb: The connection string to initialize KustoClient.
+        :param resources_snapshot_path: Optional path of a local file in which the ingestion resources and identity token are persisted.
+            New clients load them from the file if they are still valid, so they can start ingesting without waiting for the service.
+            The file contains secrets (SAS uris and an identity token), and should be kept in a private location.
+        :param spool_directory: Optional path of a local directory to spool ingestions to when storage is unavailable.
+            Ingestions whose upload or enqueue fails after all retries, or that are made while no storage account is healthy,
+            are persisted to the directory and return IngestionStatus.SPOOLED instead of raising (or waiting for storage).
+            A background thread replays them once storage is healthy again, including ones left by previous processes.
+            The directory contains secrets (the identity token), and should be kept in a private location.
+        :param spool_max_replays_per_second: the maximal rate in which spooled ingestions are replayed.
+        :param share_resources: Share the HTTP connection pool and the token provider with the other clients of the cluster in the process
+            that share resources. See azure.kusto.data.KustoClient.
         """
         super().__init__()
         if not isinstance(kcsb, KustoConnectionStringBuilder):
@@ -48,13 +74,25 @@ class QueuedIngestClient(BaseIngestClient):
 
         self._proxy_dict: Optional[Dict[str, str]] = None
         self._connection_datasource = kcsb.data_source
-        self._resource_manager = _ResourceManager(KustoClient(kcsb))
+        self._resource_manager = _ResourceManager(KustoClient(kcsb, share_resources=share_resources), resources_snapshot_path)
         self._endpoint_service_type = None
         self._suggested_endpoint_uri = None
         self.application_for_tracing = kcsb.client_details.application_for_tracing
         self.client_version_for_tracing = kcsb.client_details.version_for_tracing
+        self._blob_enqueuer: Optional[_BlobEnqueuer] = None
+        self._blob_enqueuer_lock = Lock()
+        self._spool = (
+            _IngestionSpool(spool_directory, self._replay_spooled, self._resource_manager.has_healthy_storage_accounts, spool_max_replays_per_second)
+            if spool_directory
+            else None
+        )
 
     def close(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+        with self._blob_enqueuer_lock:
+            if self._blob_enqueuer is not None:
+                self._blob_enqueuer.close()
         self._resource_manager.close()
         super().close()
 
@@ -62,7 +100,7 @@ class QueuedIngestClient(BaseIngestClient):
         self._resource_manager.set_proxy(proxy_url)
         self._proxy_dict = {"http": proxy_url, "https": proxy_url}
 
-    @distributed_trace(name_of_span="QueuedIngestClient.ingest_from_file", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(name_of_span="QueuedIngestClient.ingest_from_file", kind=SpanKind.CLIENT)
     def ingest_from_file(self, file_descriptor: Union[FileDescriptor, str], ingestion_properties: IngestionProperties) -> IngestionResult:
         """Enqueue an ingest command from local files.
         To learn more about ingestion methods go to:
@@ -75,23 +113,11 @@ class QueuedIngestClient(BaseIngestClient):
 
         super().ingest_from_file(file_descriptor, ingestion_properties)
 
-        containers = self._get_containers()
-
         file_descriptor, should_compress = BaseIngestClient._prepare_file(file_descriptor, ingestion_properties)
         with file_descriptor.open(should_compress) as stream:
-            blob_descriptor = self.upload_blob(
-                containers,
-                file_descriptor,
-                ingestion_properties.database,
-                ingestion_properties.table,
-                stream,
-                self._proxy_dict,
-                self._SERVICE_CLIENT_TIMEOUT_SECONDS,
-                self._MAX_RETRIES,
-            )
-        return self.ingest_from_blob(blob_descriptor, ingestion_properties=ingestion_properties)
+            return self._upload_and_enqueue(file_descriptor, stream, file_descriptor.is_compressed or should_compress, ingestion_properties)
 
-    @distributed_trace(name_of_span="QueuedIngestClient.ingest_from_stream", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(name_of_span="QueuedIngestClient.ingest_from_stream", kind=SpanKind.CLIENT)
     def ingest_from_stream(self, stream_descriptor: Union[StreamDescriptor, IO[AnyStr]], ingestion_properties: IngestionProperties) -> IngestionResult:
         """Ingest from io streams.
         :param stream_descriptor: An object that contains a description of the stream to be ingested.
@@ -102,22 +128,62 @@ class QueuedIngestClient(BaseIngestClient):
 
         super().ingest_from_stream(stream_descriptor, ingestion_properties)
 
-        containers = self._get_containers()
-
         stream_descriptor = BaseIngestClient._prepare_stream(stream_descriptor, ingestion_properties)
+        return self._upload_and_enqueue(stream_descriptor, stream_descriptor.stream, stream_descriptor.is_compressed, ingestion_properties)
+
+    def _upload_and_enqueue(
+        self, descriptor: Union[FileDescriptor, StreamDescriptor], stream: IO[AnyStr], is_compressed: bool, ingestion_properties: IngestionProperties
+    ) -> IngestionResult:
+        if self._spool is not None and not self._resource_manager.has_healthy_storage_accounts():
+            return self._spool_stream(descriptor, stream, is_compressed, ingestion_properties)
+
+        start_position = stream.tell() if self._spool is not None and stream.seekable() else None
+        try:
+            blob_descriptor = self.upload_blob(
+                self._get_containers(),
+                descriptor,
+                ingestion_properties.database,
+                ingestion_properties.table,
+                stream,
+                self._proxy_dict,
+                self._SERVICE_CLIENT_TIMEOUT_SECONDS,
+                self._MAX_RETRIES,
+            )
+        except UNAVAILABLE_ERRORS:
+            # Storage, or the service that hands out the containers, is unavailable. Streams that can't be read again can't be spooled.
+            if start_position is None:
+                raise
+            stream.seek(start_position)
+            return self._spool_stream(descriptor, stream, is_compressed, ingestion_properties)
+
+        return self.ingest_from_blob(blob_descriptor, ingestion_properties=ingestion_properties)
+
+    def _spool_stream(
+        self, descriptor: Union[FileDescriptor, StreamDescriptor], stream: IO[AnyStr], is_compressed: bool, ingestion_properties: IngestionProperties
+    ) -> IngestionResult:
+        stream_descriptor = StreamDescriptor(
+            stream, descriptor.source_id, is_compressed=is_compressed, stream_name=descriptor.stream_name, size=descriptor.size
+        )
+        self._spool.spool_stream(stream, stream_descriptor, ingestion_properties)
+        return IngestionResult(IngestionStatus.SPOOLED, ingestion_properties.database, ingestion_properties.table, descriptor.source_id)
+
+    def _replay_spooled(self, source: Union[StreamDescriptor, BlobDescriptor], ingestion_properties: IngestionProperties):
+        if isinstance(source, BlobDescriptor):
+            return self._enqueue_blob(source, ingestion_properties)
+
         blob_descriptor = self.upload_blob(
-            containers,
-            stream_descriptor,
+            self._get_containers(),
+            source,
             ingestion_properties.database,
             ingestion_properties.table,
-            stream_descriptor.stream,
+            source.stream,
             self._proxy_dict,
             self._SERVICE_CLIENT_TIMEOUT_SECONDS,
             self._MAX_RETRIES,
         )
-        return self.ingest_from_blob(blob_descriptor, ingestion_properties=ingestion_properties)
+        return self._enqueue_blob(blob_descriptor, ingestion_properties)
 
-    @distributed_trace(name_of_span="QueuedIngestClient.ingest_from_blob", kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(name_of_span="QueuedIngestClient.ingest_from_blob", kind=SpanKind.CLIENT)
     def ingest_from_blob(self, blob_descriptor: BlobDescriptor, ingestion_properties: IngestionProperties) -> IngestionResult:
         """Enqueue an ingest command from azure blobs.
         To learn more about ingestion methods go to:
@@ -130,6 +196,21 @@ class QueuedIngestClient(BaseIngestClient):
         if self._is_closed:
             raise KustoClosedError()
 
+        if self._spool is None:
+            return self._enqueue_blob(blob_descriptor, ingestion_properties)
+
+        if self._resource_manager.has_healthy_storage_accounts():
+            try:
+                return self._enqueue_blob(blob_descriptor, ingestion_properties)
+            except UNAVAILABLE_ERRORS:
+                # The queues, or the service that hands them out along with the authorization context, are unavailable
+                pass
+        self._spool.spool_blob(blob_descriptor, ingestion_properties)
+        return IngestionResult(
+            IngestionStatus.SPOOLED, ingestion_properties.database, ingestion_properties.table, blob_descriptor.source_id, blob_descriptor.path
+        )
+
+    def _enqueue_blob(self, blob_descriptor: BlobDescriptor, ingestion_properties: IngestionProperties) -> IngestionResult:
         queues = self._resource_manager.get_ingestion_queues()
 
         authorization_context = self._resource_manager.get_authorization_context()
@@ -143,15 +224,15 @@ class QueuedIngestClient(BaseIngestClient):
         ingestion_blob_info_json = ingestion_blob_info.to_json()
         retries_left = min(self._MAX_RETRIES, len(queues))
         for queue in queues:
+            start_time = time.perf_counter()
             try:
-                with QueueServiceClient(queue.account_uri, proxies=self._proxy_dict) as queue_service:
-                    with queue_service.get_queue_client(queue=queue.object_name, message_encode_policy=TextBase64EncodePolicy()) as queue_client:
-                        # trace enqueuing of blob for ingestion
-                        invoker = lambda: queue_client.send_message(content=ingestion_blob_info_json, timeout=self._SERVICE_CLIENT_TIMEOUT_SECONDS)
-                        enqueue_trace_attributes = IngestTracingAttributes.create_enqueue_request_attributes(queue_client.queue_name, blob_descriptor.source_id)
-                        MonitoredActivity.invoke(invoker, name_of_span="QueuedIngestClient.enqueue_request", tracing_attributes=enqueue_trace_attributes)
-
-                self._resource_manager.report_resource_usage_result(queue.storage_account_name, True)
+                queue_client = self._resource_manager.get_queue_client(queue, self._proxy_dict)
+                # trace enqueuing of blob for ingestion
+                invoker = lambda: queue_client.send_message(content=ingestion_blob_info_json, timeout=self._SERVICE_CLIENT_TIMEOUT_SECONDS)
+                enqueue_trace_attributes = lambda: IngestTracingAttributes.create_enqueue_request_attributes(queue_client.queue_name, blob_descriptor.source_id)
+                MonitoredActivity.invoke(invoker, name_of_span="QueuedIngestClient.enqueue_request", tracing_attributes=enqueue_trace_attributes)
+
+                self._resource_manager.report_resource_usage_result(queue.storage_account_name, True, time.perf_counter() - start_time)
                 return IngestionResult(
                     IngestionStatus.QUEUED, ingestion_properties.database, ingestion_properties.table, blob_descriptor.source_id, blob_descriptor.path
                 )
@@ -161,6 +242,102 @@ class QueuedIngestClient(BaseIngestClient):
                 self._resource_manager.report_resource_usage_result(queue.storage_account_name, False)
                 if retries_left == 0:
                     raise KustoQueueError() from e
+                metrics._record_retry(metrics.ENQUEUE, **{metrics.STORAGE_ACCOUNT: queue.storage_account_name})
+
+    @MonitoredActivity.trace(name_of_span="QueuedIngestClient.ingest_from_files", kind=SpanKind.CLIENT)
+    def ingest_from_files(
+        self,
+        file_descriptors: Iterable[Union[FileDescriptor, str]],
+        ingestion_properties: IngestionProperties,
+        max_concurrent_reads: int = 4,
+        max_concurrent_uploads: int = 16,
+        max_concurrent_enqueues: int = 16,
+    ) -> List[BulkIngestionResult]:
+        """Enqueue ingest commands for many local files concurrently.
+        Each file is read (and compressed if needed), uploaded and enqueued, and each of these stages runs on its own bounded thread pool.
+        The failure of one file does not stop the others.
+        :param file_descriptors: FileDescriptors or paths of the files to be ingested. May be a lazy iterable.
+        :param azure.kusto.ingest.IngestionProperties ingestion_properties: Ingestion properties, shared by all files.
+        :param int max_concurrent_reads: maximal number of files being read and compressed at once.
+        :param int max_concurrent_uploads: maximal number of concurrent blob uploads.
+        :param int max_concurrent_enqueues: maximal number of concurrent queue messages.
+        :return: a BulkIngestionResult per file, in the order of the input.
+        """
+        if self._is_closed:
+            raise KustoClosedError()
+
+        pipeline = _BulkIngestPipeline(self, ingestion_properties, max_concurrent_reads, max_concurrent_uploads, max_concurrent_enqueues)
+        return pipeline.ingest_files(file_descriptors)
+
+    @MonitoredActivity.trace(name_of_span="QueuedIngestClient.ingest_from_blobs", kind=SpanKind.CLIENT)
+    def ingest_from_blobs(
+        self, blob_descriptors: Iterable[BlobDescriptor], ingestion_properties: IngestionProperties, max_concurrent_enqueues: int = 16
+    ) -> List[BulkIngestionResult]:
+        """Enqueue ingest commands for many azure blobs concurrently.
+        This is the high rate path for registering existing blobs: the ingestion message is serialized once for all blobs (except their own fields),
+        and the messages are sent by the client's long-lived pool of senders, spread round-robin across the ranked ingestion queues.
+        The failure of one blob does not stop the others.
+        :param blob_descriptors: BlobDescriptors of the blobs to be ingested. May be a lazy iterable.
+        :param azure.kusto.ingest.IngestionProperties ingestion_properties: Ingestion properties, shared by all blobs.
+        :param int max_concurrent_enqueues: maximal number of concurrent queue messages.
+        :return: a BulkIngestionResult per blob, in the order of the input.
+        """
+        if self._is_closed:
+            raise KustoClosedError()
+
+        return self._get_blob_enqueuer().enqueue(blob_descriptors, ingestion_properties, max_concurrent_enqueues)
+
+    def get_enqueue_metrics(self) -> EnqueueMetrics:
+        """Returns the throughput of ingest_from_blobs over the lifetime of the client: messages sent, failed and retried, messages per second and per queue."""
+        return self._get_blob_enqueuer().get_metrics()
+
+    def _get_blob_enqueuer(self) -> _BlobEnqueuer:
+        if self._blob_enqueuer is None:
+            with self._blob_enqueuer_lock:
+                if self._blob_enqueuer is None:
+                    self._blob_enqueuer = _BlobEnqueuer(self)
+        return self._blob_enqueuer
+
+    @MonitoredActivity.trace(name_of_span="QueuedIngestClient.ingest_from_dataframe_in_chunks", kind=SpanKind.CLIENT)
+    def ingest_from_dataframe_in_chunks(
+        self,
+        df: "pandas.DataFrame",
+        ingestion_properties: IngestionProperties,
+        data_format: Optional[DataFormat] = None,
+        chunk_rows: int = 1_000_000,
+        max_concurrent_serializations: Optional[int] = None,
+        use_processes: bool = False,
+        max_concurrent_uploads: int = 16,
+        max_concurrent_enqueues: int = 16,
+    ) -> List[BulkIngestionResult]:
+        """Enqueue ingest commands for a large pandas DataFrame, split into chunks of rows.
+        The chunks are serialized in parallel, and every chunk is uploaded as its own blob with its own (accurate) raw data size,
+        so serialization of one chunk overlaps with the upload of another.
+        The failure of one chunk does not stop the others, so check every result.
+        :param pandas.DataFrame df: input dataframe to ingest.
+        :param azure.kusto.ingest.IngestionProperties ingestion_properties: Ingestion properties, shared by all chunks.
+        :param DataFormat data_format: Format to serialize the chunks to. Either DataFormat.CSV (default) or DataFormat.PARQUET.
+        :param int chunk_rows: number of rows in each chunk.
+        :param int max_concurrent_serializations: maximal number of chunks being serialized at once. Defaults to the number of CPUs.
+        :param bool use_processes: serialize in a process pool instead of threads.
+            This avoids contention on the GIL for wide frames, at the cost of pickling every chunk to the worker processes.
+        :param int max_concurrent_uploads: maximal number of concurrent blob uploads.
+        :param int max_concurrent_enqueues: maximal number of concurrent queue messages.
+        :return: a BulkIngestionResult per chunk, in the order of the rows.
+        """
+        if self._is_closed:
+            raise KustoClosedError()
+
+        data_format = BaseIngestClient._validate_dataframe(df, data_format)
+        ingestion_properties.format = data_format
+
+        max_concurrent_serializations = max_concurrent_serializations or os.cpu_count() or 1
+        pipeline = _BulkIngestPipeline(self, ingestion_properties, max_concurrent_serializations, max_concurrent_uploads, max_concurrent_enqueues)
+        if not use_processes:
+            return pipeline.ingest_dataframe(df, data_format, chunk_rows, None)
+
+        with ProcessPoolExecutor(max_concurrent_serializations) as serialization_executor:
+            return pipeline.ingest_dataframe(df, data_format, chunk_rows, serialization_executor)
 
     def _get_containers(self) -> List[_ResourceUri]:
         return self._resource_manager.get_containers()
@@ -191,11 +368,18 @@ class QueuedIngestClient(BaseIngestClient):
 
         retries_left = min(max_retries, len(containers))
         for container in containers:
+            start_time = time.perf_counter()
             try:
-                blob_service = BlobServiceClient(container.account_uri, proxies=proxy_dict)
+                blob_service = self._resource_manager.get_blob_service_client(container, proxy_dict)
                 blob_client = blob_service.get_blob_client(container=container.object_name, blob=blob_name)
+                start_position = stream.tell() if stream.seekable() else None
                 blob_client.upload_blob(data=stream, timeout=timeout)
-                self._resource_manager.report_resource_usage_result(container.storage_account_name, True)
+                upload_seconds = time.perf_counter() - start_time
+                self._resource_manager.report_resource_usage_result(container.storage_account_name, True, upload_seconds, descriptor.size)
+                # The uploaded size is known for seekable streams, others are counted by the size of their data, if it was given
+                uploaded_size = stream.tell() - start_position if start_position is not None else descriptor.size
+                metrics._record_ingest_size(uploaded_size, metrics.QUEUED, database, table)
+                metrics._record_upload(container.storage_account_name, uploaded_size, upload_seconds)
                 return BlobDescriptor(blob_client.url, descriptor.size, descriptor.source_id)
             except Exception as e:
                 retries_left = retries_left - 1
@@ -203,3 +387,4 @@ class QueuedIngestClient(BaseIngestClient):
                 self._resource_manager.report_resource_usage_result(container.storage_account_name, False)
                 if retries_left == 0:
                     raise KustoBlobError(e)
+                metrics._record_retry(metrics.UPLOAD, **{metrics.STORAGE_ACCOUNT: container.storage_account_name})
@@ -3,6 +3,7 @@
 import json
 import uuid
 from datetime import datetime
+from types import SimpleNamespace
 from typing import TYPE_CHECKING
 
 if TYPE_CHECKING:
@@ -71,6 +72,53 @@ class IngestionBlobInfo:
         return _convert_list_to_json(self.properties)
 
 
+class IngestionBlobInfoTemplate:
+    """
+    The ingestion messages of many blobs with the same ingestion properties.
+    Everything but the blob's own fields is serialized once, so each message only serializes its path, size, id and creation time.
+    The messages are identical to the ones of IngestionBlobInfo.
+    """
+
+    # Stands in for the blob while the shared properties are serialized
+    _PLACEHOLDER_BLOB = SimpleNamespace(path="", size=None, source_id="")
+
+    def __init__(self, ingestion_properties: "IngestionProperties", auth_context=None, application_for_tracing=None, client_version_for_tracing=None):
+        self.auth_context = auth_context
+        properties = IngestionBlobInfo(
+            self._PLACEHOLDER_BLOB,
+            ingestion_properties,
+            auth_context=auth_context,
+            application_for_tracing=application_for_tracing,
+            client_version_for_tracing=client_version_for_tracing,
+        ).properties
+
+        # Keep the order of IngestionBlobInfo: the path (and size), the properties before the creation time, the creation time and id, the rest
+        keys = list(properties)
+        creation_time_index = keys.index("SourceMessageCreationTime")
+        self._head = _convert_list_to_json({key: properties[key] for key in keys[1:creation_time_index]})[1:-1]
+        self._tail = _convert_list_to_json({key: properties[key] for key in keys[creation_time_index + 2 :]})[1:-1]
+
+    def to_json(self, blob_descriptor: "BlobDescriptor") -> str:
+        """Returns the ingestion message of a blob, as a json string"""
+        size = '"RawDataSize":' + _convert_list_to_json(blob_descriptor.size) + "," if blob_descriptor.size else ""
+        return "".join(
+            (
+                '{"BlobPath":',
+                _convert_list_to_json(blob_descriptor.path),
+                ",",
+                size,
+                self._head,
+                ',"SourceMessageCreationTime":"',
+                datetime.utcnow().isoformat(),
+                '","Id":"',
+                str(blob_descriptor.source_id),
+                '",',
+                self._tail,
+                "}",
+            )
+        )
+
+
 def _convert_list_to_json(array):
     """Converts array to a json string"""
     return json.dumps(array, skipkeys=False, allow_nan=False, indent=None, separators=(",", ":"))
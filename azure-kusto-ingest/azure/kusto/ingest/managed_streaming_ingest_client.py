@@ -1,21 +1,27 @@
 import uuid
-from io import SEEK_SET
+from concurrent.futures import ThreadPoolExecutor
+from gzip import GzipFile
+from io import SEEK_SET, BytesIO
+from threading import BoundedSemaphore
 from typing import AnyStr, IO, TYPE_CHECKING, Union, Optional
 
 from azure.kusto.ingest.descriptors import DescriptorBase
 from tenacity import Retrying, _utils, stop_after_attempt, wait_random_exponential
 
-from azure.core.tracing.decorator import distributed_trace
 from azure.core.tracing import SpanKind
 
-from azure.kusto.data import KustoConnectionStringBuilder
-from azure.kusto.data.exceptions import KustoApiError, KustoClosedError
+from azure.kusto.data import KustoConnectionStringBuilder, SlowQueryLog, metrics
+from azure.kusto.data.exceptions import KustoApiError, KustoClosedError, OneApiError
 from azure.kusto.data._telemetry import MonitoredActivity
 
 from . import BlobDescriptor, FileDescriptor, IngestionProperties, StreamDescriptor
 from ._ingest_telemetry import IngestTracingAttributes
+from .exceptions import KustoPartialIngestionError
+from ._record_splitter import can_split, split_records
+from ._size_estimation import compress_lazily, estimate_size
+from ._streaming_capability import _StreamingCapabilityCache, is_streaming_disabled_error
 from ._stream_extensions import chain_streams, read_until_size_or_end
-from .base_ingest_client import BaseIngestClient, IngestionResult
+from .base_ingest_client import BaseIngestClient, IngestionResult, IngestionStatus
 from .ingest_client import QueuedIngestClient
 from .streaming_ingest_client import KustoStreamingIngestClient
 
@@ -31,21 +37,54 @@ class ManagedStreamingIngestClient(BaseIngestClient):
 
     Managed streaming ingest client will fall back to queued if:
         - Multiple transient errors were encountered when trying to do streaming ingestion
-        - The ingestion is too large for streaming ingestion (over 4MB)
+        - The ingestion is too large for streaming ingestion (over 4MB), unless it is split (see split_large_streams)
         - The ingestion is directly from a blob
+        - Streaming ingestion is disabled for the table, or failed repeatedly for it recently
+
+    Streaming outcomes are remembered per table, so tables that can't stream go straight to queued ingestion,
+    without buffering the data or making a request. Such tables are probed periodically, and streamed to again once a probe succeeds.
     """
 
     MAX_STREAMING_SIZE_IN_BYTES = 4 * 1024 * 1024
 
+    # Streams estimated (from a sampled compression ratio) to be this many times over the limit go straight to queued ingestion.
+    # Closer estimates are compressed and measured, as the estimate might be off.
+    ESTIMATED_SIZE_MARGIN = 2
+
     def __init__(
         self,
         engine_kcsb: Union[KustoConnectionStringBuilder, str],
         dm_kcsb: Union[KustoConnectionStringBuilder, str, None] = None,
         auto_correct_endpoint: bool = True,
+        resources_snapshot_path: Optional[str] = None,
+        split_large_streams: bool = False,
+        max_concurrent_streams: int = 4,
+        spool_directory: Optional[str] = None,
+        share_resources: bool = False,
     ):
+        """
+        :param split_large_streams: Keep streams that are too large for streaming ingestion on the streaming path,
+            by splitting them into chunks of whole records and streaming the chunks concurrently.
+            Applies to line delimited formats - the CSV family, TXT, JSON and MULTIJSON - and not to streams with ignore_first_record.
+            Each chunk is streamed with its own source id, and falls back to queued ingestion on its own.
+            When some chunks fail, KustoPartialIngestionError is raised once all of them finished, with the source ids of the ingested ones.
+        :param max_concurrent_streams: The maximal number of chunks streamed at once when splitting.
+        :param spool_directory: Optional local directory to spool queued ingestions to when storage is unavailable. See QueuedIngestClient.
+        :param share_resources: Share the HTTP connection pool and the token provider between the queued and streaming clients,
+            and with the other clients of the cluster in the process that share resources. See azure.kusto.data.KustoClient.
+        """
         super().__init__()
-        self.queued_client = QueuedIngestClient(dm_kcsb if dm_kcsb is not None else engine_kcsb, auto_correct_endpoint)
-        self.streaming_client = KustoStreamingIngestClient(engine_kcsb, auto_correct_endpoint)
+        self.queued_client = QueuedIngestClient(
+            dm_kcsb if dm_kcsb is not None else engine_kcsb,
+            auto_correct_endpoint,
+            resources_snapshot_path,
+            spool_directory=spool_directory,
+            share_resources=share_resources,
+        )
+        self.streaming_client = KustoStreamingIngestClient(engine_kcsb, auto_correct_endpoint, share_resources=share_resources)
+        self._split_large_streams = split_large_streams
+        self._max_concurrent_streams = max_concurrent_streams
+        self._streaming_capability = _StreamingCapabilityCache()
         self._set_retry_settings()
 
     def close(self) -> None:
@@ -62,7 +101,11 @@ class ManagedStreamingIngestClient(BaseIngestClient):
         self.queued_client.set_proxy(proxy_url)
         self.streaming_client.set_proxy(proxy_url)
 
-    @distributed_trace(kind=SpanKind.CLIENT)
+    def set_slow_query_log(self, slow_query_log: Optional[SlowQueryLog]):
+        """Records the streaming ingestions that exceed the thresholds of a log. See azure.kusto.data.KustoClient.set_slow_query_log."""
+        self.streaming_client.set_slow_query_log(slow_query_log)
+
+    @MonitoredActivity.trace(kind=SpanKind.CLIENT)
     def ingest_from_file(self, file_descriptor: Union[FileDescriptor, str], ingestion_properties: IngestionProperties) -> IngestionResult:
         file_descriptor = FileDescriptor.get_instance(file_descriptor)
         IngestTracingAttributes.set_ingest_descriptor_attributes(file_descriptor, ingestion_properties)
@@ -74,13 +117,26 @@ class ManagedStreamingIngestClient(BaseIngestClient):
         with stream_descriptor.stream:
             return self.ingest_from_stream(stream_descriptor, ingestion_properties)
 
-    @distributed_trace(kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(kind=SpanKind.CLIENT)
     def ingest_from_stream(self, stream_descriptor: Union[StreamDescriptor, IO[AnyStr]], ingestion_properties: IngestionProperties) -> IngestionResult:
         stream_descriptor = StreamDescriptor.get_instance(stream_descriptor)
         IngestTracingAttributes.set_ingest_descriptor_attributes(stream_descriptor, ingestion_properties)
 
         super().ingest_from_stream(stream_descriptor, ingestion_properties)
 
+        return self._record_result(self._ingest_from_stream(stream_descriptor, ingestion_properties))
+
+    def _ingest_from_stream(self, stream_descriptor: StreamDescriptor, ingestion_properties: IngestionProperties) -> IngestionResult:
+        if not self._streaming_capability.should_stream(ingestion_properties.database, ingestion_properties.table):
+            return self.queued_client.ingest_from_stream(stream_descriptor, ingestion_properties)
+
+        if self._is_estimated_too_large(stream_descriptor, ingestion_properties):
+            if self._can_split(stream_descriptor, ingestion_properties):
+                return self._ingest_split_stream(stream_descriptor, stream_descriptor.stream, ingestion_properties)
+            if BaseIngestClient._should_compress(stream_descriptor, ingestion_properties):
+                stream_descriptor = compress_lazily(stream_descriptor)
+            return self.queued_client.ingest_from_stream(stream_descriptor, ingestion_properties)
+
         stream_descriptor = BaseIngestClient._prepare_stream(stream_descriptor, ingestion_properties)
         stream = stream_descriptor.stream
 
@@ -90,19 +146,21 @@ class ManagedStreamingIngestClient(BaseIngestClient):
         stream_descriptor.stream = buffered_stream
 
         try:
+            if length > self.MAX_STREAMING_SIZE_IN_BYTES and self._can_split(stream_descriptor, ingestion_properties):
+                return self._ingest_split_stream(stream_descriptor, chain_streams([buffered_stream, stream]), ingestion_properties)
+
             res = self._stream_with_retries(length, stream_descriptor, ingestion_properties)
             if res:
                 return res
             stream_descriptor.stream = chain_streams([buffered_stream, stream])
         except KustoApiError as ex:
-            error = ex.get_api_error()
-            if error.permanent:
+            if self._should_raise(ex.get_api_error()):
                 raise
             buffered_stream.seek(0, SEEK_SET)
 
         return self.queued_client.ingest_from_stream(stream_descriptor, ingestion_properties)
 
-    @distributed_trace(kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(kind=SpanKind.CLIENT)
     def ingest_from_blob(self, blob_descriptor: BlobDescriptor, ingestion_properties: IngestionProperties):
         """
         Enqueue an ingest command from azure blobs.
@@ -118,29 +176,136 @@ class ManagedStreamingIngestClient(BaseIngestClient):
 
         if self._is_closed:
             raise KustoClosedError()
+        return self._record_result(self._ingest_from_blob(blob_descriptor, ingestion_properties))
+
+    def _ingest_from_blob(self, blob_descriptor: BlobDescriptor, ingestion_properties: IngestionProperties) -> IngestionResult:
+        if not self._streaming_capability.should_stream(ingestion_properties.database, ingestion_properties.table):
+            return self.queued_client.ingest_from_blob(blob_descriptor, ingestion_properties)
+
         blob_descriptor.fill_size()
         try:
             res = self._stream_with_retries(blob_descriptor.size, blob_descriptor, ingestion_properties)
             if res:
                 return res
         except KustoApiError as ex:
-            error = ex.get_api_error()
-            if error.permanent:
+            if self._should_raise(ex.get_api_error()):
                 raise
 
         return self.queued_client.ingest_from_blob(blob_descriptor, ingestion_properties)
 
+    @staticmethod
+    def _record_result(result: IngestionResult) -> IngestionResult:
+        method = metrics.STREAMING if result.status == IngestionStatus.SUCCESS else metrics.QUEUED
+        metrics._record_managed_streaming_ingestion(method, result.database, result.table)
+        return result
+
+    def _is_estimated_too_large(self, stream_descriptor: StreamDescriptor, ingestion_properties: IngestionProperties) -> bool:
+        """
+        Checks whether a stream is too large to be streamed before compressing or buffering it, when its size can be estimated.
+        This routes large inputs straight to queued ingestion (or to splitting), where they are compressed as they are uploaded.
+        """
+        should_compress = BaseIngestClient._should_compress(stream_descriptor, ingestion_properties)
+        estimate = estimate_size(stream_descriptor, should_compress, self.MAX_STREAMING_SIZE_IN_BYTES)
+        if estimate is None:
+            return False
+        margin = 1 if estimate.is_exact else self.ESTIMATED_SIZE_MARGIN
+        return estimate.size > self.MAX_STREAMING_SIZE_IN_BYTES * margin
+
+    def _can_split(self, stream_descriptor: StreamDescriptor, ingestion_properties: IngestionProperties) -> bool:
+        return (
+            self._split_large_streams
+            and can_split(ingestion_properties.format)
+            and not ingestion_properties.ignore_first_record
+            # Zip archives can't be read as a stream
+            and not stream_descriptor.stream_name.endswith(".zip")
+        )
+
+    def _ingest_split_stream(self, stream_descriptor: StreamDescriptor, stream: IO[bytes], ingestion_properties: IngestionProperties) -> IngestionResult:
+        """
+        Splits a stream into chunks on record boundaries, each small enough to be streamed, and ingests them concurrently.
+        Chunks that can't be streamed fall back to queued ingestion, and the aggregate result is queued if any of them did.
+
+        A failed chunk doesn't stop the others, and ingested chunks can't be undone. So once every chunk finished, a failure of any of them
+        (or of reading the stream) raises KustoPartialIngestionError, with the source ids of the chunks that were ingested - retrying the whole
+        stream would ingest them again.
+        """
+        records = GzipFile(fileobj=stream, mode="rb") if stream_descriptor.is_compressed else stream
+        chunks = split_records(records, ingestion_properties.format, self.MAX_STREAMING_SIZE_IN_BYTES)
+        # Bounds the chunks held in memory
+        in_flight = BoundedSemaphore(self._max_concurrent_streams * 2)
+        submitted = []
+        errors = []
+        with ThreadPoolExecutor(self._max_concurrent_streams, thread_name_prefix="KustoManagedStreamingIngest") as executor:
+            try:
+                for index, chunk in enumerate(chunks):
+                    in_flight.acquire()
+                    chunk_descriptor = StreamDescriptor(BytesIO(chunk), is_compressed=True, stream_name="{}_{}.gz".format(stream_descriptor.stream_name, index))
+                    future = executor.submit(self._ingest_chunk, chunk_descriptor, ingestion_properties)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    submitted.append((chunk_descriptor.source_id, future))
+            except Exception as ex:
+                # The chunks submitted so far are still ingested
+                errors.append(ex)
+
+        statuses = []
+        ingested_source_ids = []
+        for source_id, future in submitted:
+            try:
+                statuses.append(future.result())
+                ingested_source_ids.append(source_id)
+            except Exception as ex:
+                errors.append(ex)
+        if errors:
+            raise KustoPartialIngestionError(stream_descriptor.source_id, ingested_source_ids, errors) from errors[0]
+
+        status = IngestionStatus.QUEUED if IngestionStatus.QUEUED in statuses else IngestionStatus.SUCCESS
+        return IngestionResult(status, ingestion_properties.database, ingestion_properties.table, stream_descriptor.source_id)
+
+    def _ingest_chunk(self, chunk_descriptor: StreamDescriptor, ingestion_properties: IngestionProperties) -> IngestionStatus:
+        if self._streaming_capability.should_stream(ingestion_properties.database, ingestion_properties.table):
+            try:
+                res = self._stream_with_retries(len(chunk_descriptor.stream.getbuffer()), chunk_descriptor, ingestion_properties)
+                if res:
+                    return res.status
+            except KustoApiError as ex:
+                if self._should_raise(ex.get_api_error()):
+                    raise
+            chunk_descriptor.stream.seek(0, SEEK_SET)
+        return self.queued_client.ingest_from_stream(chunk_descriptor, ingestion_properties).status
+
+    @staticmethod
+    def _should_raise(error: OneApiError) -> bool:
+        # Streaming being disabled is permanent for streaming ingestion, but the data can still be queued
+        return bool(error.permanent) and not is_streaming_disabled_error(error)
+
     def _stream_with_retries(
         self,
         length: int,
         descriptor: DescriptorBase,
         props: IngestionProperties,
     ) -> Optional[IngestionResult]:
-        from_stream = isinstance(descriptor, StreamDescriptor)
         if length > self.MAX_STREAMING_SIZE_IN_BYTES:
             return None
+        try:
+            result = self._attempt_streaming(descriptor, props)
+        except KustoApiError as ex:
+            error = ex.get_api_error()
+            if is_streaming_disabled_error(error):
+                self._streaming_capability.report_disabled(props.database, props.table)
+            elif not error.permanent:
+                self._streaming_capability.report_failure(props.database, props.table)
+            raise
+
+        self._streaming_capability.report_success(props.database, props.table)
+        metrics._record_ingest_size(length, metrics.STREAMING, props.database, props.table)
+        return result
+
+    def _attempt_streaming(self, descriptor: DescriptorBase, props: IngestionProperties) -> IngestionResult:
+        from_stream = isinstance(descriptor, StreamDescriptor)
         for attempt in Retrying(stop=stop_after_attempt(self._num_of_attempts), wait=wait_random_exponential(max=self._max_seconds_per_retry), reraise=True):
             with attempt:
+                if attempt.retry_state.attempt_number > 1:
+                    metrics._record_retry(metrics.STREAMING_INGEST, **{metrics.DATABASE: props.database, metrics.TABLE: props.table})
                 client_request_id = ManagedStreamingIngestClient._get_request_id(descriptor.source_id, attempt.retry_state.attempt_number - 1)
                 # trace attempt to ingest from stream
                 if from_stream:
@@ -1,8 +1,21 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
+import asyncio
 import json
+import logging
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Union
+
+from azure.storage.queue import QueueClient, QueueMessage
+
+from azure.kusto.data.exceptions import KustoClosedError
 
 from ._status_q import StatusQueue
+from .base_ingest_client import IngestionResult, IngestionStatus
+
+_logger = logging.getLogger(__name__)
 
 
 class StatusMessage:
@@ -54,5 +67,195 @@ class KustoIngestStatusQueues:
     """
 
     def __init__(self, kusto_ingest_client):
-        self.success = StatusQueue(kusto_ingest_client._resource_manager.get_successful_ingestions_queues, message_cls=SuccessMessage)
-        self.failure = StatusQueue(kusto_ingest_client._resource_manager.get_failed_ingestions_queues, message_cls=FailureMessage)
+        resource_manager = kusto_ingest_client._resource_manager
+        self.success = StatusQueue(
+            resource_manager.get_successful_ingestions_queues, message_cls=SuccessMessage, get_queue_client_func=resource_manager.get_queue_client
+        )
+        self.failure = StatusQueue(
+            resource_manager.get_failed_ingestions_queues, message_cls=FailureMessage, get_queue_client_func=resource_manager.get_queue_client
+        )
+
+
+class IngestionStatusFuture:
+    """
+    The eventual status of a queued ingestion, resolved by a KustoIngestStatusTracker.
+    Wait for it with `wait(timeout)` / `result(timeout)`, or `await` it.
+    """
+
+    def __init__(self, source_id: uuid.UUID):
+        self.source_id = source_id
+        self._future: Future = Future()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits for the status to arrive, and returns whether it did."""
+        done, _ = wait([self._future], timeout=timeout)
+        return bool(done)
+
+    def result(self, timeout: Optional[float] = None) -> Union[SuccessMessage, FailureMessage]:
+        """
+        Returns the status message - a SuccessMessage or a FailureMessage.
+        :raises concurrent.futures.TimeoutError: if the status did not arrive in time.
+        """
+        return self._future.result(timeout)
+
+    def __await__(self):
+        return asyncio.wrap_future(self._future).__await__()
+
+    def __repr__(self):
+        return "{}({}, done={})".format(self.__class__.__name__, self.source_id, self.done())
+
+
+class KustoIngestStatusTracker:
+    """
+    Tracks the status of many queued ingestions at once.
+    `track` returns a future per ingestion, which is resolved once its status message arrives on the success or failure queues.
+    While there are pending ingestions, a background thread receives messages from all the status queues in parallel, in batches.
+    Messages of tracked ingestions are deleted in batches by a background worker. The messages of other ingestions are left alone,
+    and stay hidden until their visibility timeout passes - so that later polls reach the messages behind them, and other consumers
+    still get them afterwards.
+
+    Note that success messages are only sent for ingestions with ReportLevel.FailuresAndSuccesses,
+    so with the default report level only failures resolve their futures.
+    """
+
+    def __init__(
+        self,
+        kusto_ingest_client,
+        poll_interval: float = 5.0,
+        batch_size: int = 32,
+        max_concurrent_requests: int = 8,
+        visibility_timeout: int = 30,
+    ):
+        """
+        :param kusto_ingest_client: the QueuedIngestClient (or ManagedStreamingIngestClient's queued_client) the ingestions were queued with.
+        :param float poll_interval: seconds to wait between polls that found no messages.
+        :param int batch_size: the maximal number of messages received from a queue, and deleted, at a time (up to 32).
+        :param int max_concurrent_requests: the maximal number of concurrent requests to the status queues.
+        :param int visibility_timeout: seconds a received message is hidden from other consumers (and from the tracker's next polls) until it is
+            deleted. Messages of ingestions that aren't tracked stay hidden for this long.
+        """
+        resource_manager = kusto_ingest_client._resource_manager
+        self._queue_sources = (
+            (resource_manager.get_successful_ingestions_queues, SuccessMessage),
+            (resource_manager.get_failed_ingestions_queues, FailureMessage),
+        )
+        self._get_queue_client = resource_manager.get_queue_client
+        self.poll_interval = poll_interval
+        self.batch_size = min(batch_size, 32)
+        self.visibility_timeout = visibility_timeout
+
+        self._lock = Lock()
+        self._pending: Dict[str, IngestionStatusFuture] = {}
+        self._closed = Event()
+        self._poller: Optional[Thread] = None
+        self._request_executor = ThreadPoolExecutor(max_concurrent_requests, thread_name_prefix="KustoIngestStatusPoll")
+        self._delete_executor = ThreadPoolExecutor(1, thread_name_prefix="KustoIngestStatusDelete")
+
+    def track(self, ingestion: Union[IngestionResult, uuid.UUID, str]) -> IngestionStatusFuture:
+        """
+        Starts tracking a queued ingestion.
+        :param ingestion: the IngestionResult of a queued ingestion, or its source id.
+        :return: a future that resolves to the ingestion's SuccessMessage or FailureMessage.
+        """
+        if isinstance(ingestion, IngestionResult):
+            if ingestion.status != IngestionStatus.QUEUED:
+                raise ValueError("Only queued ingestions report their status, found {}".format(ingestion.status))
+            source_id = ingestion.source_id
+        else:
+            source_id = ingestion if isinstance(ingestion, uuid.UUID) else uuid.UUID(ingestion)
+
+        with self._lock:
+            if self._closed.is_set():
+                raise KustoClosedError()
+            future = self._pending.get(str(source_id))
+            if future is None:
+                future = IngestionStatusFuture(source_id)
+                self._pending[str(source_id)] = future
+            if self._poller is None:
+                self._poller = Thread(target=self._poll_while_pending, name="KustoIngestStatusTracker", daemon=True)
+                self._poller.start()
+        return future
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def close(self):
+        """Stops polling. Futures that are still pending stay pending."""
+        with self._lock:
+            self._closed.set()
+            poller = self._poller
+        if poller is not None:
+            poller.join()
+        self._request_executor.shutdown(wait=True)
+        self._delete_executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _poll_while_pending(self):
+        while not self._closed.is_set():
+            with self._lock:
+                if not self._pending:
+                    self._poller = None
+                    return
+
+            try:
+                resolved = self.poll()
+            except Exception:
+                _logger.warning("Polling the ingestion status queues failed", exc_info=True)
+                resolved = 0
+
+            # Only polls that resolved tracked ingestions skip the wait, as the queues may be full of other ingestions' messages
+            if resolved == 0:
+                self._closed.wait(self.poll_interval)
+
+    def poll(self) -> int:
+        """
+        Receives a batch of messages from every status queue in parallel, and resolves the futures of the tracked ingestions.
+        Called by the background thread - call it directly only to poll on demand.
+        :return: the number of tracked ingestions that were resolved. Messages of other ingestions are not counted.
+        """
+        requests = []
+        for get_queues, message_cls in self._queue_sources:
+            for queue in get_queues():
+                requests.append(self._request_executor.submit(self._receive, self._get_queue_client(queue), message_cls))
+
+        resolved = 0
+        for request in requests:
+            resolved += request.result()
+        return resolved
+
+    def _receive(self, queue_client: QueueClient, message_cls) -> int:
+        messages = queue_client.receive_messages(messages_per_page=self.batch_size, max_messages=self.batch_size, visibility_timeout=self.visibility_timeout)
+        to_delete = []
+        for message in messages:
+            try:
+                status = message_cls(message.content)
+            except (TypeError, ValueError, AttributeError):
+                _logger.warning("Skipping a malformed ingestion status message %s", message.id, exc_info=True)
+                continue
+            with self._lock:
+                future = self._pending.pop(str(status.IngestionSourceId).lower(), None) if status.IngestionSourceId else None
+            # Messages of other ingestions stay hidden until their visibility timeout passes, so that the next polls receive the ones behind them
+            if future is not None:
+                future._future.set_result(status)
+                to_delete.append(message)
+
+        if to_delete:
+            self._delete_executor.submit(self._delete_batch, queue_client, to_delete)
+        return len(to_delete)
+
+    @staticmethod
+    def _delete_batch(queue_client: QueueClient, to_delete: List[QueueMessage]):
+        for message in to_delete:
+            try:
+                queue_client.delete_message(message.id, message.pop_receipt)
+            except Exception:
+                # The message will become visible again, and will be ignored as its ingestion is no longer tracked
+                pass
@@ -3,10 +3,10 @@
 from typing import Union, AnyStr, Optional
 from typing import IO
 
-from azure.core.tracing.decorator import distributed_trace
 from azure.core.tracing import SpanKind
 
-from azure.kusto.data import KustoClient, KustoConnectionStringBuilder, ClientRequestProperties
+from azure.kusto.data import KustoClient, KustoConnectionStringBuilder, ClientRequestProperties, SlowQueryLog
+from azure.kusto.data._telemetry import MonitoredActivity
 
 from ._ingest_telemetry import IngestTracingAttributes
 from .base_ingest_client import BaseIngestClient, IngestionResult, IngestionStatus
@@ -21,9 +21,14 @@ class KustoStreamingIngestClient(BaseIngestClient):
     Tests are run using pytest.
     """
 
-    def __init__(self, kcsb: Union[KustoConnectionStringBuilder, str], auto_correct_endpoint: bool = True):
+    # Streaming ingestion is limited to 4MB per request, so records are split before they could exceed it, even uncompressed
+    _MAX_RECORDS_BATCH_SIZE_IN_BYTES = 4 * 1024 * 1024
+
+    def __init__(self, kcsb: Union[KustoConnectionStringBuilder, str], auto_correct_endpoint: bool = True, share_resources: bool = False):
         """Kusto Streaming Ingest Client constructor.
         :param KustoConnectionStringBuilder kcsb: The connection string to initialize KustoClient.
+        :param bool share_resources: Share the HTTP connection pool and the token provider with the other clients of the cluster in the process
+            that share resources. See azure.kusto.data.KustoClient.
         """
         super().__init__()
 
@@ -32,7 +37,7 @@ class KustoStreamingIngestClient(BaseIngestClient):
 
         if auto_correct_endpoint:
             kcsb["Data Source"] = BaseIngestClient.get_query_endpoint(kcsb.data_source)
-        self._kusto_client = KustoClient(kcsb)
+        self._kusto_client = KustoClient(kcsb, share_resources=share_resources)
 
     def close(self):
         if not self._is_closed:
@@ -42,7 +47,11 @@ class KustoStreamingIngestClient(BaseIngestClient):
     def set_proxy(self, proxy_url: str):
         self._kusto_client.set_proxy(proxy_url)
 
-    @distributed_trace(kind=SpanKind.CLIENT)
+    def set_slow_query_log(self, slow_query_log: Optional[SlowQueryLog]):
+        """Records the streaming ingestions that exceed the thresholds of a log. See azure.kusto.data.KustoClient.set_slow_query_log."""
+        self._kusto_client.set_slow_query_log(slow_query_log)
+
+    @MonitoredActivity.trace(kind=SpanKind.CLIENT)
     def ingest_from_file(self, file_descriptor: Union[FileDescriptor, str], ingestion_properties: IngestionProperties) -> IngestionResult:
         """Ingest from local files.
         :param file_descriptor: a FileDescriptor to be ingested.
@@ -58,7 +67,7 @@ class KustoStreamingIngestClient(BaseIngestClient):
         with stream_descriptor.stream:
             return self.ingest_from_stream(stream_descriptor, ingestion_properties)
 
-    @distributed_trace(kind=SpanKind.CLIENT)
+    @MonitoredActivity.trace(kind=SpanKind.CLIENT)
     def ingest_from_stream(self, stream_descriptor: Union[StreamDescriptor, IO[AnyStr]], ingestion_properties: IngestionProperties) -> IngestionResult:
         """Ingest from io streams.
         :param azure.kusto.ingest.StreamDescriptor stream_descriptor: An object that contains a description of the stream to
@@ -16,7 +16,7 @@ from azure.kusto.ingest import (
     ValidationOptions,
     ValidationImplications,
 )
-from azure.kusto.ingest.ingestion_blob_info import IngestionBlobInfo
+from azure.kusto.ingest.ingestion_blob_info import IngestionBlobInfo, IngestionBlobInfoTemplate
 
 TIMESTAMP_REGEX = "[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}.[0-9]{6}"
 
@@ -110,6 +110,33 @@ class IngestionBlobInfoTest(unittest.TestCase):
         blob_info = IngestionBlobInfo(blob, properties, auth_context="authorizationContextText")
         self._verify_ingestion_blob_info_result(blob_info.to_json())
 
+    def test_blob_info_template(self):
+        """Tests that the messages of a template are the same as the ones of IngestionBlobInfo."""
+        properties = IngestionProperties(
+            database="database",
+            table="table",
+            data_format=DataFormat.JSON,
+            column_mappings=[ColumnMapping("ColumnName", "datatype", path="jsonpath")],
+            additional_tags=["tag"],
+            ingest_if_not_exists=["ingestIfNotExistTags"],
+            ingest_by_tags=["ingestByTags"],
+            drop_by_tags=["dropByTags"],
+            flush_immediately=True,
+            report_level=ReportLevel.DoNotReport,
+            report_method=ReportMethod.Queue,
+            validation_policy=ValidationPolicy(ValidationOptions.ValidateCsvInputConstantColumns, ValidationImplications.BestEffort),
+        )
+        template = IngestionBlobInfoTemplate(properties, auth_context="authorizationContextText", application_for_tracing="app")
+
+        for blob in (BlobDescriptor("somepath", 10), BlobDescriptor('some"path', None)):
+            message = template.to_json(blob)
+            expected = IngestionBlobInfo(blob, properties, auth_context="authorizationContextText", application_for_tracing="app").to_json()
+            # Only the creation time may differ
+            assert re.sub(TIMESTAMP_REGEX, "", message) == re.sub(TIMESTAMP_REGEX, "", expected)
+            assert json.loads(message)["Id"] == str(blob.source_id)
+
+        self._verify_ingestion_blob_info_result(template.to_json(BlobDescriptor("somepath", 10)))
+
     def _verify_ingestion_blob_info_result(self, ingestion_blob_info):
         result = json.loads(ingestion_blob_info)
         assert result is not None
@@ -0,0 +1,187 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import io
+import json
+import os
+import threading
+import time
+import uuid
+
+from azure.kusto.data.data_format import DataFormat, IngestionMappingKind
+from azure.kusto.data.exceptions import KustoBlobError, KustoNetworkError
+from azure.kusto.ingest import BlobDescriptor, ColumnMapping, IngestionProperties, ReportLevel, StreamDescriptor, ValidationOptions, ValidationPolicy
+from azure.kusto.ingest._ingestion_spool import _IngestionSpool
+from azure.kusto.ingest._storage_account_set import _RankedStorageAccountSet
+from azure.kusto.ingest.exceptions import KustoQueueError
+
+
+class FakeReplay:
+    def __init__(self):
+        self.replayed = []
+        self.errors = []
+        self.healthy = True
+        self.done = threading.Event()
+        self.expected = 0
+        self.attempts = 0
+
+    def __call__(self, source, ingestion_properties):
+        self.attempts += 1
+        if not self.healthy:
+            raise KustoBlobError(Exception("storage is unavailable"))
+        if self.errors:
+            raise self.errors.pop(0)
+        payload = source.stream.read() if isinstance(source, StreamDescriptor) else None
+        self.replayed.append((source, ingestion_properties, payload))
+        if len(self.replayed) >= self.expected:
+            self.done.set()
+
+    def is_healthy(self):
+        return self.healthy
+
+
+class TestIngestionSpool:
+    def test_replay_in_order(self, tmp_path):
+        replay = FakeReplay()
+        replay.healthy = False
+        spool = _IngestionSpool(str(tmp_path), replay, replay.is_healthy, max_replays_per_second=1000, retry_interval=0.01)
+
+        properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV, additional_tags=["tag"])
+        stream_descriptor = StreamDescriptor(io.BytesIO(b"xxpayload"), is_compressed=True, stream_name="stream.csv.gz", size=100)
+        stream_descriptor.stream.seek(2)
+        spool.spool_stream(stream_descriptor.stream, stream_descriptor, properties)
+        blob_descriptor = BlobDescriptor("https://account.blob.core.windows.net/container/blob?sas", 10)
+        spool.spool_blob(blob_descriptor, properties)
+
+        # Nothing is replayed while storage is unhealthy, but the oldest entry keeps probing it
+        time.sleep(0.05)
+        assert replay.replayed == []
+        assert replay.attempts > 0
+        assert spool.pending_count() == 2
+
+        replay.expected = 2
+        replay.healthy = True
+        assert replay.done.wait(5)
+        spool.close()
+
+        (stream_source, stream_properties, payload), (blob_source, blob_properties, _) = replay.replayed
+        assert payload == b"payload"
+        assert stream_source.source_id == stream_descriptor.source_id
+        assert (stream_source.stream_name, stream_source.size, stream_source.is_compressed) == ("stream.csv.gz", 100, True)
+        assert (blob_source.path, blob_source.size, blob_source.source_id) == (blob_descriptor.path, 10, blob_descriptor.source_id)
+        assert stream_properties.additional_tags == blob_properties.additional_tags == ["tag"]
+        assert os.listdir(str(tmp_path)) == []
+
+    def test_entries_survive_failures_and_restarts(self, tmp_path):
+        replay = FakeReplay()
+        replay.healthy = False
+        properties = IngestionProperties(database="database", table="table")
+        spool = _IngestionSpool(str(tmp_path), replay, replay.is_healthy, retry_interval=0.01)
+        blobs = [BlobDescriptor("https://account.blob.core.windows.net/container/blob{}?sas".format(i), 10) for i in range(3)]
+        for blob in blobs:
+            spool.spool_blob(blob, properties)
+        spool.close()
+        assert spool.pending_count() == 3
+
+        # A new spool on the same directory replays the entries. Transient errors keep the entry, others set it aside.
+        replay.healthy = True
+        replay.errors = [KustoQueueError(), KustoBlobError(Exception("failed")), KustoNetworkError("https://ingest-cluster"), ValueError("bad entry")]
+        replay.expected = 2
+        spool = _IngestionSpool(str(tmp_path), replay, replay.is_healthy, max_replays_per_second=1000, retry_interval=0.01)
+        assert replay.done.wait(5)
+        spool.close()
+
+        assert [source.path for source, _, _ in replay.replayed] == [blob.path for blob in blobs[1:]]
+        assert spool.pending_count() == 0
+        assert [name.endswith(_IngestionSpool.ENTRY_SUFFIX + _IngestionSpool.FAILED_SUFFIX) for name in os.listdir(str(tmp_path))] == [True]
+        assert spool.failed_replays == 1
+
+    def test_properties_survive_spooling(self, tmp_path):
+        replay = FakeReplay()
+        replay.healthy = False
+        spool = _IngestionSpool(str(tmp_path), replay, replay.is_healthy, max_replays_per_second=1000, retry_interval=0.01)
+        properties = IngestionProperties(
+            database="database",
+            table="table",
+            data_format=DataFormat.JSON,
+            column_mappings=[ColumnMapping("a", "string", path="$.a"), ColumnMapping("b", "long", path="$.b")],
+            ingestion_mapping_kind=IngestionMappingKind.JSON,
+            ingest_by_tags=["tag"],
+            flush_immediately=True,
+            report_level=ReportLevel.FailuresAndSuccesses,
+            validation_policy=ValidationPolicy(ValidationOptions.ValidateCsvInputConstantColumns),
+            additional_properties={"key": "value"},
+        )
+        spool.spool_blob(BlobDescriptor("https://account.blob.core.windows.net/container/blob?sas", 10), properties)
+
+        # Entries are plain JSON
+        (entry_name,) = os.listdir(str(tmp_path))
+        with open(os.path.join(str(tmp_path), entry_name), encoding="utf-8") as f:
+            assert json.load(f)["ingestion_properties"]["format"] == "JSON"
+
+        replay.expected = 1
+        replay.healthy = True
+        assert replay.done.wait(5)
+        spool.close()
+
+        ((_, replayed, _),) = replay.replayed
+        assert (replayed.database, replayed.table, replayed.format, replayed.ingestion_mapping_type) == (
+            "database",
+            "table",
+            DataFormat.JSON,
+            IngestionMappingKind.JSON,
+        )
+        assert [(mapping.column, mapping.datatype, mapping.properties) for mapping in replayed.ingestion_mapping] == [
+            ("a", "string", {ColumnMapping.PATH: "$.a"}),
+            ("b", "long", {ColumnMapping.PATH: "$.b"}),
+        ]
+        assert (replayed.ingest_by_tags, replayed.flush_immediately, replayed.report_level) == (["tag"], True, ReportLevel.FailuresAndSuccesses)
+        assert replayed.validation_policy.ValidationOptions == ValidationOptions.ValidateCsvInputConstantColumns
+        assert replayed.additional_properties == {"key": "value"}
+
+    def test_recovers_after_outage(self, tmp_path):
+        clock = [0.0]
+        accounts = _RankedStorageAccountSet(time_provider=lambda: clock[0])
+        accounts.add_storage_account("account")
+        outage = [True]
+        replayed = []
+        done = threading.Event()
+
+        def replay(source, ingestion_properties):
+            # Like the ingest client, replays report their result to the storage account set
+            accounts.add_account_result("account", not outage[0])
+            if outage[0]:
+                raise KustoBlobError(Exception("storage is unavailable"))
+            replayed.append(source.path)
+            done.set()
+
+        for _ in range(3):
+            accounts.add_account_result("account", False)
+        assert not accounts.has_healthy_accounts()
+
+        spool = _IngestionSpool(str(tmp_path), replay, accounts.has_healthy_accounts, max_replays_per_second=1000, retry_interval=0.01)
+        spool.spool_blob(BlobDescriptor("https://account.blob.core.windows.net/container/blob?sas", 10), IngestionProperties("db", "t"))
+        time.sleep(0.05)
+        assert replayed == [] and spool.pending_count() == 1
+
+        # The outage ends, and the failures age out without any new results
+        outage[0] = False
+        clock[0] += 1_000_000
+        assert accounts.has_healthy_accounts()
+        assert done.wait(5)
+        spool.close()
+        assert spool.pending_count() == 0
+
+    def test_replay_rate_limit(self, tmp_path):
+        replay = FakeReplay()
+        replay.healthy = False
+        spool = _IngestionSpool(str(tmp_path), replay, replay.is_healthy, max_replays_per_second=50, retry_interval=0.01)
+        for _ in range(10):
+            spool.spool_blob(BlobDescriptor("https://account.blob.core.windows.net/container/blob?sas", 10, uuid.uuid4()), IngestionProperties("db", "t"))
+
+        replay.expected = 10
+        start = time.monotonic()
+        replay.healthy = True
+        assert replay.done.wait(5)
+        # 10 replays at 50 per second take at least 9 intervals of 20ms
+        assert time.monotonic() - start >= 0.18
+        spool.close()
@@ -1,9 +1,14 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
+import gzip
 import io
 import json
+import logging
 import os
+import threading
+import time
 import uuid
+from datetime import datetime
 from pathlib import Path
 from unittest.mock import patch
 
@@ -11,9 +16,14 @@ import pytest
 import responses
 
 from azure.kusto.data.data_format import DataFormat
+from azure.kusto.data.exceptions import KustoServiceError
 
-from azure.kusto.ingest import QueuedIngestClient, IngestionProperties, IngestionStatus, _resource_manager
+from azure.kusto.ingest import BlobDescriptor, QueuedIngestClient, IngestionProperties, IngestionStatus, StreamDescriptor, _resource_manager
+from azure.kusto.ingest._records import record_batches
+from azure.kusto.ingest._resource_snapshot import _ResourceSnapshotFile
+from azure.kusto.ingest._storage_account_set import _RankedStorageAccountSet
 from azure.kusto.ingest.exceptions import KustoInvalidEndpointError, KustoQueueError
+from azure.kusto.ingest.ingestion_blob_info import IngestionBlobInfo
 from azure.kusto.ingest.managed_streaming_ingest_client import ManagedStreamingIngestClient
 
 pandas_installed = False
@@ -24,6 +34,14 @@ try:
 except:
     pass
 
+parquet_installed = False
+try:
+    import pyarrow
+
+    parquet_installed = True
+except:
+    pass
+
 UUID_REGEX = "[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}"
 BLOB_NAME_REGEX = "database__table__" + UUID_REGEX + "__dataset.csv.gz"
 BLOB_URL_REGEX = "https://storageaccount.blob.core.windows.net/tempstorage/database__table__" + UUID_REGEX + "__dataset.csv.gz[?]sas"
@@ -524,6 +542,62 @@ class TestQueuedIngestClient:
 
         assert_queued_upload(mock_put_message_in_queue, mock_upload_blob_from_stream, expected_url)
 
+    @responses.activate
+    @pytest.mark.skipif(not pandas_installed, reason="requires pandas")
+    @patch("azure.kusto.ingest.managed_streaming_ingest_client.ManagedStreamingIngestClient.MAX_STREAMING_SIZE_IN_BYTES", new=0)
+    @patch("azure.kusto.ingest.base_ingest_client.BaseIngestClient._DATAFRAME_CHUNK_ROWS", new=7)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_ingest_from_dataframe_content(self, mock_put_message_in_queue, mock_upload_blob_from_stream, ingest_client_class):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        ingest_client = ingest_client_class("https://ingest-somecluster.kusto.windows.net")
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.JSON)
+
+        from pandas import DataFrame
+
+        df = DataFrame(data=[[i, "name {}".format(i), i / 3] for i in range(100)], columns=["id", "name", "value"])
+
+        with patch("tempfile.gettempdir") as mock_tempdir:
+            ingest_client.ingest_from_dataframe(df, ingestion_properties=ingestion_properties)
+            mock_tempdir.assert_not_called()
+
+        assert ingestion_properties.format == DataFormat.CSV
+        uploaded = mock_upload_blob_from_stream.call_args_list[0][1]["data"].read()
+        assert gzip.decompress(uploaded).decode("utf-8") == df.to_csv(index=False, header=False)
+
+    @responses.activate
+    @pytest.mark.skipif(not pandas_installed or not parquet_installed, reason="requires pandas and pyarrow")
+    @patch("azure.kusto.ingest.managed_streaming_ingest_client.ManagedStreamingIngestClient.MAX_STREAMING_SIZE_IN_BYTES", new=0)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_ingest_from_dataframe_parquet(self, mock_put_message_in_queue, mock_upload_blob_from_stream, ingest_client_class):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        ingest_client = ingest_client_class("https://ingest-somecluster.kusto.windows.net")
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV)
+
+        import pandas
+        from pandas import DataFrame
+
+        df = DataFrame(data=[[1, "abc", 15.3, pandas.Timestamp("2024-01-01T00:00:00Z")]], columns=["id", "name", "value", "time"])
+
+        ingest_client.ingest_from_dataframe(df, ingestion_properties=ingestion_properties, data_format=DataFormat.PARQUET)
+
+        assert_queued_upload(mock_put_message_in_queue, None, "https://storageaccount.blob.core.windows.net/tempstorage/database__table__", format="parquet")
+        # Parquet isn't recompressed
+        queued_message_json = json.loads(mock_put_message_in_queue.call_args_list[0][1]["content"])
+        assert queued_message_json["BlobPath"].split("?")[0].endswith(".parquet")
+        uploaded = mock_upload_blob_from_stream.call_args_list[0][1]["data"].read()
+        pandas.testing.assert_frame_equal(pandas.read_parquet(io.BytesIO(uploaded)), df)
+
+        with pytest.raises(ValueError):
+            ingest_client.ingest_from_dataframe(df, ingestion_properties=ingestion_properties, data_format=DataFormat.JSON)
+
     @responses.activate
     @patch("azure.kusto.ingest.managed_streaming_ingest_client.ManagedStreamingIngestClient.MAX_STREAMING_SIZE_IN_BYTES", new=0)
     @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
@@ -635,3 +709,465 @@ class TestQueuedIngestClient:
         assert client._connection_datasource == "https://onebox.dev.kusto.windows.net", "Client URI was not extracted correctly from query endpoint"
 
         assert client._resource_manager._kusto_client._kusto_cluster == "https://onebox.dev.kusto.windows.net/"
+
+    @responses.activate
+    def test_storage_clients_are_reused(self):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        kusto_client = _resource_manager.KustoClient("https://ingest-somecluster.kusto.windows.net")
+        resource_manager = _resource_manager._ResourceManager(kusto_client)
+
+        container = resource_manager.get_containers()[0]
+        queue = resource_manager.get_ingestion_queues()[0]
+
+        blob_service = resource_manager.get_blob_service_client(container)
+        queue_client = resource_manager.get_queue_client(queue)
+        assert resource_manager.get_blob_service_client(container) is blob_service
+        assert resource_manager.get_queue_client(queue) is queue_client
+
+        # A different SAS is a different client
+        assert resource_manager.get_blob_service_client(_resource_manager._ResourceUri(TEMP_STORAGE2_URL)) is not blob_service
+
+        # Refreshing the resources drops the cached clients
+        resource_manager._ingest_client_resources_last_update -= resource_manager._refresh_period
+        resource_manager.get_containers()
+        assert resource_manager.get_blob_service_client(container) is not blob_service
+        assert resource_manager.get_queue_client(queue) is not queue_client
+
+        resource_manager.close()
+
+    @responses.activate
+    def test_resources_refresh_in_background(self):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        kusto_client = _resource_manager.KustoClient("https://ingest-somecluster.kusto.windows.net")
+        resource_manager = _resource_manager._ResourceManager(kusto_client)
+
+        # The first use fetches synchronously
+        assert resource_manager.get_authorization_context() == "authorization_context"
+        assert len(resource_manager.get_containers()) == 5
+        resources = resource_manager._ingest_client_resources
+        assert len(responses.calls) == 2
+
+        fetch_started = threading.Event()
+        release_fetch = threading.Event()
+        original_fetch = resource_manager._get_ingest_client_resources_from_service
+
+        def slow_fetch():
+            fetch_started.set()
+            release_fetch.wait(10)
+            return original_fetch()
+
+        with patch.object(resource_manager, "_get_ingest_client_resources_from_service", side_effect=slow_fetch) as mock_fetch:
+            resource_manager._ingest_client_resources_last_update -= resource_manager._refresh_period - resource_manager._refresh_ahead / 2
+            # Before the resources expire, callers are served the current ones while a single refresh runs in the background
+            for _ in range(5):
+                assert len(resource_manager.get_containers()) == 5
+                assert resource_manager._ingest_client_resources is resources
+            assert fetch_started.wait(10)
+            release_fetch.set()
+            resource_manager._refresh_executor.submit(lambda: None).result()
+            assert mock_fetch.call_count == 1
+
+        assert resource_manager._ingest_client_resources is not resources
+        assert not resource_manager._pending_refreshes
+        assert len(responses.calls) == 3
+
+        resource_manager.close()
+
+    @responses.activate
+    def test_expired_resources_are_refreshed_while_waiting(self):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        resource_manager = _resource_manager._ResourceManager(_resource_manager.KustoClient("https://ingest-somecluster.kusto.windows.net"))
+        resource_manager.get_containers()
+        resource_manager.get_authorization_context()
+        resources = resource_manager._ingest_client_resources
+        original_fetch = resource_manager._get_ingest_client_resources_from_service
+
+        def slow_fetch():
+            time.sleep(0.05)
+            return original_fetch()
+
+        with patch.object(resource_manager, "_get_ingest_client_resources_from_service", side_effect=slow_fetch) as mock_fetch:
+            # Expired resources are never served - concurrent callers wait for a single fetch
+            resource_manager._ingest_client_resources_last_update -= resource_manager._refresh_period
+            served = []
+
+            def get_containers():
+                resource_manager.get_containers()
+                served.append(resource_manager._ingest_client_resources)
+
+            threads = [threading.Thread(target=get_containers) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert mock_fetch.call_count == 1
+            assert len(served) == 5 and all(served_resources is not resources for served_resources in served)
+
+            # So are partial resources
+            resource_manager._ingest_client_resources.containers = []
+            assert len(resource_manager.get_containers()) == 5
+            assert mock_fetch.call_count == 2
+
+        resource_manager._authorization_context_last_update -= resource_manager._refresh_period
+        assert resource_manager.get_authorization_context() == "authorization_context"
+        assert not resource_manager._is_expired(resource_manager._authorization_context_last_update)
+        assert not resource_manager._pending_refreshes
+        resource_manager.close()
+
+    @responses.activate
+    def test_resources_snapshot(self, tmp_path):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+        snapshot_path = str(tmp_path / "resources.json")
+
+        resource_manager = _resource_manager._ResourceManager(_resource_manager.KustoClient("https://ingest-somecluster.kusto.windows.net"), snapshot_path)
+        containers = resource_manager.get_containers()
+        resource_manager.get_authorization_context()
+        resource_manager.close()
+        assert len(responses.calls) == 2
+        assert os.path.exists(snapshot_path)
+
+        # A new resource manager starts from the snapshot, without calling the service
+        resource_manager = _resource_manager._ResourceManager(_resource_manager.KustoClient("https://ingest-somecluster.kusto.windows.net"), snapshot_path)
+        assert {c.url for c in resource_manager.get_containers()} == {c.url for c in containers}
+        assert resource_manager.get_authorization_context() == "authorization_context"
+        assert len(responses.calls) == 2
+        resource_manager.close()
+
+        # Snapshots of other clusters are ignored
+        resource_manager = _resource_manager._ResourceManager(_resource_manager.KustoClient("https://ingest-othercluster.kusto.windows.net"), snapshot_path)
+        assert resource_manager._ingest_client_resources is None
+        assert resource_manager._authorization_context is None
+        resource_manager.close()
+
+        # Expired snapshots are ignored
+        with open(snapshot_path) as f:
+            snapshot = json.load(f)
+        snapshot["ingest_client_resources_last_update"] = "2020-01-01T00:00:00"
+        with open(snapshot_path, "w") as f:
+            json.dump(snapshot, f)
+
+        resource_manager = _resource_manager._ResourceManager(_resource_manager.KustoClient("https://ingest-somecluster.kusto.windows.net"), snapshot_path)
+        assert resource_manager._ingest_client_resources is None
+        assert resource_manager._authorization_context == "authorization_context"
+        resource_manager.get_containers()
+        assert len(responses.calls) == 3
+        resource_manager.close()
+
+    def test_resources_snapshot_save_failure(self, tmp_path, caplog):
+        # Failing to save is only logged, as the snapshot is an optimization
+        snapshot_file = _ResourceSnapshotFile(str(tmp_path / "missing" / "resources.json"), "https://ingest-somecluster.kusto.windows.net")
+        with caplog.at_level(logging.WARNING, logger="azure.kusto.ingest._resource_snapshot"):
+            snapshot_file.save({})
+        assert len(caplog.records) == 1 and snapshot_file.path in caplog.records[0].getMessage()
+        assert snapshot_file.load() is None
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_ingest_from_files(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        ingest_client = QueuedIngestClient("https://ingest-somecluster.kusto.windows.net")
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV)
+
+        # ensure test can work when executed from within directories
+        current_dir = os.getcwd()
+        path_parts = ["azure-kusto-ingest", "tests", "input", "dataset.csv"]
+        missing_path_parts = []
+        for path_part in path_parts:
+            if path_part not in current_dir:
+                missing_path_parts.append(path_part)
+
+        file_path = os.path.join(current_dir, *missing_path_parts)
+        missing_file_path = file_path + ".missing"
+        files = [file_path] * 20 + [missing_file_path] + [file_path] * 20
+
+        results = ingest_client.ingest_from_files(
+            (f for f in files), ingestion_properties=ingestion_properties, max_concurrent_reads=2, max_concurrent_uploads=3, max_concurrent_enqueues=4
+        )
+
+        assert len(results) == 41
+        assert [r.source for r in results] == files
+        # A failing file doesn't affect the others
+        assert not results[20].succeeded
+        assert isinstance(results[20].error, OSError)
+        assert all(r.succeeded and r.result.status == IngestionStatus.QUEUED for r in results[:20] + results[21:])
+        assert len({r.result.source_id for r in results if r.succeeded}) == 40
+        assert mock_upload_blob_from_stream.call_count == 40
+        assert mock_put_message_in_queue.call_count == 40
+
+        # Blobs only go through the enqueue stage
+        mock_put_message_in_queue.side_effect = [None, Exception("failed"), Exception("failed"), Exception("failed"), None]
+        blob_results = ingest_client.ingest_from_blobs(
+            [BlobDescriptor(r.result.blob_uri, 10) for r in results[:3]],
+            ingestion_properties=ingestion_properties,
+            max_concurrent_enqueues=1,
+        )
+        assert [r.succeeded for r in blob_results] == [True, False, True]
+        assert isinstance(blob_results[1].error, KustoQueueError)
+
+        ingest_client.close()
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    def test_ingest_from_blobs_round_robin(self, mock_aad):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        ingest_client = QueuedIngestClient("https://ingest-somecluster.kusto.windows.net")
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV, additional_tags=["tag"])
+        # Three queues of the ingestion resources' storage account
+        ingest_client._resource_manager.get_ingestion_queues()
+        queues = [_resource_manager._ResourceUri("https://storageaccount.queue.core.windows.net/queue{0}?sp=a&sig=xxx".format(i)) for i in range(3)]
+
+        sent = []
+        lock = threading.Lock()
+
+        def send_message(self, content, **kwargs):
+            with lock:
+                sent.append((self.queue_name, content))
+
+        with patch.object(ingest_client._resource_manager, "get_ingestion_queues", return_value=queues) as mock_get_queues, patch(
+            "azure.storage.queue.QueueClient.send_message", autospec=True, side_effect=send_message
+        ):
+            blobs = [BlobDescriptor("https://storageaccount.blob.core.windows.net/container/blob{}?sas".format(i), i) for i in range(30)]
+            results = ingest_client.ingest_from_blobs(iter(blobs), ingestion_properties=ingestion_properties, max_concurrent_enqueues=8)
+
+        assert all(r.succeeded for r in results)
+        assert [r.result.blob_uri for r in results] == [b.path for b in blobs]
+        # The ranked queues are taken once, and the messages are spread evenly across them
+        assert mock_get_queues.call_count == 1
+        assert sorted(queue_name for queue_name, _ in sent) == sorted(["queue0", "queue1", "queue2"] * 10)
+
+        # The messages are the same as the ones of ingest_from_blob
+        messages = {json.loads(content)["BlobPath"]: json.loads(content) for _, content in sent}
+        for blob in blobs:
+            message = messages[blob.path]
+            expected = json.loads(
+                IngestionBlobInfo(
+                    blob,
+                    ingestion_properties,
+                    auth_context="authorization_context",
+                    application_for_tracing=ingest_client.application_for_tracing,
+                    client_version_for_tracing=ingest_client.client_version_for_tracing,
+                ).to_json()
+            )
+            assert message["Id"] == str(blob.source_id)
+            for volatile in ("Id", "SourceMessageCreationTime"):
+                del message[volatile], expected[volatile]
+            assert message == expected
+
+        metrics = ingest_client.get_enqueue_metrics()
+        assert metrics.messages_sent == 30
+        assert metrics.messages_failed == 0
+        assert metrics.messages_per_queue == {"queue0": 10, "queue1": 10, "queue2": 10}
+        assert metrics.messages_per_second > 0
+
+        ingest_client.close()
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_spool_when_storage_is_unavailable(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad, tmp_path):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        uploads = []
+
+        def upload_blob(data, **kwargs):
+            if len(uploads) < 3:
+                uploads.append(None)
+                raise Exception("storage is down")
+            uploads.append(gzip.decompress(data.read()))
+
+        mock_upload_blob_from_stream.side_effect = upload_blob
+
+        # Storage health is controlled separately for the producer and for the spool's replays
+        health = {"producer": True, "replay": False}
+
+        def has_healthy_accounts(self):
+            return health["replay" if threading.current_thread().name == "KustoIngestionSpool" else "producer"]
+
+        with patch.object(_RankedStorageAccountSet, "has_healthy_accounts", has_healthy_accounts):
+            ingest_client = QueuedIngestClient("https://ingest-somecluster.kusto.windows.net", spool_directory=str(tmp_path / "spool"))
+            ingest_client._spool.retry_interval = 0.01
+            ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV)
+
+            # The upload fails on all retries, so the payload is spooled
+            result = ingest_client.ingest_from_stream(io.BytesIO(b"1,2\n"), ingestion_properties=ingestion_properties)
+            assert result.status == IngestionStatus.SPOOLED
+            assert len(uploads) == 3
+
+            # While storage is unhealthy, ingestions are deferred to the spool without waiting for storage
+            health["producer"] = False
+            result = ingest_client.ingest_from_stream(io.BytesIO(b"3,4\n"), ingestion_properties=ingestion_properties)
+            assert result.status == IngestionStatus.SPOOLED
+            assert len(uploads) == 3
+            assert ingest_client._spool.pending_count() == 2
+            assert mock_put_message_in_queue.call_count == 0
+
+            # Once storage recovers, the spool is replayed in order
+            health["replay"] = True
+            deadline = time.monotonic() + 5
+            while mock_put_message_in_queue.call_count < 2:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+
+            ingest_client.close()
+
+        assert uploads[3:] == [b"1,2\n", b"3,4\n"]
+        assert os.listdir(str(tmp_path / "spool")) == []
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_spool_when_service_is_unavailable(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad, tmp_path):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+        uploads = []
+        mock_upload_blob_from_stream.side_effect = lambda data, **kwargs: uploads.append(gzip.decompress(data.read()))
+
+        ingest_client = QueuedIngestClient("https://ingest-somecluster.kusto.windows.net", spool_directory=str(tmp_path / "spool"))
+        ingest_client._spool.retry_interval = 0.01
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV)
+        resource_manager = ingest_client._resource_manager
+        outage = {"service": True}
+
+        def unavailable(get_resource):
+            def get():
+                if outage["service"]:
+                    raise KustoServiceError("The service is unavailable")
+                return get_resource()
+
+            return get
+
+        with patch.object(resource_manager, "get_containers", side_effect=unavailable(resource_manager.get_containers)), patch.object(
+            resource_manager, "get_ingestion_queues", side_effect=unavailable(resource_manager.get_ingestion_queues)
+        ):
+            # Ingestions are spooled instead of failing while the resources can't be fetched, and the spool keeps them while they still can't
+            result = ingest_client.ingest_from_stream(io.BytesIO(b"1,2\n"), ingestion_properties=ingestion_properties)
+            assert result.status == IngestionStatus.SPOOLED
+            blob = BlobDescriptor("https://account.blob.core.windows.net/container/blob?sas", 10)
+            assert ingest_client.ingest_from_blob(blob, ingestion_properties=ingestion_properties).status == IngestionStatus.SPOOLED
+            time.sleep(0.05)
+            assert ingest_client._spool.pending_count() == 2
+            assert ingest_client._spool.failed_replays == 0
+
+            # Once the service recovers, the spool is replayed
+            outage["service"] = False
+            deadline = time.monotonic() + 5
+            while mock_put_message_in_queue.call_count < 2:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+
+        ingest_client.close()
+        assert uploads == [b"1,2\n"]
+        assert os.listdir(str(tmp_path / "spool")) == []
+
+    @responses.activate
+    @pytest.mark.skipif(not pandas_installed, reason="requires pandas")
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_ingest_from_dataframe_in_chunks(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        # The streams are closed once uploaded, so their content is read during the upload
+        uploads = []
+        mock_upload_blob_from_stream.side_effect = lambda data, **kwargs: uploads.append(data.read())
+
+        ingest_client = QueuedIngestClient("https://ingest-somecluster.kusto.windows.net")
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.JSON)
+
+        from pandas import DataFrame
+
+        df = DataFrame(data=[[i, "name {}".format(i), i / 3] for i in range(25)], columns=["id", "name", "value"])
+
+        results = ingest_client.ingest_from_dataframe_in_chunks(df, ingestion_properties=ingestion_properties, chunk_rows=10, max_concurrent_serializations=2)
+
+        assert ingestion_properties.format == DataFormat.CSV
+        assert [len(r.source) for r in results] == [10, 10, 5]
+        assert all(r.succeeded for r in results)
+        assert mock_upload_blob_from_stream.call_count == 3
+
+        # Every chunk is its own blob, with the raw size of its own content
+        uploaded_chunks = sorted(gzip.decompress(data).decode("utf-8") for data in uploads)
+        expected_chunks = sorted(r.source.to_csv(index=False, header=False) for r in results)
+        assert uploaded_chunks == expected_chunks
+        raw_sizes = sorted(json.loads(call[1]["content"])["RawDataSize"] for call in mock_put_message_in_queue.call_args_list)
+        assert raw_sizes == sorted(len(chunk.encode("utf-8")) for chunk in expected_chunks)
+
+        with pytest.raises(ValueError):
+            ingest_client.ingest_from_dataframe_in_chunks(df, ingestion_properties=ingestion_properties, data_format=DataFormat.JSON)
+
+        ingest_client.close()
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_ingest_from_records(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=request_callback, content_type="application/json"
+        )
+
+        uploads = []
+        mock_upload_blob_from_stream.side_effect = lambda data, **kwargs: uploads.append(gzip.decompress(data.read()).decode("utf-8"))
+
+        ingest_client = QueuedIngestClient("https://ingest-somecluster.kusto.windows.net")
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.JSON)
+
+        records = ({"id": i, "name": "name {}".format(i), "time": datetime(2024, 1, 1)} for i in range(1000))
+        results = ingest_client.ingest_from_records(records, ingestion_properties=ingestion_properties, max_batch_size=10 * 1024)
+
+        # The records are split on record boundaries into size bounded blobs, each with its raw size
+        assert len(results) == len(uploads) > 1
+        assert all(r.status == IngestionStatus.QUEUED for r in results)
+        lines = "".join(uploads).splitlines()
+        assert [json.loads(line) for line in lines] == [{"id": i, "name": "name {}".format(i), "time": "2024-01-01 00:00:00"} for i in range(1000)]
+        raw_sizes = [json.loads(call[1]["content"])["RawDataSize"] for call in mock_put_message_in_queue.call_args_list]
+        assert raw_sizes == [len(upload.encode("utf-8")) for upload in uploads]
+        assert all(10 * 1024 <= size < 10 * 1024 + 100 for size in raw_sizes[:-1])
+
+        uploads.clear()
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.PSV)
+        results = ingest_client.ingest_from_records([(1, "a|b", None), {"id": 2, "name": "c"}], ingestion_properties=ingestion_properties)
+        assert len(results) == 1
+        assert uploads == ['1|"a|b"|\n2|c\n']
+
+        assert ingest_client.ingest_from_records([], ingestion_properties=ingestion_properties) == []
+
+        with pytest.raises(ValueError):
+            ingest_client.ingest_from_records([(1,)], ingestion_properties=IngestionProperties(database="database", table="table", data_format=DataFormat.ORC))
+
+        # The size of a batch is known once it was read, through the descriptor or its copies, and explicitly set sizes are kept
+        batch = next(record_batches([{"id": 1}], DataFormat.JSON, 100))
+        batch_copy = StreamDescriptor.get_instance(batch)
+        assert batch.size is None and batch_copy.size is None
+        batch_copy.stream.read()
+        assert batch.size == batch_copy.size == len(b'{"id":1}\n')
+        batch_copy.size = 5
+        assert (batch.size, batch_copy.size) == (len(b'{"id":1}\n'), 5)
+
+        ingest_client.close()
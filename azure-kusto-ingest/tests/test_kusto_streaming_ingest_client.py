@@ -8,6 +8,7 @@ import uuid
 import pytest
 import responses
 
+from azure.kusto.data import SlowQueryLog, metrics
 from azure.kusto.data.data_format import DataFormat
 from azure.kusto.ingest import KustoStreamingIngestClient, IngestionProperties, IngestionStatus, ManagedStreamingIngestClient
 
@@ -193,6 +194,21 @@ class TestKustoStreamingIngestClient:
         result = ingest_client.ingest_from_stream(str_stream, ingestion_properties=ingestion_properties)
         assert result.status == IngestionStatus.SUCCESS
 
+    @responses.activate
+    def test_slow_query_log(self, ingest_client_class):
+        responses.add_callback(
+            responses.POST, "https://somecluster.kusto.windows.net/v1/rest/ingest/database/table", callback=lambda r: request_callback(r, ingest_client_class)
+        )
+        records = []
+        ingest_client = ingest_client_class("https://somecluster.kusto.windows.net")
+        ingest_client.set_slow_query_log(SlowQueryLog(latency_threshold_seconds=0, sink=records.append))
+
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV)
+        result = ingest_client.ingest_from_stream(io.BytesIO(b"56,56,56"), ingestion_properties=ingestion_properties)
+        assert result.status == IngestionStatus.SUCCESS
+
+        assert [(record.operation, record.database, record.query_hash) for record in records] == [(metrics.STREAMING_INGEST, "database", None)]
+
     def test_client_uri_from_query_endpoint(self):
         assert (
             KustoStreamingIngestClient("https://somecluster.kusto.windows.net")._kusto_client._kusto_cluster == "https://somecluster.kusto.windows.net/"
@@ -1,3 +1,4 @@
+import gzip
 import io
 import json
 import os
@@ -8,9 +9,11 @@ from unittest.mock import patch
 import pytest
 import responses
 
+from azure.kusto.data import KustoConnectionStringBuilder, metrics
 from azure.kusto.data.data_format import DataFormat
 from azure.kusto.data.exceptions import KustoApiError
-from azure.kusto.ingest import ManagedStreamingIngestClient, IngestionProperties, IngestionStatus, BlobDescriptor
+from azure.kusto.data.metrics import InMemoryMeter
+from azure.kusto.ingest import ManagedStreamingIngestClient, IngestionProperties, IngestionStatus, BlobDescriptor, StreamDescriptor, KustoPartialIngestionError
 from test_kusto_ingest_client import request_callback as queued_request_callback, assert_queued_upload, request_callback_throw_transient
 from test_kusto_streaming_ingest_client import request_callback as streaming_request_callback, assert_managed_streaming_request_id
 
@@ -270,6 +273,48 @@ class TestManagedStreamingIngestClient:
 
         assert helper.total_calls == total_failures + 1
 
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    @patch("uuid.uuid4", return_value=MOCKED_UUID_4)
+    def test_metrics(self, mock_uuid, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=queued_request_callback, content_type="application/json"
+        )
+        helper = TransientResponseHelper(times_to_fail=2)
+        responses.add_callback(
+            responses.POST,
+            "https://somecluster.kusto.windows.net/v1/rest/ingest/database/table",
+            callback=lambda request: transient_error_callback(helper, request),
+            content_type="application/json",
+        )
+        mock_upload_blob_from_stream.side_effect = lambda data, **kwargs: data.read()
+        meter = InMemoryMeter()
+        metrics.enable_metrics(meter)
+        try:
+            ingest_client = ManagedStreamingIngestClient("https://somecluster.kusto.windows.net")
+            ingest_client._set_retry_settings(0)
+            streamed = ingest_client.ingest_from_stream(io.BytesIO(b"1,2\n" * 1000), IngestionProperties(database="database", table="table"))
+            # Over the streaming limit, so it falls back to queued ingestion
+            orc_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.ORC)
+            queued = ingest_client.ingest_from_stream(io.BytesIO(os.urandom(5 * 1024 * 1024)), orc_properties)
+        finally:
+            metrics.disable_metrics()
+
+        assert (streamed.status, queued.status) == (IngestionStatus.SUCCESS, IngestionStatus.QUEUED)
+        ingestions = "kusto.ingest.managed_streaming.ingestions"
+        assert meter.sum(ingestions, **{metrics.INGESTION_METHOD: metrics.STREAMING, metrics.DATABASE: "database"}) == 1
+        assert meter.sum(ingestions, **{metrics.INGESTION_METHOD: metrics.QUEUED}) == 1
+        assert meter.sum("kusto.client.retries", **{metrics.OPERATION: metrics.STREAMING_INGEST, metrics.TABLE: "table"}) == 2
+        assert 0 < meter.sum("kusto.ingest.size", **{metrics.INGESTION_METHOD: metrics.STREAMING}) < 4000
+        assert meter.sum("kusto.ingest.size", **{metrics.INGESTION_METHOD: metrics.QUEUED}) == 5 * 1024 * 1024
+        assert meter.get_points("kusto.ingest.upload.throughput")[0].attributes == {metrics.STORAGE_ACCOUNT: "storageaccount"}
+        # The CSV was compressed before it was streamed
+        assert meter.get_points("kusto.ingest.compression_ratio")[0].value > 1
+        durations = meter.get_points("kusto.client.request.duration", **{metrics.OPERATION: metrics.STREAMING_INGEST, metrics.DATABASE: "database"})
+        assert [point.attributes[metrics.STATUS_CODE] for point in durations] == [400, 400, 200]
+
     @responses.activate
     def test_permanent_error(self):
         responses.add(
@@ -393,3 +438,263 @@ class TestManagedStreamingIngestClient:
         ), "Client URI was not extracted correctly from query endpoint"
         assert client.queued_client._resource_manager._kusto_client._kusto_cluster == "https://onebox.dev.kusto.windows.net/"
         assert client.streaming_client._kusto_client._kusto_cluster == "https://onebox.dev.kusto.windows.net/"
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_records_small_batches_are_streamed(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=queued_request_callback, content_type="application/json"
+        )
+        responses.add_callback(
+            responses.POST,
+            "https://somecluster.kusto.windows.net/v1/rest/ingest/database/table",
+            callback=lambda request: streaming_request_callback(request, ManagedStreamingIngestClient),
+            content_type="application/json",
+        )
+
+        ingest_client = ManagedStreamingIngestClient("https://somecluster.kusto.windows.net")
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.MULTIJSON)
+
+        results = ingest_client.ingest_from_records(({"id": i} for i in range(100)), ingestion_properties=ingestion_properties)
+
+        assert [r.status for r in results] == [IngestionStatus.SUCCESS]
+        mock_upload_blob_from_stream.assert_not_called()
+        streamed = [call.request for call in responses.calls if "/v1/rest/ingest/" in call.request.url]
+        assert len(streamed) == 1
+        assert "streamFormat=multijson" in streamed[0].url
+        assert streamed[0].headers["Content-Encoding"] == "gzip"
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    @patch("azure.kusto.ingest.managed_streaming_ingest_client.ManagedStreamingIngestClient.MAX_STREAMING_SIZE_IN_BYTES", new=64 * 1024)
+    @patch("azure.kusto.ingest._record_splitter._READ_SIZE", new=4 * 1024)
+    def test_split_large_stream(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=queued_request_callback, content_type="application/json"
+        )
+
+        streamed_chunks = []
+
+        def streaming_callback(request):
+            body = request.body.read() if hasattr(request.body, "read") else request.body
+            assert len(body) <= 64 * 1024
+            streamed_chunks.append(gzip.decompress(body))
+            return streaming_request_callback(request, ManagedStreamingIngestClient)
+
+        responses.add_callback(
+            responses.POST, "https://somecluster.kusto.windows.net/v1/rest/ingest/database/table", callback=streaming_callback, content_type="application/json"
+        )
+
+        ingest_client = ManagedStreamingIngestClient("https://somecluster.kusto.windows.net", split_large_streams=True, max_concurrent_streams=2)
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.MULTIJSON)
+
+        # Random content, so that it doesn't compress below the streaming limit. Every other record spans multiple lines.
+        records = [json.dumps({"id": i, "data": os.urandom(32).hex(), "text": 'a "}\n'}, indent=i % 2 or None) for i in range(2000)]
+        data = "\n".join(records).encode("utf-8")
+        stream = io.BytesIO(data)
+
+        result = ingest_client.ingest_from_stream(stream, ingestion_properties=ingestion_properties)
+
+        assert result.status == IngestionStatus.SUCCESS
+        mock_upload_blob_from_stream.assert_not_called()
+        assert len(streamed_chunks) > 1
+        # The chunks were streamed concurrently, so they are matched by their first record
+        streamed_chunks.sort(key=lambda chunk: json.JSONDecoder().raw_decode(chunk.decode("utf-8").lstrip())[0]["id"])
+        assert b"\n".join(chunk.strip() for chunk in streamed_chunks) == data
+
+        # Without splitting, the same stream is queued
+        ingest_client = ManagedStreamingIngestClient("https://somecluster.kusto.windows.net")
+        result = ingest_client.ingest_from_stream(io.BytesIO(data), ingestion_properties=ingestion_properties)
+        assert result.status == IngestionStatus.QUEUED
+        mock_upload_blob_from_stream.assert_called_once()
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.kusto.ingest.managed_streaming_ingest_client.ManagedStreamingIngestClient.MAX_STREAMING_SIZE_IN_BYTES", new=64 * 1024)
+    @patch("azure.kusto.ingest._record_splitter._READ_SIZE", new=4 * 1024)
+    def test_split_large_stream_partial_failure(self, mock_aad):
+        ingested_source_ids = set()
+
+        def streaming_callback(request):
+            body = request.body.read() if hasattr(request.body, "read") else request.body
+            first_record = json.JSONDecoder().raw_decode(gzip.decompress(body).decode("utf-8").lstrip())[0]
+            if first_record["id"] == 0:
+                error = {
+                    "error": {"code": "BadRequest", "message": "Bad request", "@type": "BadRequestException", "@message": "Bad request", "@permanent": True}
+                }
+                return 400, {}, json.dumps(error)
+            ingested_source_ids.add(uuid.UUID(request.headers["x-ms-client-request-id"].split(";")[1]))
+            return streaming_request_callback(request, ManagedStreamingIngestClient)
+
+        responses.add_callback(
+            responses.POST, "https://somecluster.kusto.windows.net/v1/rest/ingest/database/table", callback=streaming_callback, content_type="application/json"
+        )
+
+        ingest_client = ManagedStreamingIngestClient("https://somecluster.kusto.windows.net", split_large_streams=True, max_concurrent_streams=2)
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.MULTIJSON)
+        records = [json.dumps({"id": i, "data": os.urandom(64).hex()}) for i in range(4000)]
+        descriptor = StreamDescriptor(io.BytesIO("\n".join(records).encode("utf-8")))
+
+        # The first chunk fails, but the chunks after it are still ingested, and reported
+        with pytest.raises(KustoPartialIngestionError) as ex:
+            ingest_client.ingest_from_stream(descriptor, ingestion_properties=ingestion_properties)
+
+        assert ex.value.source_id == descriptor.source_id
+        assert len(ex.value.errors) == 1 and isinstance(ex.value.__cause__, KustoApiError)
+        assert len(ingested_source_ids) > 1
+        assert set(ex.value.ingested_source_ids) == ingested_source_ids
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    def test_streaming_disabled_table_is_remembered(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=queued_request_callback, content_type="application/json"
+        )
+        streaming_enabled = False
+
+        def streaming_callback(request):
+            if streaming_enabled:
+                return streaming_request_callback(request, None)
+            error = {"code": "BadRequest_StreamingIngestionPolicyNotEnabled", "message": "Streaming ingestion is not enabled", "@permanent": True}
+            return 400, {}, json.dumps({"error": error})
+
+        responses.add_callback(
+            responses.POST, "https://somecluster.kusto.windows.net/v1/rest/ingest/database/table", callback=streaming_callback, content_type="application/json"
+        )
+
+        now = [0.0]
+        ingest_client = ManagedStreamingIngestClient("https://somecluster.kusto.windows.net")
+        ingest_client._set_retry_settings(0, 1)
+        ingest_client._streaming_capability.time_provider = lambda: now[0]
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV)
+
+        def ingest_and_count_streaming_calls():
+            calls_before = len([c for c in responses.calls if "/v1/rest/ingest/" in c.request.url])
+            result = ingest_client.ingest_from_stream(io.BytesIO(b"1,2\n"), ingestion_properties=ingestion_properties)
+            return result.status, len([c for c in responses.calls if "/v1/rest/ingest/" in c.request.url]) - calls_before
+
+        # The table can't stream, so the data is queued, and the following ingestions don't even try streaming
+        assert ingest_and_count_streaming_calls() == (IngestionStatus.QUEUED, 1)
+        assert ingest_and_count_streaming_calls() == (IngestionStatus.QUEUED, 0)
+
+        # Other tables are unaffected
+        other_properties = IngestionProperties(database="database", table="other", data_format=DataFormat.CSV)
+        assert ingest_client._streaming_capability.should_stream(other_properties.database, other_properties.table)
+
+        # Once the TTL passes, a single ingestion probes the table
+        streaming_enabled = True
+        now[0] += ingest_client._streaming_capability.disabled_ttl
+        assert ingest_and_count_streaming_calls() == (IngestionStatus.SUCCESS, 1)
+        assert ingest_and_count_streaming_calls() == (IngestionStatus.SUCCESS, 1)
+
+    def test_streaming_capability_circuit_breaker(self):
+        from azure.kusto.ingest._streaming_capability import _StreamingCapabilityCache
+
+        now = [0.0]
+        cache = _StreamingCapabilityCache(disabled_ttl=100, failure_ttl=10, failure_threshold=2, time_provider=lambda: now[0])
+
+        # Transient failures open the circuit only once they repeat
+        cache.report_failure("db", "table")
+        assert cache.should_stream("db", "table")
+        cache.report_success("db", "table")
+        cache.report_failure("db", "table")
+        assert cache.should_stream("db", "table")
+        cache.report_failure("db", "table")
+        assert not cache.should_stream("db", "table")
+
+        # After the TTL, one probe is let through at a time
+        now[0] = 10
+        assert cache.should_stream("db", "table")
+        assert not cache.should_stream("db", "table")
+        cache.report_failure("db", "table")
+        now[0] = 19
+        assert not cache.should_stream("db", "table")
+        now[0] = 20
+        assert cache.should_stream("db", "table")
+        cache.report_success("db", "table")
+        assert cache.should_stream("db", "table")
+
+        cache.report_disabled("db", "table")
+        now[0] = 119
+        assert not cache.should_stream("db", "table")
+        now[0] = 120
+        assert cache.should_stream("db", "table")
+
+    @responses.activate
+    @patch("azure.kusto.data.security._AadHelper.acquire_authorization_header", return_value=None)
+    @patch("azure.storage.blob.BlobClient.upload_blob")
+    @patch("azure.storage.queue.QueueClient.send_message")
+    @patch("azure.kusto.ingest.managed_streaming_ingest_client.ManagedStreamingIngestClient.MAX_STREAMING_SIZE_IN_BYTES", new=64 * 1024)
+    def test_route_by_estimated_size(self, mock_put_message_in_queue, mock_upload_blob_from_stream, mock_aad, tmp_path):
+        responses.add_callback(
+            responses.POST, "https://ingest-somecluster.kusto.windows.net/v1/rest/mgmt", callback=queued_request_callback, content_type="application/json"
+        )
+        responses.add_callback(
+            responses.POST,
+            "https://somecluster.kusto.windows.net/v1/rest/ingest/database/table",
+            callback=lambda request: streaming_request_callback(request, ManagedStreamingIngestClient),
+            content_type="application/json",
+        )
+
+        uploads = []
+        mock_upload_blob_from_stream.side_effect = lambda data, **kwargs: uploads.append(data.read())
+
+        ingest_client = ManagedStreamingIngestClient("https://somecluster.kusto.windows.net")
+        ingestion_properties = IngestionProperties(database="database", table="table", data_format=DataFormat.CSV)
+
+        # Random data that won't compress to under the limit is queued without ever being compressed in memory or streamed
+        incompressible = b"".join(b"%d,%s\n" % (i, os.urandom(32).hex().encode()) for i in range(10000))
+        file_path = tmp_path / "incompressible.csv"
+        file_path.write_bytes(incompressible)
+        with patch("azure.kusto.ingest.descriptors.StreamDescriptor.compress_stream") as mock_compress_stream:
+            result = ingest_client.ingest_from_file(str(file_path), ingestion_properties=ingestion_properties)
+            mock_compress_stream.assert_not_called()
+
+        assert result.status == IngestionStatus.QUEUED
+        assert gzip.decompress(uploads[0]) == incompressible
+        assert json.loads(mock_put_message_in_queue.call_args[1]["content"])["RawDataSize"] == len(incompressible)
+        assert not [c for c in responses.calls if "/v1/rest/ingest/" in c.request.url]
+
+        # The same amount of repetitive data compresses well, so it is streamed
+        compressible = b"1,the same line\n" * (len(incompressible) // 16)
+        result = ingest_client.ingest_from_stream(io.BytesIO(compressible), ingestion_properties=ingestion_properties)
+        assert result.status == IngestionStatus.SUCCESS
+
+        # A stream that isn't seekable is estimated from its size hint, and read from the start
+        class NonSeekable(io.RawIOBase):
+            def __init__(self, data):
+                self.data = io.BytesIO(data)
+
+            def readable(self):
+                return True
+
+            def readinto(self, b):
+                return self.data.readinto(b)
+
+        stream_descriptor = StreamDescriptor(NonSeekable(incompressible), size=len(incompressible))
+        result = ingest_client.ingest_from_stream(stream_descriptor, ingestion_properties=ingestion_properties)
+        assert result.status == IngestionStatus.QUEUED
+        assert gzip.decompress(uploads[1]) == incompressible
+
+    def test_share_resources(self):
+        kcsb = KustoConnectionStringBuilder.with_aad_application_key_authentication("https://somecluster.kusto.windows.net", "app_id", "app_key", "tenant")
+        ingest_client = ManagedStreamingIngestClient(kcsb, share_resources=True)
+        queued_kusto_client = ingest_client.queued_client._resource_manager._kusto_client
+        streaming_kusto_client = ingest_client.streaming_client._kusto_client
+        assert queued_kusto_client._session is streaming_kusto_client._session
+        assert queued_kusto_client._aad_helper is not None
+        assert queued_kusto_client._aad_helper is streaming_kusto_client._aad_helper
+        ingest_client.close()
+
+        ingest_client = ManagedStreamingIngestClient(kcsb)
+        queued_kusto_client = ingest_client.queued_client._resource_manager._kusto_client
+        streaming_kusto_client = ingest_client.streaming_client._kusto_client
+        assert queued_kusto_client._session is not streaming_kusto_client._session
+        assert queued_kusto_client._aad_helper is not streaming_kusto_client._aad_helper
+        ingest_client.close()
@@ -0,0 +1,58 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import gzip
+import io
+from unittest.mock import patch
+
+from azure.kusto.data.data_format import DataFormat
+from azure.kusto.ingest._record_splitter import split_records
+
+
+@patch("azure.kusto.ingest._record_splitter._READ_SIZE", new=16)
+class TestRecordSplitter:
+    def split(self, data: bytes, data_format: DataFormat, max_chunk_size: int):
+        return [gzip.decompress(chunk) for chunk in split_records(io.BytesIO(data), data_format, max_chunk_size)]
+
+    def test_csv_quoted_line_breaks(self):
+        data = b'1,"multi\nline"\n2,"quoted ""\n"" quote"\n3,plain\n' * 20
+        chunks = self.split(data, DataFormat.CSV, 100)
+
+        assert len(chunks) > 1
+        assert b"".join(chunks) == data
+        assert all(chunk.startswith((b"1,", b"2,", b"3,")) and chunk.endswith(b"\n") for chunk in chunks)
+
+    def test_json_values_spanning_lines(self):
+        data = b'{"a": "}\\"{",\n "b": [1, {"c": 2}]}\n[1, 2]\n' * 20
+        chunks = self.split(data, DataFormat.JSON, 100)
+
+        assert len(chunks) > 1
+        assert b"".join(chunks) == data
+        assert all(chunk.lstrip().startswith((b"{", b"[")) and chunk.rstrip().endswith((b"}", b"]")) for chunk in chunks)
+
+    def test_record_larger_than_chunk(self):
+        data = b"short\n" + b"x" * 1000 + b"\nshort\n"
+        chunks = self.split(data, DataFormat.TXT, 100)
+
+        # The large record gets a chunk of its own, which still has room for the (well compressed) following record
+        assert chunks == [b"short\n", b"x" * 1000 + b"\nshort\n"]
+
+    def test_empty(self):
+        assert self.split(b"", DataFormat.CSV, 100) == []
+        assert self.split(b"\n\n", DataFormat.JSON, 100) == []
+
+    def test_json_escapes_split_between_reads(self):
+        # Every alignment of the escaped quote against the reads of 16 bytes
+        for padding in range(17):
+            data = b'{"a": "' + b"x" * padding + b'\\"}{[",\n "b": 1}\n{"c": "\\\\"}\n'
+            chunks = self.split(data * 3, DataFormat.JSON, 80)
+
+            # Line breaks between values may be left out at the start of a chunk
+            assert b"\n".join(chunk.strip() for chunk in chunks) == (data * 3).strip()
+            assert all(chunk.lstrip().startswith(b"{") and chunk.rstrip().endswith(b"}") for chunk in chunks)
+
+    def test_records_spanning_many_reads(self):
+        data = b'1,"' + b"long\n" * 1000 + b'"\n2,short\n'
+        assert b"".join(self.split(data, DataFormat.CSV, 1024 * 1024)) == data
+        chunks = self.split(data * 3, DataFormat.CSV, 100)
+        assert b"".join(chunks) == data * 3
+        assert all(chunk.startswith((b"1,", b"2,")) for chunk in chunks)
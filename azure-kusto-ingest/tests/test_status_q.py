@@ -1,6 +1,8 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License
+import asyncio
 import json
+import threading
 import time
 import unittest
 import uuid
@@ -11,7 +13,7 @@ from azure.storage.queue import QueueMessage, QueueClient
 
 from azure.kusto.ingest import QueuedIngestClient, IngestionResult, IngestionStatus
 from azure.kusto.ingest._resource_manager import _ResourceUri
-from azure.kusto.ingest.status import KustoIngestStatusQueues, SuccessMessage, FailureMessage
+from azure.kusto.ingest.status import KustoIngestStatusQueues, KustoIngestStatusTracker, SuccessMessage, FailureMessage
 
 SAS = "sp=rl&st=2020-05-20T13:38:37Z&se=2020-05-21T13:38:37Z&sv=2019-10-10&sr=c&sig=xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx"
 ENDPOINT_SUFFIX = "core.windows.net"
@@ -262,3 +264,98 @@ class StatusQTests(unittest.TestCase):
 
         no_path = IngestionResult(IngestionStatus.QUEUED, "db", "table", uuid.UUID("11111111-1111-1111-1111-111111111111"))
         assert repr(no_path) == "IngestionResult(status=IngestionStatus.QUEUED, database=db, table=table, source_id=11111111-1111-1111-1111-111111111111)"
+
+    def test_status_tracker(self):
+        client = QueuedIngestClient("some-cluster")
+        succeeded, failed, untracked = mock_message(success=True), mock_message(success=False), mock_message(success=False)
+        malformed = mock_message(success=False)
+        malformed.content = "not json"
+        queues = {"mocked_qs_name": FakeStatusQueue([succeeded]), "mocked_qf_name": FakeStatusQueue([malformed, failed, untracked])}
+
+        with mock.patch.object(client._resource_manager, "get_successful_ingestions_queues") as mocked_get_success_qs, mock.patch.object(
+            client._resource_manager, "get_failed_ingestions_queues"
+        ) as mocked_get_failed_qs, mock.patch.object(
+            QueueClient, "receive_messages", autospec=True, side_effect=lambda self, **kwargs: queues[self.queue_name].receive(**kwargs)
+        ) as q_receive_mock, mock.patch.object(
+            QueueClient, "delete_message", autospec=True, side_effect=lambda self, message_id, pop_receipt: queues[self.queue_name].delete(message_id)
+        ) as q_del_mock:
+            mocked_get_success_qs.return_value = [get_resource_uri("mocked_storage_account1", "mocked_qs_name")]
+            mocked_get_failed_qs.return_value = [get_resource_uri("mocked_storage_account2", "mocked_qf_name")]
+
+            with KustoIngestStatusTracker(client, poll_interval=0.01, batch_size=10) as tracker:
+                with self.assertRaises(ValueError):
+                    tracker.track(IngestionResult(IngestionStatus.SUCCESS, "db1", "table1", uuid4()))
+
+                success_future = tracker.track(IngestionResult(IngestionStatus.QUEUED, "db1", "table1", uuid.UUID(str(succeeded.id))))
+                failure_future = tracker.track(str(failed.id))
+                assert tracker.track(str(succeeded.id)) is success_future
+
+                # The malformed message is skipped
+                assert success_future.wait(5) and failure_future.wait(5)
+                assert isinstance(success_future.result(), SuccessMessage)
+                assert isinstance(failure_future.result(), FailureMessage)
+                assert failure_future.result().IngestionSourceId == str(failed.id)
+                assert tracker.pending_count() == 0
+
+                # Polls without tracked messages wait before the next one
+                receive_count = q_receive_mock.call_count
+                pending_future = tracker.track(uuid4())
+                assert not pending_future.wait(0.1)
+                assert q_receive_mock.call_count - receive_count <= 2 * 12
+                assert asyncio.run(_await(success_future)) is success_future.result()
+
+            assert q_receive_mock.call_args_list[0][1]["max_messages"] == 10
+            assert sorted(call[0][1] for call in q_del_mock.call_args_list) == sorted([succeeded.id, failed.id])
+            # Messages of other ingestions are left to other consumers, once their visibility timeout passes
+            assert [message.id for message in queues["mocked_qf_name"].messages] == [malformed.id, untracked.id]
+
+        client.close()
+
+    def test_status_tracker_reaches_messages_behind_untracked_ones(self):
+        client = QueuedIngestClient("some-cluster")
+        batch_size = 4
+        tracked = mock_message(success=False)
+        queue = FakeStatusQueue([mock_message(success=False) for _ in range(batch_size + 1)] + [tracked])
+
+        with mock.patch.object(client._resource_manager, "get_successful_ingestions_queues", return_value=[]), mock.patch.object(
+            client._resource_manager, "get_failed_ingestions_queues", return_value=[get_resource_uri("mocked_storage_account", "mocked_qf_name")]
+        ), mock.patch.object(QueueClient, "receive_messages", autospec=True, side_effect=lambda self, **kwargs: queue.receive(**kwargs)), mock.patch.object(
+            QueueClient, "delete_message", autospec=True, side_effect=lambda self, message_id, pop_receipt: queue.delete(message_id)
+        ), mock.patch.object(
+            QueueClient, "update_message", autospec=True, side_effect=lambda self, message, visibility_timeout: queue.release(message, visibility_timeout)
+        ):
+            with KustoIngestStatusTracker(client, poll_interval=0.01, batch_size=batch_size) as tracker:
+                future = tracker.track(str(tracked.id))
+                assert future.wait(5)
+                assert future.result().IngestionSourceId == str(tracked.id)
+
+        client.close()
+
+
+class FakeStatusQueue:
+    """A queue whose received messages are hidden until their visibility timeout passes, or they are deleted."""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self._visible_at = {}
+        self._lock = threading.Lock()
+
+    def receive(self, messages_per_page, max_messages, visibility_timeout):
+        with self._lock:
+            now = time.monotonic()
+            received = [message for message in self.messages if self._visible_at.get(message.id, 0) <= now][:max_messages]
+            for message in received:
+                self._visible_at[message.id] = now + visibility_timeout
+            return received
+
+    def release(self, message, visibility_timeout):
+        with self._lock:
+            self._visible_at[message.id] = time.monotonic() + visibility_timeout
+
+    def delete(self, message_id):
+        with self._lock:
+            self.messages = [message for message in self.messages if message.id != message_id]
+
+
+async def _await(future):
+    return await future
@@ -1,3 +1,4 @@
+import random
 import time
 from pytest import approx
 
@@ -203,3 +204,94 @@ def test_big_break():
     storage_account_set.add_account_result(ACCOUNT_1, False)
 
     assert storage_account_set.accounts[ACCOUNT_1].get_rank() == 0
+
+
+def test_failed_accounts_recover_without_new_results():
+    current_time = 0
+
+    def time_provider():
+        return current_time
+
+    storage_account_set = create_storage_account_set(time_provider)
+    for account in storage_account_set.accounts:
+        for _ in range(3):
+            storage_account_set.add_account_result(account, False)
+
+    assert not storage_account_set.has_healthy_accounts()
+
+    # Nothing is logged while the accounts are not used, but their failures still age out
+    current_time += 1_000_000
+    assert storage_account_set.has_healthy_accounts()
+    assert storage_account_set.accounts[ACCOUNT_1].get_rank() == 1
+
+
+def test_latency_and_throughput():
+    current_time = 0
+
+    def time_provider():
+        return current_time
+
+    storage_account_set = create_storage_account_set(time_provider)
+    account = storage_account_set.get_storage_account(ACCOUNT_1)
+    assert account.get_latency() is None
+    assert account.get_throughput() is None
+
+    storage_account_set.add_account_result(ACCOUNT_1, True, 1.0)
+    storage_account_set.add_account_result(ACCOUNT_1, True, 3.0, 300)
+    storage_account_set.add_account_result(ACCOUNT_1, False, 100.0, 1)  # failures don't count
+    assert account.get_latency() == 2.0
+    assert account.get_throughput() == 100.0
+
+    # Newer buckets weigh more
+    current_time += 10
+    storage_account_set.add_account_result(ACCOUNT_1, True, 5.0, 100)
+    assert account.get_latency() == approx((5.0 + 0.5 * 2.0) / 1.5)
+    assert account.get_throughput() == approx((20.0 + 0.5 * 100.0) / 1.5)
+
+
+def test_faster_accounts_are_preferred():
+    current_time = 0
+
+    def time_provider():
+        return current_time
+
+    storage_account_set = create_storage_account_set(time_provider)
+    for _ in range(10):
+        storage_account_set.add_account_result(ACCOUNT_1, True, 10.0, 1000)
+        for account in [ACCOUNT_2, ACCOUNT_3, ACCOUNT_4, ACCOUNT_5]:
+            storage_account_set.add_account_result(account, True, 1.0, 1000)
+
+    # All accounts have the same success rank, so they are in the same tier, but the slow account should rarely be first
+    first_accounts = [storage_account_set.get_ranked_shuffled_accounts()[0].get_account_name() for _ in range(1000)]
+    assert first_accounts.count(ACCOUNT_1) < 100
+    assert set(first_accounts) == {ACCOUNT_1, ACCOUNT_2, ACCOUNT_3, ACCOUNT_4, ACCOUNT_5}
+
+
+def simulate_uploads(storage_account_set: _RankedStorageAccountSet, clock: list, bandwidths: dict, uploads: int, size: int) -> float:
+    """Uploads sequentially to the best ranked account, and returns the aggregate throughput in bytes per second."""
+    start_time = clock[0]
+    for _ in range(uploads):
+        account_name = storage_account_set.get_ranked_shuffled_accounts()[0].get_account_name()
+        duration = size / bandwidths[account_name]
+        clock[0] += duration
+        storage_account_set.add_account_result(account_name, True, duration, size)
+    return uploads * size / (clock[0] - start_time)
+
+
+def test_simulation_skewed_account_throughput():
+    # One storage account is 10 times slower than the others, but never fails
+    bandwidths = {ACCOUNT_1: 1024 * 1024, ACCOUNT_2: 10 * 1024 * 1024, ACCOUNT_3: 10 * 1024 * 1024}
+
+    def run(weighted: bool) -> float:
+        clock = [0.0]
+        storage_account_set = _RankedStorageAccountSet(time_provider=lambda: clock[0], random_generator=random.Random(1234))
+        for account_name in bandwidths:
+            storage_account_set.add_storage_account(account_name)
+        if not weighted:
+            storage_account_set._get_speed_weights = lambda accounts: None
+        return simulate_uploads(storage_account_set, clock, bandwidths, uploads=2000, size=4 * 1024 * 1024)
+
+    uniform_throughput = run(weighted=False)
+    weighted_throughput = run(weighted=True)
+
+    assert weighted_throughput > 1.5 * uniform_throughput
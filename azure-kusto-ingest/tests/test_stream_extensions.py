@@ -0,0 +1,126 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License
+import gzip
+import io
+
+from azure.kusto.data import metrics
+from azure.kusto.data.env_utils import get_env
+from azure.kusto.data.metrics import InMemoryMeter
+from azure.kusto.ingest._stream_extensions import GzipChunkStream, chain_streams, compress_chunks, read_until_size_or_end
+
+
+class PatternStream(io.RawIOBase):
+    """A non-seekable stream of `size` bytes of a repeating pattern, which doesn't allocate while it is read."""
+
+    def __init__(self, size: int, pattern: bytes = bytes(range(256)) * 4096):
+        self.remaining = size
+        self.pattern = memoryview(pattern)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        size = min(len(b), len(self.pattern), self.remaining)
+        b[:size] = self.pattern[:size]
+        self.remaining -= size
+        return size
+
+
+class NonSeekableStream(io.RawIOBase):
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self.data.readinto(b)
+
+
+class ReadOnlyStream:
+    """A minimal stream that only supports read()."""
+
+    def __init__(self, data: bytes):
+        self.data = io.BytesIO(data)
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+    def close(self):
+        pass
+
+
+class TestStreamExtensions:
+    def test_read_until_size_or_end(self):
+        data = bytes(range(256)) * 1000
+
+        for stream in (io.BytesIO(data), NonSeekableStream(data), ReadOnlyStream(data)):
+            buffered = read_until_size_or_end(stream, 100_001)
+            assert buffered.tell() == 0
+            assert buffered.getvalue() == data[:100_001]
+            assert stream.read(10) == data[100_001:100_011]
+
+        # The whole stream fits
+        buffered = read_until_size_or_end(io.BytesIO(data), len(data) + 1)
+        assert buffered.getvalue() == data
+        assert read_until_size_or_end(io.BytesIO(b""), 10).getvalue() == b""
+        assert read_until_size_or_end(io.BytesIO(data), 0).getvalue() == b""
+
+        # Seekable streams are read from their current position
+        stream = io.BytesIO(data)
+        stream.seek(1000)
+        assert read_until_size_or_end(stream, len(data)).getvalue() == data[1000:]
+
+    def test_chain_streams(self):
+        parts = [b"abc", b"", b"defgh", b"i" * 100_000]
+        streams = [io.BytesIO(parts[0]), ReadOnlyStream(parts[1]), io.BytesIO(parts[2]), PatternStream(0), io.BytesIO(parts[3])]
+
+        chained = chain_streams(streams)
+        assert chained.read(2) == b"ab"
+        buffer = bytearray(5)
+        assert chained.readinto(buffer) == 5 and buffer == b"cdefg"
+        assert chained.read() == b"h" + parts[3]
+        assert chained.read() == b""
+        assert all(stream.closed for stream in streams if isinstance(stream, io.IOBase))
+
+        assert chain_streams([]).read() == b""
+
+    def test_compress_chunks(self):
+        chunks = [b"", bytes(range(256)) * 100, b"a" * 100_000]
+
+        meter = InMemoryMeter()
+        metrics.enable_metrics(meter)
+        try:
+            raw = GzipChunkStream(chunks)
+            compressed = io.BufferedReader(raw).read()
+            # Reading past the end doesn't record the ratio again
+            assert raw.read() == b""
+        finally:
+            metrics.disable_metrics()
+
+        assert gzip.decompress(compressed) == b"".join(chunks)
+        assert (raw.uncompressed_size, raw.compressed_size) == (125_600, len(compressed))
+        assert [point.value for point in meter.get_points("kusto.ingest.compression_ratio")] == [125_600 / len(compressed)]
+        assert gzip.decompress(compress_chunks([]).read()) == b""
+
+    def test_managed_streaming_prefix_large_stream(self):
+        """
+        Reads a large stream through the buffered prefix plus chained remainder path of ManagedStreamingIngestClient.
+        Runs on 64MB by default - set STREAM_BENCHMARK_SIZE_MB=1024 to read 1GB.
+        Its throughput is measured by the managed_streaming_prefix[MB] benchmark of azure-kusto-data (`python -m tests.benchmarks --filter managed_streaming`).
+        """
+        size = int(get_env("STREAM_BENCHMARK_SIZE_MB", default="64")) * 1024 * 1024
+        prefix_size = 4 * 1024 * 1024 + 1
+        source = PatternStream(size)
+        buffer = memoryview(bytearray(1024 * 1024))
+
+        prefix = read_until_size_or_end(source, prefix_size)
+        chained = chain_streams([prefix, source])
+        total = 0
+        while True:
+            read = chained.readinto(buffer)
+            if not read:
+                break
+            total += read
+
+        assert total == size